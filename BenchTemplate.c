@@ -0,0 +1,66 @@
+/******************************************************
+* Autogenerated code created by the ConsoleBuilder    *
+*   https://github.com/embedCreativity/ConsoleBuilder *
+*                                                     *
+* Generated on: CODE_GENERATION_DATE            *
+******************************************************/
+
+// Dispatch benchmark: runs a script of the console's own commands BENCH_PASSES times through one
+//   session and reports the mean time each line took, in nanoseconds, on stderr (one line each:
+//   "<line> <ns>"). Method output goes to stdout, so send that to /dev/null.
+//   Build it in place of the console (plus the methods source if externalized), e.g.:
+//     gcc -O2 -o bench HARNESS_SOURCE
+#define _POSIX_C_SOURCE 199309L
+#include <time.h>
+#define CONSOLE_NO_MAIN
+#include "CONSOLE_SOURCE"
+
+#define BENCH_PASSES BENCH_PASS_COUNT
+
+static const char* const benchScript[] = {
+HARNESS_SCRIPT
+};
+#define BENCH_LINES (sizeof(benchScript) / sizeof(benchScript[0]))
+
+static uint64_t elapsed[BENCH_LINES];
+static consoleContext_t session;
+
+static uint64_t nanoseconds(void)
+{
+    struct timespec now;
+    clock_gettime(CLOCK_MONOTONIC, &now);
+    return (uint64_t)now.tv_sec * 1000000000u + (uint64_t)now.tv_nsec;
+}
+
+int main(void)
+{
+#if CONSOLE_IMAGE_LAYOUT
+    if (!consoleLoadImageFile(CONSOLE_IMAGE_FILE))
+    {
+        fprintf(stderr, "FAIL: could not load the command table image %s\n", CONSOLE_IMAGE_FILE);
+        return 1;
+    }
+#endif
+    for (uint32_t p = 0; p < BENCH_PASSES; p++)
+    {
+        consoleInit(&session);
+        for (uint32_t l = 0; l < BENCH_LINES; l++)
+        {
+            uint64_t started;
+
+            // the line is tokenized in place, so it is copied in (untimed) every pass
+            strncpy(session.input, benchScript[l], USER_INPUT_BUF_SIZE - 1);
+            session.input[USER_INPUT_BUF_SIZE - 1] = '\0';
+            started = nanoseconds();
+            consoleProcessLine(&session, session.input);
+            elapsed[l] += nanoseconds() - started;
+        }
+    }
+    fflush(stdout);
+
+    for (uint32_t l = 0; l < BENCH_LINES; l++)
+    {
+        fprintf(stderr, "%u %.1f\n", (unsigned)l, (double)elapsed[l] / BENCH_PASSES);
+    }
+    return 0;
+}
@@ -10,81 +10,418 @@
 #include <string.h>
 #include <ctype.h>
 #include <stdbool.h>
+#include <stdlib.h>
+#include <float.h>
 EXTERNAL_HEADER
-// prototype method function pointer
-typedef bool (*Method_t)(const char*);
+// console configuration
+CONSOLE_CONFIGURATION
 
-// Structure of a CommandTree Node
-typedef struct commandTreeNode_t
+CONSOLE_TYPES
+#define USER_INPUT_BUF_SIZE 128
+
+#if CONSOLE_SCRIPT
+// Scripts (see consoleRunScript()): what separates commands on a line, the longest line read from a
+//   file at once, the flags the example main() runs its script with and the status line answering
+//   each command
+#ifndef CONSOLE_SCRIPT_SEPARATOR
+#define CONSOLE_SCRIPT_SEPARATOR ';'
+#endif
+#ifndef CONSOLE_SCRIPT_LINE_SIZE
+#define CONSOLE_SCRIPT_LINE_SIZE 1024
+#endif
+#define CONSOLE_SCRIPT_QUIET 0x1u   // no help output, only the status lines
+#define CONSOLE_SCRIPT_STOP 0x2u    // stop at the first command that fails
+#ifndef CONSOLE_SCRIPT_FLAGS
+#define CONSOLE_SCRIPT_FLAGS CONSOLE_SCRIPT_QUIET
+#endif
+#ifndef CONSOLE_SCRIPT_REPORT
+#define CONSOLE_SCRIPT_REPORT(index, status) printf("#%u %s\n", (unsigned)(index), (status))
+#endif
+#endif
+
+#if CONSOLE_BYTE_INPUT
+// Bytes each session can buffer between consoleFeedByte() and consoleService() (a power of two)
+#ifndef CONSOLE_RX_BUF_SIZE
+#define CONSOLE_RX_BUF_SIZE 64
+#endif
+
+// Where the line being received stands
+typedef enum
+{
+    LINE_WORDS = 0,         // still matching command words
+    LINE_ARGS,              // a method matched; the rest of the line is its arguments
+    LINE_UNKNOWN            // a word matched no command; the rest of the line is dropped
+} consoleLineState_t;
+#endif
+
+// State of one console session (UART, TCP shell, ...) - run as many side by side as you need
+typedef struct consoleContext_t
+{
+    // node every command starts from (moved by Gateways)
+    const commandTreeNode_t* root;
+    // fill with one line of user input, then hand it to consoleProcessLine()
+    char input[USER_INPUT_BUF_SIZE];
+#if CONSOLE_BYTE_INPUT
+    // receive ring buffer: consoleFeedByte() only moves rxHead, consoleService() only moves rxTail
+    char rx[CONSOLE_RX_BUF_SIZE];
+    volatile uint32_t rxHead;
+    volatile uint32_t rxTail;
+    // the line being received into input[], matched a word at a time
+    const commandTreeNode_t* node;  // deepest node matched so far (NULL until the line starts)
+    uint32_t length;                // characters of the line kept in input[]
+    uint32_t wordStart;             // where the current word (or the arguments) start in input[]
+    uint32_t words;                 // words matched so far
+    consoleLineState_t lineState;
+    bool quit;                      // the line so far is a lone QUIT
+#endif
+#if CONSOLE_SCRIPT
+    bool quiet;                     // a script is running without help output
+    bool scriptStopped;             // a script stopped at a failure; no more commands run
+    uint32_t scriptCommands;        // commands run by scripts so far (numbering the status lines)
+#endif
+} consoleContext_t;
+
+// Outcome of processing one line of user input
+typedef enum
+{
+    CONSOLE_OK = 0,         // a method was called and succeeded
+    CONSOLE_METHOD_FAILED,  // a method failed (or was missing its arguments)
+    CONSOLE_INCOMPLETE,     // the line ended before it reached a method
+    CONSOLE_UNKNOWN,        // a word matched no command
+    CONSOLE_EMPTY,          // nothing but whitespace
+    CONSOLE_PENDING         // consoleService() ran out of input before the end of a line
+} consoleStatus_t;
+
+// The session whose line is being processed, so methods (e.g., a Gateway setting rootNode) act on it.
+//   Sessions may run interleaved as is; to run them on separate threads, define CONSOLE_THREAD_LOCAL
+//   as _Thread_local (or your RTOS equivalent)
+#ifndef CONSOLE_THREAD_LOCAL
+#define CONSOLE_THREAD_LOCAL
+#endif
+static CONSOLE_THREAD_LOCAL consoleContext_t* activeContext;
+
+// root node for tree traversal (of the active session)
+#define rootNode (activeContext->root)
+
+/************************************************************************************/
+/* Move the active session into endpoint index of a Gateway, as returned by the     */
+/*   Gateway method - a table lookup                                                */
+/************************************************************************************/
+bool consoleEnterEndpoint(const endpointTable_t* table, int32_t index)
 {
-    const char* name;
-    const char* desc;
-    const Method_t method;
-    const char* argDesc;
-    const uint32_t childCount;
-    const struct commandTreeNode_t** children;
-} commandTreeNode_t;
+    if ((index < 0) || ((uint32_t)index >= table->count))
+    {
+        return false;
+    }
+    rootNode = CONSOLE_ROOT(table->roots[index]);
+    return true;
+}
 
-// root node for tree traversal
-static const commandTreeNode_t* rootNode;
+/************************************************************************************/
+/* Find a Gateway's endpoint by name (in any case) - a binary search of the names   */
+/************************************************************************************/
+int32_t consoleFindEndpoint(const endpointTable_t* table, const char* name)
+{
+    uint32_t low = 0;
+    uint32_t high = table->count;
+
+    while (low < high)
+    {
+        uint32_t mid = low + (high - low) / 2;
+        const char* candidate = table->names[mid];
+        int compare;
+        uint32_t i = 0;
+
+        while (('\0' != name[i]) && (toupper((unsigned char)name[i]) == (unsigned char)candidate[i]))
+        {
+            i++;
+        }
+        compare = toupper((unsigned char)name[i]) - (unsigned char)candidate[i];
+        if (0 == compare)
+        {
+            return (int32_t)mid;
+        }
+        if (compare < 0)
+        {
+            high = mid;
+        }
+        else
+        {
+            low = mid + 1;
+        }
+    }
+    return CONSOLE_ENDPOINT_DENIED;
+}
+
+#if CONSOLE_PROFILE
+// Counters of each node, indexed by NODE_PROFILE_INDEX(): how often the node was matched and, for a
+//   method, how often it was called and how long it took (in CONSOLE_PROFILE_TIMESTAMP() ticks).
+//   Shared by every session
+typedef struct
+{
+    uint32_t hits;
+    uint32_t calls;
+    uint32_t maxTicks;
+    uint64_t ticks;
+} consoleProfile_t;
+
+static consoleProfile_t consoleProfile[CONSOLE_PROFILE_NODES];
+#endif
+
+#if CONSOLE_PROFILE_GENERATED
+/************************************************************************************/
+/* The built-in STATS command: print the counters of every node used so far, for   */
+/*   genConsole.py --decode-stats to map back to command paths                      */
+/************************************************************************************/
+bool parseConsoleStats(char* args)
+{
+    if (NULL != args)
+    {
+        return false;
+    }
+#if CONSOLE_PROFILE
+    printf("STATS index hits calls ticks maxTicks\n");
+    for (uint32_t i = 0; i < CONSOLE_PROFILE_NODES; i++)
+    {
+        if ((0 != consoleProfile[i].hits) || (0 != consoleProfile[i].calls))
+        {
+            printf("STATS %u %u %u %llu %u\n", (unsigned)i, (unsigned)consoleProfile[i].hits,
+                (unsigned)consoleProfile[i].calls, (unsigned long long)consoleProfile[i].ticks,
+                (unsigned)consoleProfile[i].maxTicks);
+        }
+    }
+#else
+    printf("STATS profiling is compiled out (CONSOLE_PROFILE is 0)\n");
+#endif
+    return true;
+}
+#endif
+ENDPOINT_DECLARATIONS
 
 // method forward declarations
 METHOD_FUNC_FORWARD_DECLARATIONS
+EXAMPLE_PARSING_ROUTINES
+// method argument parsers
+METHOD_ARGUMENT_PARSERS
 
 // common string declarations
 STRING_DECLARATIONS
 
 // node declarations
 NODE_DECLARATIONS
+ENDPOINT_TABLES
 
-#define USER_INPUT_BUF_SIZE 128
-
-char userInput[USER_INPUT_BUF_SIZE];
-EXAMPLE_PARSING_ROUTINES
+#if CONSOLE_IMAGE_LAYOUT
 /************************************************************************************/
-/* Process user input prior to processing                                           */
+/* Command table image loader                                                       */
 /************************************************************************************/
-uint32_t sanitizeString(char* input, uint32_t size)
+static uint32_t imageChecksum(const uint8_t* data, uint32_t length)
 {
-    uint32_t i;
+    // CRC-32 (as zlib's crc32()), a bit at a time so no table is needed
+    uint32_t crc = 0xFFFFFFFFu;
 
-    // protect against an idiotic (0-1) error in the for loop below
-    if (0 == size)
+    for (uint32_t i = 0; i < length; i++)
     {
-        return 0;
+        crc ^= data[i];
+        for (uint32_t bit = 0; bit < 8; bit++)
+        {
+            crc = (crc >> 1) ^ (0xEDB88320u & (0u - (crc & 1u)));
+        }
     }
+    return ~crc;
+}
+
+// Checks the command table image at image (size bytes) and makes it the command tree. The image
+//   is used in place, so it must stay put; load it before consoleInit(). Returns false, leaving the
+//   command tree as it was, if the image is malformed or was not made for this console
+bool consoleLoadImage(const uint8_t* image, uint32_t size)
+{
+    uint32_t imageSize;
+    uint32_t nodeCount;
+    uint32_t strings;
+    uint32_t stringsSize;
 
-    for (i = 0; i < (size - 1); i++)
+    if ((size < IMAGE_HEADER_SIZE) || (0 != memcmp(image, IMAGE_MAGIC, 4)) ||
+        (IMAGE_VERSION != IMAGE_U16(image + IMAGE_AT_VERSION)) ||
+        (IMAGE_HEADER_SIZE != IMAGE_U16(image + IMAGE_AT_HEADER_SIZE)))
     {
-        input[i] = toupper(input[i]);
-        // quit and NULL terminate when terminating characters have been identified
-        if (('\n' == input[i]) || ('\r' == input[i]) || ('\0' == input[i]))
+        return false;
+    }
+    imageSize = IMAGE_U32(image + IMAGE_AT_SIZE);
+    if ((imageSize > size) || (imageSize <= IMAGE_HEADER_SIZE) ||
+        (imageChecksum(image + IMAGE_AT_BINDING, imageSize - IMAGE_AT_BINDING) != IMAGE_U32(image + IMAGE_AT_CHECKSUM)))
+    {
+        return false;
+    }
+    // the image must bind to this console's methods and roots, and suit its child lookup
+    if ((CONSOLE_IMAGE_BINDING != IMAGE_U32(image + IMAGE_AT_BINDING)) ||
+        (CONSOLE_IMAGE_ROOTS != IMAGE_U16(image + IMAGE_AT_ROOT_COUNT)) ||
+        (CONSOLE_IMAGE_METHODS != IMAGE_U16(image + IMAGE_AT_METHOD_COUNT)) ||
+        (CONSOLE_IMAGE_SORTED && (0 == (IMAGE_FLAG_SORTED & IMAGE_U16(image + IMAGE_AT_FLAGS)))))
+    {
+        return false;
+    }
+    nodeCount = IMAGE_U16(image + IMAGE_AT_NODE_COUNT);
+    strings = IMAGE_U32(image + IMAGE_AT_STRINGS);
+    if ((nodeCount < CONSOLE_IMAGE_ROOTS) || (IMAGE_HEADER_SIZE + nodeCount * IMAGE_NODE_SIZE != strings) ||
+        (strings >= imageSize) || ('\0' != image[imageSize - 1]))
+    {
+        return false;
+    }
+    // every reference must stay inside the image
+    stringsSize = imageSize - strings;
+    for (uint32_t i = 0; i < nodeCount; i++)
+    {
+        const uint8_t* node = image + IMAGE_HEADER_SIZE + i * IMAGE_NODE_SIZE;
+        uint16_t argDesc = IMAGE_U16(node + 4);
+        uint16_t method = IMAGE_U16(node + 6);
+
+        if ((IMAGE_U16(node) >= stringsSize) || (IMAGE_U16(node + 2) >= stringsSize) ||
+            ((IMAGE_NONE != argDesc) && (argDesc >= stringsSize)))
         {
-            break;
+            return false;
+        }
+        if ((IMAGE_NONE != method) ? ((method >= CONSOLE_IMAGE_METHODS) || (0 != IMAGE_U16(node + 10))) :
+            ((uint32_t)IMAGE_U16(node + 8) + IMAGE_U16(node + 10) > nodeCount))
+        {
+            return false;
         }
     }
-    // Always NULL terminate where we quit transforming to uppercase
-    input[i] = 0;
 
-    return i;
+    consoleImageNodes = image + IMAGE_HEADER_SIZE;
+    consoleImageStrings = (const char*)(image + strings);
+    return true;
 }
 
+// Reads a command table image file and loads it (the memory is kept for as long as the program runs)
+bool consoleLoadImageFile(const char* path)
+{
+    FILE* fin = fopen(path, "rb");
+    uint8_t* image = NULL;
+    long size = -1;
+
+    if (NULL == fin)
+    {
+        return false;
+    }
+    if (0 == fseek(fin, 0, SEEK_END))
+    {
+        size = ftell(fin);
+    }
+    if ((size > 0) && (0 == fseek(fin, 0, SEEK_SET)))
+    {
+        image = (uint8_t*)malloc((size_t)size);
+    }
+    if ((NULL == image) || ((size_t)size != fread(image, 1, (size_t)size, fin)) ||
+        !consoleLoadImage(image, (uint32_t)size))
+    {
+        free(image);
+        fclose(fin);
+        return false;
+    }
+    fclose(fin);
+    return true;
+}
+#endif
+
+/************************************************************************************/
+/* Command word helpers - words are matched in place, case-insensitively            */
+/************************************************************************************/
+static bool isWordEnd(char c)
+{
+    return (' ' == c) || ('\0' == c) || ('\n' == c) || ('\r' == c);
+}
+
+static bool isLineEnd(char c)
+{
+    return ('\0' == c) || ('\n' == c) || ('\r' == c);
+}
+
+// Skips separators; returns the next word (not terminated) and its length, which is 0 at the end of the line
+static char* nextWord(char* cursor, uint32_t* length)
+{
+    char* end;
+
+    while (' ' == *cursor)
+    {
+        cursor++;
+    }
+    for (end = cursor; !isWordEnd(*end); end++);
+    *length = (uint32_t)(end - cursor);
+
+    return cursor;
+}
+
+// Command strings are stored in upper case
+static bool wordMatches(const char* word, uint32_t length, const char* name)
+{
+    for (uint32_t i = 0; i < length; i++)
+    {
+        if (toupper((unsigned char)word[i]) != (unsigned char)name[i])
+        {
+            return false;
+        }
+    }
+    return ('\0' == name[length]);
+}
+
+CHILD_LOOKUP_ROUTINE
 /************************************************************************************/
 /* Context-based help menu                                                          */
 /************************************************************************************/
-void printHelp(const commandTreeNode_t* node)
+#if CONSOLE_COMPRESSED_HELP
+void printHelp(const consoleContext_t* ctx, const commandTreeNode_t* node)
+{
+    const uint8_t* code = &helpPool[helpTable[node->help].offset];
+    const uint8_t* end = code + helpTable[node->help].length;
+    // codes still to expand: the second half of every pair being expanded waits here
+    uint8_t pending[HELP_PAIR_STACK];
+    uint32_t depth = 0;
+    char chunk[CONSOLE_HELP_CHUNK + 1];
+    uint32_t length = 0;
+
+    // a session's root is always a root node, whose block has no title line
+    (void)ctx;
+    while ((0 < depth) || (code < end))
+    {
+        uint8_t c = (0 < depth) ? pending[--depth] : *code++;
+
+        if (HELP_PAIR_BASE <= c)
+        {
+            pending[depth++] = helpPairs[c - HELP_PAIR_BASE][1];
+            pending[depth++] = helpPairs[c - HELP_PAIR_BASE][0];
+            continue;
+        }
+        chunk[length++] = (char)c;
+        if ((CONSOLE_HELP_CHUNK == length) || ((0 == depth) && (code == end)))
+        {
+            chunk[length] = '\0';
+            CONSOLE_HELP_WRITE(chunk, length);
+            length = 0;
+        }
+    }
+}
+#elif CONSOLE_PRECOMPUTED_HELP
+void printHelp(const consoleContext_t* ctx, const commandTreeNode_t* node)
+{
+    // a session's root is always a root node, whose block has no title line
+    (void)ctx;
+    CONSOLE_HELP_WRITE(&helpPool[helpTable[node->help].offset], helpTable[node->help].length);
+}
+#else
+void printHelp(const consoleContext_t* ctx, const commandTreeNode_t* node)
 {
     printf("HELP:\n");
-    if (rootNode != node)
+    if (ctx->root != node)
     {
-        printf("%s - %s\n", node->name, node->desc);
+        printf("%s - %s\n", NODE_NAME(node), NODE_DESC(node));
     }
 
-    if (NULL != node->method)
+    if (NULL != NODE_METHOD(node))
     {
-        if (NULL != node->argDesc)
+        if (NULL != NODE_ARG_DESC(node))
         {
-            printf("ARGS:\n  %s\n", node->argDesc);
+            printf("ARGS:\n  %s\n", NODE_ARG_DESC(node));
         }
         else
         {
@@ -93,119 +430,487 @@ void printHelp(const commandTreeNode_t* node)
     }
     else
     {
-        for (uint32_t i = 0; i < node->childCount; i++)
+        for (uint32_t i = 0; i < NODE_CHILD_COUNT(node); i++)
         {
-            printf("  -> %s - %s\n", node->children[i]->name, node->children[i]->desc);
+            printf("  -> %s - %s\n", NODE_NAME(NODE_CHILD(node, i)), NODE_DESC(NODE_CHILD(node, i)));
         }
     }
 }
+#endif
+
+#if CONSOLE_SCRIPT
+// Scripts run quietly: their status lines stand in for the help
+#define SHOW_HELP(ctx, node) do { if (!(ctx)->quiet) { printHelp((ctx), (node)); } } while (0)
+#else
+#define SHOW_HELP(ctx, node) printHelp((ctx), (node))
+#endif
 
 /************************************************************************************/
-/* Example main()                                                                   */
+/* Start a console session                                                          */
 /************************************************************************************/
-int main(void)
+#if CONSOLE_BYTE_INPUT
+static void startLine(consoleContext_t* ctx)
 {
-    char* tok;
-    const char delim[] = " ";
-    // init local node (where we are now)
-    const commandTreeNode_t* node = &node1;
-    // init global node (where we return to)
-    rootNode = &node1;
+    ctx->node = NULL;
+    ctx->length = 0;
+    ctx->wordStart = 0;
+    ctx->words = 0;
+    ctx->lineState = LINE_WORDS;
+    ctx->quit = false;
+}
+#endif
 
-    while (1)
+void consoleInit(consoleContext_t* ctx)
+{
+    ctx->root = &node1;
+    ctx->input[0] = '\0';
+#if CONSOLE_SCRIPT
+    ctx->quiet = false;
+    ctx->scriptStopped = false;
+    ctx->scriptCommands = 0;
+#endif
+#if CONSOLE_BYTE_INPUT
+    ctx->rxHead = 0;
+    ctx->rxTail = 0;
+    startLine(ctx);
+#endif
+}
+
+#if CONSOLE_PROFILE
+// Nodes past the counters (e.g., of a larger command table image loaded later) go uncounted
+static void profileHit(const commandTreeNode_t* node)
+{
+    uint32_t i = NODE_PROFILE_INDEX(node);
+
+    if (i < CONSOLE_PROFILE_NODES)
     {
-        // It's a courtesy to provide a command prompt
-        printf("->");
-        // No matter how you get the user data into a buffer, you should call sanitizeString() on it
-        memset(userInput, 0, sizeof(char) * USER_INPUT_BUF_SIZE);
-        if (NULL != fgets(userInput, USER_INPUT_BUF_SIZE, stdin))
+        consoleProfile[i].hits++;
+    }
+}
+#define PROFILE_HIT(n) profileHit(n)
+#else
+#define PROFILE_HIT(n)
+#endif
+
+/************************************************************************************/
+/* Run a node's method (timed, when profiling)                                      */
+/************************************************************************************/
+static bool invokeMethod(const commandTreeNode_t* node, char* args)
+{
+#if CONSOLE_PROFILE
+    uint32_t started = CONSOLE_PROFILE_TIMESTAMP();
+    bool ret = NODE_METHOD(node)(args);
+    uint32_t elapsed = CONSOLE_PROFILE_TIMESTAMP() - started;
+    uint32_t i = NODE_PROFILE_INDEX(node);
+
+    if (i < CONSOLE_PROFILE_NODES)
+    {
+        consoleProfile[i].calls++;
+        consoleProfile[i].ticks += elapsed;
+        if (elapsed > consoleProfile[i].maxTicks)
         {
-            sanitizeString(userInput, USER_INPUT_BUF_SIZE);
+            consoleProfile[i].maxTicks = elapsed;
         }
-        else {
-            printf("ERROR - error in capturing user input\n");
-            break;
+    }
+    return ret;
+#else
+    return NODE_METHOD(node)(args);
+#endif
+}
+
+/************************************************************************************/
+/* Call a method with whatever follows its command word (as typed, minus the line   */
+/*   ending, which is overwritten)                                                  */
+/************************************************************************************/
+static consoleStatus_t callMethod(const consoleContext_t* ctx, const commandTreeNode_t* node, char* args)
+{
+    bool ret;
+
+    while (' ' == *args)
+    {
+        args++;
+    }
+    if (!isLineEnd(*args))
+    {
+        char* end = args;
+        while (!isLineEnd(*end))
+        {
+            end++;
         }
-        if (0 == strncmp(userInput, "QUIT", USER_INPUT_BUF_SIZE))
+        *end = '\0';
+        ret = invokeMethod(node, args);
+    }
+    else
+    {
+        // verify the method wasn't expecting an argument by looking for an argument description
+        if (NULL != NODE_ARG_DESC(node))
         {
-            // Back out of Gateway "chroot"
-            rootNode = &node1;
-            node = &node1;
-            continue;
+            ret = false;
+        }
+        else
+        {
+            ret = invokeMethod(node, NULL);
+        }
+    }
+
+    if (!ret)
+    {
+        SHOW_HELP(ctx, node);
+        return CONSOLE_METHOD_FAILED;
+    }
+    return CONSOLE_OK;
+}
+
+/************************************************************************************/
+/* Process one line of user input (e.g., ctx->input) for a console session          */
+/*   The line is walked once, in place; only its line ending is overwritten         */
+/************************************************************************************/
+consoleStatus_t consoleProcessLine(consoleContext_t* ctx, char* line)
+{
+    // start at the session's root (where we are now)
+    const commandTreeNode_t* node = ctx->root;
+    char* word;
+    uint32_t length;
+
+    activeContext = ctx;
+
+    word = nextWord(line, &length);
+    if (0 == length)
+    {
+        return CONSOLE_EMPTY;
+    }
+    if (wordMatches(word, length, "QUIT") && isLineEnd(*nextWord(word + length, &length)))
+    {
+        // Back out of Gateway "chroot"
+        ctx->root = &node1;
+        return CONSOLE_OK;
+    }
+
+    while (0 != length)
+    {
+        // Check current node for branches matching command word
+        const commandTreeNode_t* child = findChild(node, word, length);
+
+        // Garbage command found
+        if (NULL == child)
+        {
+            SHOW_HELP(ctx, node);
+            return CONSOLE_UNKNOWN;
         }
+        // update node to point at this new match
+        node = child;
+        PROFILE_HIT(node);
 
-        // Break up the command sentence into command words
-        tok = strtok(userInput, delim);
-        while (tok != NULL)
+        // Check to see if this new node is a method
+        if (NULL != NODE_METHOD(node))
         {
-            bool found = false;
+            // Whatever follows the command word are the arguments
+            return callMethod(ctx, node, word + length);
+        }
+        word = nextWord(word + length, &length);
+    }
 
-            // Check current node for branches matching command word
-            for (uint32_t i = 0; i < node->childCount; i++)
-            {
-                if (0 == strcmp(tok, node->children[i]->name))
-                {
-                    // update node to point at this new match
-                    node = node->children[i];
-                    found = true;
-                    break;
-                }
-            }
-
-            // Garbage command found
-            if (!found)
-            {
-                printHelp(node);
-                node = rootNode; // reset node pointer to root
-                break;
-            }
+    // We ran out of input string before a valid command was found
+    SHOW_HELP(ctx, node);
+    return CONSOLE_INCOMPLETE;
+}
 
-            // Check to see if this new node is a method
-            if (NULL != node->method)
-            {
-                char* args = tok;
-                uint32_t cmdOffset = strlen(tok);
-
-                // If there's valid data after our command tokenizer, then those are arguments
-                bool ret;
-                if ('\0' != *(tok + cmdOffset + 1))
-                {
-                    args += cmdOffset + 1;
-                    ret = node->method(args);
-                }
-                else
-                {
-                    // verify the method wasn't expecting an argument by looking for an argument description
-                    if (NULL != node->argDesc)
-                    {
-                        ret = false;
-                    }
-                    else
-                    {
-                        ret = node->method(NULL);
-                    }
-                }
-
-                if (!ret)
-                {
-                    printHelp(node);
-                }
-                node = rootNode; // reset node pointer to root
-                break; // abandon remaining string if present
-            }
-            tok = strtok(NULL, delim);
-
-            // Check if we ran out of input string before a valid command was found
-            if (NULL == tok)
+#if CONSOLE_BYTE_INPUT
+/************************************************************************************/
+/* Non-blocking input: consoleFeedByte() queues bytes as they arrive (safe to call  */
+/*   from a receive ISR or DMA callback), consoleService() consumes them from the   */
+/*   superloop, matching each command word as soon as it ends                       */
+/************************************************************************************/
+bool consoleFeedByte(consoleContext_t* ctx, char c)
+{
+    // full - the byte is dropped
+    if (CONSOLE_RX_BUF_SIZE == (uint32_t)(ctx->rxHead - ctx->rxTail))
+    {
+        return false;
+    }
+    ctx->rx[ctx->rxHead & (CONSOLE_RX_BUF_SIZE - 1)] = c;
+    ctx->rxHead++;
+    return true;
+}
+
+// Match the word that just ended against the children of the deepest node matched so far
+static void matchWord(consoleContext_t* ctx)
+{
+    const char* word = &ctx->input[ctx->wordStart];
+    uint32_t length = ctx->length - ctx->wordStart;
+    const commandTreeNode_t* child = findChild(ctx->node, word, length);
+
+    ctx->quit = (0 == ctx->words) && wordMatches(word, length, "QUIT");
+    ctx->words++;
+    if (NULL == child)
+    {
+        ctx->lineState = LINE_UNKNOWN;
+        return;
+    }
+    ctx->node = child;
+    PROFILE_HIT(child);
+    if (NULL != NODE_METHOD(child))
+    {
+        // the arguments start right after the method's word
+        ctx->lineState = LINE_ARGS;
+        ctx->wordStart = ctx->length;
+    }
+}
+
+static void consumeByte(consoleContext_t* ctx, char c)
+{
+    if (NULL == ctx->node)
+    {
+        ctx->node = ctx->root;
+    }
+    if ((' ' != c) && (0 != ctx->words))
+    {
+        // anything after the first word means this isn't a QUIT
+        ctx->quit = false;
+    }
+    if (LINE_UNKNOWN == ctx->lineState)
+    {
+        return;
+    }
+    if ((LINE_WORDS == ctx->lineState) && (' ' == c))
+    {
+        // a word just ended (or separators are being repeated)
+        if (ctx->length > ctx->wordStart)
+        {
+            matchWord(ctx);
+        }
+        if (LINE_WORDS == ctx->lineState)
+        {
+            ctx->wordStart = ctx->length + 1;
+        }
+    }
+    // characters past the end of the input buffer are dropped
+    if (ctx->length < USER_INPUT_BUF_SIZE - 1)
+    {
+        ctx->input[ctx->length++] = c;
+    }
+}
+
+static consoleStatus_t finishLine(consoleContext_t* ctx)
+{
+    consoleStatus_t status;
+
+    if (NULL == ctx->node)
+    {
+        ctx->node = ctx->root;
+    }
+    if ((LINE_WORDS == ctx->lineState) && (ctx->length > ctx->wordStart))
+    {
+        matchWord(ctx);
+    }
+    ctx->input[ctx->length] = '\0';
+    activeContext = ctx;
+
+    if (ctx->quit)
+    {
+        // Back out of Gateway "chroot"
+        ctx->root = &node1;
+        status = CONSOLE_OK;
+    }
+    else if (0 == ctx->words)
+    {
+        status = CONSOLE_EMPTY;
+    }
+    else if (LINE_ARGS == ctx->lineState)
+    {
+        status = callMethod(ctx, ctx->node, &ctx->input[ctx->wordStart]);
+    }
+    else
+    {
+        // Garbage command found, or we ran out of input before a valid command was found
+        SHOW_HELP(ctx, ctx->node);
+        status = (LINE_UNKNOWN == ctx->lineState) ? CONSOLE_UNKNOWN : CONSOLE_INCOMPLETE;
+    }
+
+    startLine(ctx);
+    return status;
+}
+
+// Returns the outcome of the first line completed, or CONSOLE_PENDING once the queued bytes run out
+consoleStatus_t consoleService(consoleContext_t* ctx)
+{
+    while (ctx->rxTail != ctx->rxHead)
+    {
+        char c = ctx->rx[ctx->rxTail & (CONSOLE_RX_BUF_SIZE - 1)];
+        ctx->rxTail++;
+        if (isLineEnd(c))
+        {
+            return finishLine(ctx);
+        }
+        consumeByte(ctx, c);
+    }
+    return CONSOLE_PENDING;
+}
+#endif // CONSOLE_BYTE_INPUT
+
+#if CONSOLE_SCRIPT
+/************************************************************************************/
+/* Scripts: many commands per line, run back to back without a prompt, each one    */
+/*   answered by a status line (e.g., "#3 UNKNOWN") - for test rigs                */
+/************************************************************************************/
+static const char* const consoleStatusNames[] = {"OK", "METHOD_FAILED", "INCOMPLETE", "UNKNOWN", "EMPTY", "PENDING"};
+
+// Reports a script command's status; returns 1 if it failed (stopping the script, with CONSOLE_SCRIPT_STOP)
+static uint32_t scriptStatus(consoleContext_t* ctx, consoleStatus_t status, uint32_t flags)
+{
+    ctx->scriptCommands++;
+    CONSOLE_SCRIPT_REPORT(ctx->scriptCommands, consoleStatusNames[status]);
+    if (CONSOLE_OK == status)
+    {
+        return 0;
+    }
+    if (0 != (flags & CONSOLE_SCRIPT_STOP))
+    {
+        ctx->scriptStopped = true;
+    }
+    return 1;
+}
+
+// Runs every command of script, separated by CONSOLE_SCRIPT_SEPARATOR or line endings, in the session
+//   (so a Gateway entered stays entered for the commands after it). The script is split in place.
+//   Returns how many commands failed. With CONSOLE_SCRIPT_STOP, the first failure ends the script, and
+//   every script after it, until consoleInit()
+uint32_t consoleRunScript(consoleContext_t* ctx, char* script, uint32_t flags)
+{
+    uint32_t failures = 0;
+    bool quiet = ctx->quiet;
+
+    ctx->quiet = (0 != (flags & CONSOLE_SCRIPT_QUIET));
+    while (!ctx->scriptStopped && ('\0' != *script))
+    {
+        char* command = script;
+        consoleStatus_t status;
+
+        while (!isLineEnd(*script) && (CONSOLE_SCRIPT_SEPARATOR != *script))
+        {
+            script++;
+        }
+        if ('\0' != *script)
+        {
+            *script++ = '\0';
+        }
+        status = consoleProcessLine(ctx, command);
+        // blank commands (e.g., after a trailing separator) don't count
+        if (CONSOLE_EMPTY != status)
+        {
+            failures += scriptStatus(ctx, status, flags);
+        }
+    }
+    ctx->quiet = quiet;
+    return failures;
+}
+
+// Runs the script read from fin (see consoleRunScript()) a line at a time. A line longer than
+//   CONSOLE_SCRIPT_LINE_SIZE is run a command at a time; a single command that long fails as unknown.
+//   Returns how many commands failed
+uint32_t consoleRunScriptFile(consoleContext_t* ctx, FILE* fin, uint32_t flags)
+{
+    char line[CONSOLE_SCRIPT_LINE_SIZE];
+    uint32_t failures = 0;
+    // the unfinished command carried over from a line too long to read at once
+    size_t kept = 0;
+
+    while (!ctx->scriptStopped && (NULL != fgets(&line[kept], (int)(CONSOLE_SCRIPT_LINE_SIZE - kept), fin)))
+    {
+        size_t length = kept + strlen(&line[kept]);
+        char* split;
+
+        kept = 0;
+        if ((length < CONSOLE_SCRIPT_LINE_SIZE - 1) || ('\n' == line[length - 1]))
+        {
+            failures += consoleRunScript(ctx, line, flags);
+            continue;
+        }
+        split = strrchr(line, CONSOLE_SCRIPT_SEPARATOR);
+        if (NULL == split)
+        {
+            int c;
+
+            // skip the rest of the command
+            do
             {
-                printHelp(node);
-                node = rootNode; // reset node pointer to root
-            }
-        } // end input string processing loop
+                c = fgetc(fin);
+            } while ((EOF != c) && ('\n' != c) && (CONSOLE_SCRIPT_SEPARATOR != c));
+            failures += scriptStatus(ctx, CONSOLE_UNKNOWN, flags);
+            continue;
+        }
+        // run the commands ahead of the last separator and read on after the one behind it
+        *split++ = '\0';
+        failures += consoleRunScript(ctx, line, flags);
+        kept = strlen(split);
+        memmove(line, split, kept + 1);
+    }
+    return failures;
+}
+#endif // CONSOLE_SCRIPT
+
+#ifndef CONSOLE_NO_MAIN
+/************************************************************************************/
+/* Example main()                                                                   */
+/************************************************************************************/
+#if CONSOLE_SCRIPT
+int main(int argc, char** argv)
+#else
+int main(void)
+#endif
+{
+    consoleContext_t console;
+
+#if CONSOLE_IMAGE_LAYOUT
+    if (!consoleLoadImageFile(CONSOLE_IMAGE_FILE))
+    {
+        printf("ERROR - could not load the command table image %s\n", CONSOLE_IMAGE_FILE);
+        return 1;
     }
+#endif
+    consoleInit(&console);
+
+#if CONSOLE_SCRIPT
+    // Run the script file named on the command line (or stdin) with no prompt; the exit status
+    //   tells whether every command succeeded
+    FILE* fin = (argc > 1) ? fopen(argv[1], "r") : stdin;
+
+    if (NULL == fin)
+    {
+        printf("ERROR - could not open the script %s\n", argv[1]);
+        return 1;
+    }
+    return (0 == consoleRunScriptFile(&console, fin, CONSOLE_SCRIPT_FLAGS)) ? 0 : 1;
+#elif CONSOLE_BYTE_INPUT
+    int c;
+
+    printf("->");
+    // A superloop: on a target, consoleFeedByte() would be called from the UART receive ISR instead
+    while (EOF != (c = getchar()))
+    {
+        consoleFeedByte(&console, (char)c);
+        if (CONSOLE_PENDING != consoleService(&console))
+        {
+            // It's a courtesy to provide a command prompt
+            printf("->");
+        }
+    }
+#else
+    while (1)
+    {
+        // It's a courtesy to provide a command prompt
+        printf("->");
+        if (NULL == fgets(console.input, USER_INPUT_BUF_SIZE, stdin))
+        {
+            printf("ERROR - error in capturing user input\n");
+            break;
+        }
+        consoleProcessLine(&console, console.input);
+    }
+#endif
 
     printf("Goodbye.\n");
 
     return 0;
 }
-
+#endif // CONSOLE_NO_MAIN
@@ -0,0 +1,169 @@
+// Types shared by everything that makes up the console (its command tables, methods and
+//   argument parsers, which may be split across several files)
+
+// prototype method function pointer (a method's argument parser, handed the arguments as typed)
+typedef bool (*Method_t)(char*);
+
+#if CONSOLE_COMPACT_LAYOUT
+// Structure of a CommandTree Node (compact layout)
+//   Strings are offsets into stringPool, the method is an index into methodTable and the children
+//   are the contiguous range nodeTable[firstChild] .. nodeTable[firstChild + childCount - 1]
+typedef struct commandTreeNode_t
+{
+    const uint16_t name;
+    const uint16_t desc;
+    const uint16_t argDesc;
+    const uint16_t method;
+    const uint16_t firstChild;
+    const uint16_t childCount;NODE_STRUCT_FIELDS
+} commandTreeNode_t;
+
+// marks an absent argument description or method
+#define COMPACT_NONE 0xFFFF
+
+#define NODE_NAME(n)        (&stringPool[(n)->name])
+#define NODE_DESC(n)        (&stringPool[(n)->desc])
+#define NODE_ARG_DESC(n)    ((COMPACT_NONE == (n)->argDesc) ? NULL : &stringPool[(n)->argDesc])
+#define NODE_METHOD(n)      ((COMPACT_NONE == (n)->method) ? NULL : methodTable[(n)->method])
+#define NODE_CHILD_COUNT(n) ((n)->childCount)
+#define NODE_CHILD(n, i)    (&nodeTable[(n)->firstChild + (i)])
+#elif CONSOLE_IMAGE_LAYOUT
+// Nodes are records of a command table image, loaded at run time by consoleLoadImage(). The image
+//   holds no pointers and is read a byte at a time, so it works wherever it sits (read into RAM,
+//   mmap()ed, or executed in place from flash). It is, all little endian:
+//     header   IMAGE_HEADER_SIZE bytes (see the IMAGE_AT_ offsets)
+//     nodes    IMAGE_NODE_SIZE bytes each: name, desc, argDesc, method, firstChild and childCount as
+//              uint16_t, like the compact layout. Roots come first
+//     strings  NUL terminated, addressed by offset
+typedef uint8_t commandTreeNode_t;
+
+#define IMAGE_MAGIC             "CTBL"
+#define IMAGE_VERSION           1
+#define IMAGE_HEADER_SIZE       32
+#define IMAGE_NODE_SIZE         12
+#define IMAGE_NONE              0xFFFF  // marks an absent argument description or method
+#define IMAGE_FLAG_SORTED       0x0001  // every node's children are sorted by name
+
+// Where the header fields are
+#define IMAGE_AT_VERSION        4       // uint16_t
+#define IMAGE_AT_HEADER_SIZE    6       // uint16_t
+#define IMAGE_AT_SIZE           8       // uint32_t, the whole image
+#define IMAGE_AT_CHECKSUM       12      // uint32_t, CRC-32 of everything that follows it
+#define IMAGE_AT_BINDING        16      // uint32_t, must equal CONSOLE_IMAGE_BINDING
+#define IMAGE_AT_FLAGS          20      // uint16_t
+#define IMAGE_AT_NODE_COUNT     22      // uint16_t
+#define IMAGE_AT_ROOT_COUNT     24      // uint16_t
+#define IMAGE_AT_METHOD_COUNT   26      // uint16_t
+#define IMAGE_AT_STRINGS        28      // uint32_t, offset of the strings
+
+#define IMAGE_U16(p)            ((uint16_t)((uint16_t)(p)[0] | ((uint16_t)(p)[1] << 8)))
+#define IMAGE_U32(p)            ((uint32_t)IMAGE_U16(p) | ((uint32_t)IMAGE_U16((p) + 2) << 16))
+
+// The loaded image
+static const uint8_t* consoleImageNodes;
+static const char* consoleImageStrings;
+
+#define NODE_AT(i)          (&consoleImageNodes[(uint32_t)(i) * IMAGE_NODE_SIZE])
+#define NODE_NAME(n)        (&consoleImageStrings[IMAGE_U16((n) + 0)])
+#define NODE_DESC(n)        (&consoleImageStrings[IMAGE_U16((n) + 2)])
+#define NODE_ARG_DESC(n)    ((IMAGE_NONE == IMAGE_U16((n) + 4)) ? NULL : &consoleImageStrings[IMAGE_U16((n) + 4)])
+#define NODE_METHOD(n)      ((IMAGE_NONE == IMAGE_U16((n) + 6)) ? NULL : methodTable[IMAGE_U16((n) + 6)])
+#define NODE_CHILD_COUNT(n) (IMAGE_U16((n) + 10))
+#define NODE_CHILD(n, i)    NODE_AT(IMAGE_U16((n) + 8) + (i))
+#else
+// Structure of a CommandTree Node
+typedef struct commandTreeNode_t
+{
+    const char* name;
+    const char* desc;
+    const Method_t method;
+    const char* argDesc;
+    const uint32_t childCount;
+    const struct commandTreeNode_t** children;NODE_STRUCT_FIELDS
+} commandTreeNode_t;
+
+#define NODE_NAME(n)        ((n)->name)
+#define NODE_DESC(n)        ((n)->desc)
+#define NODE_ARG_DESC(n)    ((n)->argDesc)
+#define NODE_METHOD(n)      ((n)->method)
+#define NODE_CHILD_COUNT(n) ((n)->childCount)
+#define NODE_CHILD(n, i)    ((n)->children[(i)])
+#endif
+
+#if CONSOLE_PRECOMPUTED_HELP
+// Where a node's help block (its whole help output, rendered when the console was generated) sits in helpPool
+typedef struct
+{
+    const uint32_t offset;
+    const uint32_t length;
+} consoleHelp_t;
+
+// Help is written a block at a time; define CONSOLE_HELP_WRITE(buf, len) to send it elsewhere (e.g., a UART driver)
+#ifndef CONSOLE_HELP_WRITE
+#define CONSOLE_HELP_WRITE(buf, len) fputs((buf), stdout)
+#endif
+
+#if CONSOLE_COMPRESSED_HELP
+// Compressed blocks are expanded (and written) this many characters at a time
+#ifndef CONSOLE_HELP_CHUNK
+#define CONSOLE_HELP_CHUNK 32
+#endif
+#endif
+#endif
+
+// How tables refer to a root node: the image's nodes are only known once it is loaded, so there
+//   roots are referred to by index
+#if CONSOLE_IMAGE_LAYOUT
+typedef uint16_t consoleRoot_t;
+#define CONSOLE_ROOT(r) NODE_AT(r)
+#else
+typedef const commandTreeNode_t* consoleRoot_t;
+#define CONSOLE_ROOT(r) (r)
+#endif
+
+// A Gateway's endpoints: root nodes indexed by the endpoint's enum value, with the names in the
+//   same (sorted) order
+typedef struct endpointTable_t
+{
+    const uint32_t count;
+    const consoleRoot_t* roots;
+    const char* const* names;
+} endpointTable_t;
+
+// returned by a Gateway method to stay put
+#define CONSOLE_ENDPOINT_DENIED (-1)
+
+#if CONSOLE_PROFILE_GENERATED
+// Profiling counts command use and times methods; build with CONSOLE_PROFILE defined as 0 to compile it
+//   out (the STATS command stays, saying so)
+#ifndef CONSOLE_PROFILE
+#define CONSOLE_PROFILE 1
+#endif
+
+// Methods are timed with this; define it to read a cycle counter instead (e.g., DWT->CYCCNT on a Cortex-M)
+#ifndef CONSOLE_PROFILE_TIMESTAMP
+#include <time.h>
+#define CONSOLE_PROFILE_TIMESTAMP() ((uint32_t)clock())
+#endif
+
+// Where a node's counters are
+#if CONSOLE_COMPACT_LAYOUT
+#define NODE_PROFILE_INDEX(n) ((uint32_t)((n) - nodeTable))
+#elif CONSOLE_IMAGE_LAYOUT
+#define NODE_PROFILE_INDEX(n) ((uint32_t)((n) - consoleImageNodes) / IMAGE_NODE_SIZE)
+#else
+#define NODE_PROFILE_INDEX(n) ((n)->profileIndex)
+#endif
+
+// the STATS command's method
+bool parseConsoleStats(char* args);
+#elif defined(CONSOLE_PROFILE) && CONSOLE_PROFILE
+#error "Profiling needs a console generated with --profile"
+#else
+#undef CONSOLE_PROFILE
+#define CONSOLE_PROFILE 0
+#endif
+
+// Gateway endpoint lookups (see the console source)
+bool consoleEnterEndpoint(const endpointTable_t* table, int32_t index);
+int32_t consoleFindEndpoint(const endpointTable_t* table, const char* name);
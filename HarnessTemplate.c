@@ -0,0 +1,126 @@
+/******************************************************
+* Autogenerated code created by the ConsoleBuilder    *
+*   https://github.com/embedCreativity/ConsoleBuilder *
+*                                                     *
+* Generated on: CODE_GENERATION_DATE            *
+******************************************************/
+
+// Multi-session test harness: runs the console's own commands through many sessions at once,
+//   interleaved line by line (byte by byte with byte input), and checks every session behaves as
+//   if it ran alone.
+//   Build it in place of the console (plus the methods source if externalized), e.g.:
+//     gcc -o harness HARNESS_SOURCE
+#define CONSOLE_NO_MAIN
+#include "CONSOLE_SOURCE"
+
+#define HARNESS_SESSIONS 16
+
+// Every session runs this script, starting from one of the roots below
+static const char* const harnessScript[] = {
+HARNESS_SCRIPT
+};
+#define HARNESS_LINES (sizeof(harnessScript) / sizeof(harnessScript[0]))
+
+static const consoleRoot_t harnessRoots[] = {HARNESS_ROOTS};
+#define HARNESS_ROOT_COUNT (sizeof(harnessRoots) / sizeof(harnessRoots[0]))
+
+static consoleStatus_t expected[HARNESS_ROOT_COUNT][HARNESS_LINES];
+static consoleContext_t sessions[HARNESS_SESSIONS];
+static uint32_t failures;
+
+/************************************************************************************/
+/* Copy a script line into the session's input buffer and process it                */
+/************************************************************************************/
+static consoleStatus_t runLine(consoleContext_t* ctx, const char* line)
+{
+    strncpy(ctx->input, line, USER_INPUT_BUF_SIZE - 1);
+    ctx->input[USER_INPUT_BUF_SIZE - 1] = '\0';
+    return consoleProcessLine(ctx, ctx->input);
+}
+
+/************************************************************************************/
+/* Compare the status of a session's line against the reference run of its root     */
+/************************************************************************************/
+static void checkStatus(uint32_t s, uint32_t l, consoleStatus_t status)
+{
+    if (status != expected[s % HARNESS_ROOT_COUNT][l])
+    {
+        printf("FAIL: session %u, line %u (\"%s\"): status %d, expected %d\n", (unsigned)s, (unsigned)l,
+            harnessScript[l], (int)status, (int)expected[s % HARNESS_ROOT_COUNT][l]);
+        failures++;
+    }
+}
+
+int main(void)
+{
+#if CONSOLE_IMAGE_LAYOUT
+    if (!consoleLoadImageFile(CONSOLE_IMAGE_FILE))
+    {
+        printf("FAIL: could not load the command table image %s\n", CONSOLE_IMAGE_FILE);
+        return 1;
+    }
+#endif
+    // Reference: the script run alone, once from each root
+    for (uint32_t r = 0; r < HARNESS_ROOT_COUNT; r++)
+    {
+        consoleInit(&sessions[0]);
+        sessions[0].root = CONSOLE_ROOT(harnessRoots[r]);
+        for (uint32_t l = 0; l < HARNESS_LINES; l++)
+        {
+            expected[r][l] = runLine(&sessions[0], harnessScript[l]);
+        }
+    }
+
+    for (uint32_t s = 0; s < HARNESS_SESSIONS; s++)
+    {
+        consoleInit(&sessions[s]);
+        sessions[s].root = CONSOLE_ROOT(harnessRoots[s % HARNESS_ROOT_COUNT]);
+    }
+#if CONSOLE_BYTE_INPUT
+    // Interleaved: every session is fed one byte of the script (lines end in '\n') per round,
+    //   and each line it completes must match its reference
+    static uint32_t lines[HARNESS_SESSIONS];
+    static uint32_t offsets[HARNESS_SESSIONS];
+    for (bool busy = true; busy; )
+    {
+        busy = false;
+        for (uint32_t s = 0; s < HARNESS_SESSIONS; s++)
+        {
+            if (lines[s] < HARNESS_LINES)
+            {
+                char c = harnessScript[lines[s]][offsets[s]++];
+                consoleStatus_t status;
+
+                consoleFeedByte(&sessions[s], ('\0' == c) ? '\n' : c);
+                status = consoleService(&sessions[s]);
+                if ('\0' == c)
+                {
+                    checkStatus(s, lines[s]++, status);
+                    offsets[s] = 0;
+                }
+                else if (CONSOLE_PENDING != status)
+                {
+                    printf("FAIL: session %u, line %u (\"%s\"): ended early\n", (unsigned)s, (unsigned)lines[s],
+                        harnessScript[lines[s]]);
+                    failures++;
+                }
+                busy = true;
+            }
+        }
+    }
+#else
+    // Interleaved: every session advances one line per round and must match its reference
+    for (uint32_t l = 0; l < HARNESS_LINES; l++)
+    {
+        for (uint32_t s = 0; s < HARNESS_SESSIONS; s++)
+        {
+            checkStatus(s, l, runLine(&sessions[s], harnessScript[l]));
+        }
+    }
+#endif
+
+    printf("%s: %u sessions x %u lines interleaved, %u mismatches\n", (0 == failures) ? "PASS" : "FAIL",
+        (unsigned)HARNESS_SESSIONS, (unsigned)HARNESS_LINES, (unsigned)failures);
+
+    return (0 == failures) ? 0 : 1;
+}
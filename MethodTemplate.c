@@ -6,7 +6,7 @@
 ******************************************************/
 
 EXTERNAL_HEADER
-EXAMPLE_PARSING_ROUTINES
+
 /************************************************************************************/
 /* Console Methods                                                                  */
 /************************************************************************************/
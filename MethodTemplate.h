@@ -13,6 +13,7 @@
 #include <string.h>
 #include <stdbool.h>
 
+ENDPOINT_DECLARATIONS
 // method forward declarations
 METHOD_FUNC_FORWARD_DECLARATIONS
 
@@ -1,24 +1,183 @@
 /************************************************************************************/
-/* Example Parameter Parsing Routines                                               */
+/* Argument Parsing Routines                                                        */
+/*   Each takes the next space separated word off *args (terminating it in place)   */
+/*   and converts it, rejecting anything malformed or out of range                  */
 /************************************************************************************/
-static bool getSignedDecimal(const char* input, int32_t* num)
+static char* nextArg(char** args)
 {
-    int ret;
-    ret = sscanf(input, "%d", num);
-    if (ret < 1)
+    char* arg = *args;
+    char* end;
+
+    if (NULL == arg)
+    {
+        return NULL;
+    }
+    while (' ' == *arg)
+    {
+        arg++;
+    }
+    if ('\0' == *arg)
+    {
+        return NULL;
+    }
+    for (end = arg; (' ' != *end) && ('\0' != *end); end++);
+    if ('\0' != *end)
+    {
+        *end++ = '\0';
+    }
+    *args = end;
+
+    return arg;
+}
+
+// True once every argument has been taken
+static bool argsEnd(const char* args)
+{
+    if (NULL == args)
+    {
+        return true;
+    }
+    while (' ' == *args)
+    {
+        args++;
+    }
+    return ('\0' == *args);
+}
+
+// Digits (after a 0x or 0X prefix when hex) of a magnitude no greater than max
+static bool toMagnitude(const char* arg, bool hex, uint64_t max, uint64_t* magnitude)
+{
+    uint64_t base = hex ? 16 : 10;
+    uint64_t value = 0;
+
+    if (hex)
+    {
+        if (('0' != arg[0]) || (('X' != arg[1]) && ('x' != arg[1])))
+        {
+            return false;
+        }
+        arg += 2;
+    }
+    if ('\0' == *arg)
     {
         return false;
     }
+    for (; '\0' != *arg; arg++)
+    {
+        char c = *arg;
+        uint64_t digit;
+
+        if (('0' <= c) && ('9' >= c))
+        {
+            digit = (uint64_t)(c - '0');
+        }
+        else if (hex && ('A' <= (c & ~0x20)) && ('F' >= (c & ~0x20)))
+        {
+            digit = (uint64_t)((c & ~0x20) - 'A' + 10);
+        }
+        else
+        {
+            return false;
+        }
+        // value * base + digit must not pass max
+        if ((digit > max) || (value > (max - digit) / base))
+        {
+            return false;
+        }
+        value = value * base + digit;
+    }
+    *magnitude = value;
+
     return true;
 }
 
-static bool getUnsignedHex(const char* input, uint32_t* num)
+static bool parseUnsigned(char** args, bool hex, uint64_t max, uint64_t* value)
+{
+    char* arg = nextArg(args);
+
+    return (NULL != arg) && toMagnitude(arg, hex, max, value);
+}
+
+static bool parseSigned(char** args, bool hex, int64_t min, int64_t max, int64_t* value)
 {
-    int ret;
-    ret = sscanf(input, "0X%x", num);
-    if (ret < 1)
+    char* arg = nextArg(args);
+    bool negative;
+    uint64_t magnitude;
+
+    if (NULL == arg)
     {
         return false;
     }
+    negative = ('-' == *arg);
+    if (negative || ('+' == *arg))
+    {
+        arg++;
+    }
+    if (negative)
+    {
+        if (!toMagnitude(arg, hex, (uint64_t)0 - (uint64_t)min, &magnitude))
+        {
+            return false;
+        }
+        // magnitude may be one more than INT64_MAX
+        *value = (0 == magnitude) ? 0 : -(int64_t)(magnitude - 1) - 1;
+    }
+    else
+    {
+        if (!toMagnitude(arg, hex, (uint64_t)max, &magnitude))
+        {
+            return false;
+        }
+        *value = (int64_t)magnitude;
+    }
+
     return true;
 }
+
+// 1/0, true/false, on/off or yes/no, in any case
+static bool parseBool(char** args, bool* value)
+{
+    static const char* const words[] = {"0", "1", "FALSE", "TRUE", "OFF", "ON", "NO", "YES"};
+    char* arg = nextArg(args);
+
+    if (NULL == arg)
+    {
+        return false;
+    }
+    for (uint32_t i = 0; i < sizeof(words) / sizeof(words[0]); i++)
+    {
+        const char* word = words[i];
+        const char* c = arg;
+
+        for (; ('\0' != *word) && (toupper((unsigned char)*c) == *word); word++, c++);
+        if (('\0' == *word) && ('\0' == *c))
+        {
+            *value = (1 == (i & 1));
+            return true;
+        }
+    }
+
+    return false;
+}
+
+// A finite decimal (or strtod() hexadecimal) real no larger in magnitude than max
+static bool parseReal(char** args, double max, double* value)
+{
+    char* arg = nextArg(args);
+    char* end;
+
+    if ((NULL == arg) || isspace((unsigned char)*arg))
+    {
+        return false;
+    }
+    *value = strtod(arg, &end);
+
+    return ('\0' == *end) && (*value <= max) && (*value >= -max);
+}
+
+static bool parseString(char** args, char** value)
+{
+    *value = nextArg(args);
+
+    return (NULL != *value);
+}
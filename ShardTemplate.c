@@ -0,0 +1,12 @@
+/******************************************************
+* Autogenerated code created by the ConsoleBuilder    *
+*   https://github.com/embedCreativity/ConsoleBuilder *
+*                                                     *
+* Generated on: CODE_GENERATION_DATE            *
+******************************************************/
+
+// One shard of the console's command tables, argument parsers and methods: build it along with the
+//   console source (and the other shards)
+#include "SHARED_HEADER"
+EXAMPLE_PARSING_ROUTINES
+SHARD_DEFINITIONS
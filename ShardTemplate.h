@@ -0,0 +1,32 @@
+/******************************************************
+* Autogenerated code created by the ConsoleBuilder    *
+*   https://github.com/embedCreativity/ConsoleBuilder *
+*                                                     *
+* Generated on: CODE_GENERATION_DATE            *
+******************************************************/
+
+// Declarations shared by the console source and its shards
+#ifndef FILENAME_PLACEHOLDER_H_
+#define FILENAME_PLACEHOLDER_H_
+
+#include <stdio.h>
+#include <stdint.h>
+#include <string.h>
+#include <ctype.h>
+#include <stdbool.h>
+#include <stdlib.h>
+#include <float.h>
+EXTERNAL_HEADER
+// console configuration
+CONSOLE_CONFIGURATION
+
+CONSOLE_TYPES
+ENDPOINT_DECLARATIONS
+
+// method forward declarations
+METHOD_FUNC_FORWARD_DECLARATIONS
+
+// defined in the shards
+SHARD_DECLARATIONS
+
+#endif // FILENAME_PLACEHOLDER_H_
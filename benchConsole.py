@@ -0,0 +1,357 @@
+#!/usr/bin/env python3
+
+'''
+  Copyright (C) 2021 Embed Creativity LLC
+
+  This program is free software; you can redistribute it and/or modify
+  it under the terms of the GNU General Public License as published by
+  the Free Software Foundation; either version 2 of the License, or
+  (at your option) any later version.
+
+  This program is distributed in the hope that it will be useful,
+  but WITHOUT ANY WARRANTY; without even the implied warranty of
+  MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+  GNU General Public License for more details.
+
+  You should have received a copy of the GNU General Public License along
+  with this program; if not, write to the Free Software Foundation, Inc.,
+  51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+'''
+
+# Benchmarks genConsole and the console it generates: builds a synthetic command spec, times each
+#   phase of generation and its peak memory, then compiles the console to measure its code size and
+#   how long each command takes to dispatch. Results are JSON, so runs can be compared (--compare)
+
+import sys
+import os
+import io
+import json
+import time
+import random
+import shutil
+import tempfile
+import contextlib
+import subprocess
+import statistics
+import tracemalloc
+import xml.etree.ElementTree as ET
+from datetime import datetime
+import argparse
+
+import genConsole
+
+TEMPLATE_BENCH_FILE         = 'BenchTemplate.c'
+TEMPLATE_BENCH_PASSES       = 'BENCH_PASS_COUNT'
+BENCH_SOURCE                = 'ConsoleBench.c'
+BENCH_BINARY                = 'bench'
+BENCH_OUTPUT                = 'Console.c'
+BENCH_CFLAGS                = ['-O2', '-w']
+
+# Parameter types of synthetic methods, used in turn; every third integer is hexadecimal
+SPEC_PARAM_TYPES            = ('uint8_t', 'uint16_t', 'uint32_t', 'int8_t', 'int16_t', 'int32_t', 'char*')
+
+# Sections of the object files that are reported (and summed over every source of the console)
+SIZE_SECTIONS               = ('.text', '.rodata', '.data', '.bss')
+
+# Results compared by --compare; for every one of them lower is better
+COMPARED_SECTIONS           = ('generator', 'build', 'dispatch')
+UNCOMPARED_RESULTS          = ('dispatch.lines',)
+
+def makeSpec(path, depth, fanout, params, gateways, endpoints, duplication, seed=1):
+    # Write a synthetic XML spec: fanout top level commands, each branching fanout ways per level down
+    #   to methods depth levels in, with params parameters each. Next to them are gateways Gateways,
+    #   leading to endpoints endpoints holding a depth - 1 deep tree of their own. A description is a
+    #   copy of an earlier one with probability duplication. Returns the node count
+    rand = random.Random(seed)
+    descriptions = []
+    counts = {'nodes': 0, 'params': 0}
+
+    def describe(element, text):
+        if descriptions and rand.random() < duplication:
+            text = rand.choice(descriptions)
+        else:
+            descriptions.append(text)
+        ET.SubElement(element, 'description').text = text
+
+    def addParam(method, name, paramType, description):
+        param = ET.SubElement(method, 'param')
+        ET.SubElement(param, 'name').text = name
+        ET.SubElement(param, 'type').text = paramType
+        if paramType in genConsole.PARAM_INTEGER_TYPES and 0 == counts['params'] % 3:
+            ET.SubElement(param, 'format').text = 'hexadecimal'
+        ET.SubElement(param, 'description').text = description
+        counts['params'] += 1
+
+    def addTree(parent, levels, path):
+        for i in range(fanout):
+            name = '{}_{}'.format(path, i)
+            command = ET.SubElement(parent, 'command', text='Cmd{}'.format(i))
+            describe(command, 'Command {}'.format(name))
+            counts['nodes'] += 1
+            if levels > 1:
+                addTree(command, levels - 1, name)
+                continue
+            method = ET.SubElement(command, 'callMethod', function='Method{}'.format(name))
+            for p in range(params):
+                addParam(method, 'Arg{}'.format(p), SPEC_PARAM_TYPES[counts['params'] % len(SPEC_PARAM_TYPES)],
+                    'Argument {} of {}'.format(p, name))
+
+    data = ET.Element('data')
+    addTree(data, depth, 'T')
+    for g in range(gateways):
+        command = ET.SubElement(data, 'command', text='Gate{}'.format(g), type='Gateway')
+        describe(command, 'Gateway {}'.format(g))
+        counts['nodes'] += 1
+        dispatch = ET.SubElement(command, 'dispatch', function='Gateway{}'.format(g))
+        addParam(dispatch, 'Password', 'char*', 'Gateway password')
+        for e in range(endpoints):
+            endpoint = ET.SubElement(dispatch, 'endpoint', name='Gate{}End{}'.format(g, e))
+            addTree(endpoint, max(depth - 1, 1), '{}_{}'.format(g, e))
+
+    ET.ElementTree(data).write(path, xml_declaration=True)
+    return counts['nodes']
+
+@contextlib.contextmanager
+def workingDirectory(path):
+    # Generate relative paths (as the generated sources refer to each other by them)
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+def createGenerator(spec, options, templates):
+    options = dict(options)
+    return genConsole.genConsole(spec, BENCH_OUTPUT, options.pop('externalize', False), templates=templates, **options)
+
+def benchGenerate(spec, options, workDir, templates, repeat=1):
+    # Generate the console into workDir, timing every phase (see genConsole.phase()): rendering in memory
+    #   and writing (which streams the sources out again) are separate phases. The fastest of repeat runs
+    #   is kept. Peak memory is taken in a further, traced, run. Returns (results, generator)
+    with workingDirectory(workDir), contextlib.redirect_stdout(io.StringIO()):
+        best = None
+        for _ in range(repeat):
+            generator = createGenerator(spec, options, templates)
+            started = time.perf_counter()
+            outputs = generator.createOutputs()
+            sources = generator.renderOutputs(outputs)
+            with generator.phase('write'):
+                generator.writeOutputs(outputs)
+            seconds = time.perf_counter() - started
+            if best is None or seconds < best[0]:
+                best = (seconds, generator, sources)
+        seconds, generator, sources = best
+
+        traced = createGenerator(spec, options, templates)
+        tracemalloc.start()
+        traced.render()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    return {'seconds': seconds, 'phases': generator.phaseTimes, 'peakMemory': peak,
+        'outputBytes': sum([len(source) for source in sources.values()])}, generator
+
+def consoleSources(generator):
+    # The console's C sources, other than the console source itself
+    sources = [os.path.basename(path) for path in generator.shardPaths]
+    if generator.externalize:
+        sources.append(os.path.basename(generator.methodSourcePath))
+    return sources
+
+def sectionSizes(cc, workDir, sources):
+    # Compile each source on its own and sum the sizes of SIZE_SECTIONS over the objects
+    sizes = dict.fromkeys(SIZE_SECTIONS, 0)
+    for source in sources:
+        objectPath = os.path.splitext(source)[0] + '.o'
+        subprocess.run([cc] + BENCH_CFLAGS + ['-DCONSOLE_NO_MAIN', '-c', '-o', objectPath, source],
+            cwd=workDir, check=True)
+        listing = subprocess.run(['size', '-A', objectPath], cwd=workDir, check=True, capture_output=True,
+            text=True).stdout
+        for line in listing.splitlines():
+            fields = line.split()
+            # named sections of their own (e.g., .rodata.str1.1) are counted with their section
+            for section in SIZE_SECTIONS:
+                if len(fields) >= 2 and (fields[0] == section or fields[0].startswith(section + '.')):
+                    sizes[section] += int(fields[1])
+    return {section[1:]: size for section, size in sizes.items()}
+
+def benchBuild(generator, workDir, templates, cc, passes):
+    # Compile the console: its section sizes, then a driver timing every line of the generated test
+    #   script (see createHarnessScript()) over passes runs. Returns (build, dispatch) results
+    sources = consoleSources(generator)
+    build = sectionSizes(cc, workDir, [BENCH_OUTPUT] + sources)
+
+    template = genConsole.CodeTemplate(templates.text(TEMPLATE_BENCH_FILE), genConsole.TEMPLATE_FILE_SLOTS + (TEMPLATE_BENCH_PASSES,))
+    with open(os.path.join(workDir, BENCH_SOURCE), 'w') as fout:
+        template.write(fout, {
+            genConsole.TEMPLATE_DATE: '{}'.format(datetime.now()),
+            genConsole.TEMPLATE_CONSOLE_SOURCE: BENCH_OUTPUT,
+            genConsole.TEMPLATE_HARNESS_SOURCE: ' '.join([BENCH_SOURCE] + sources),
+            genConsole.TEMPLATE_HARNESS_SCRIPT: generator.createHarnessScript(),
+            TEMPLATE_BENCH_PASSES: str(passes)})
+    subprocess.run([cc] + BENCH_CFLAGS + ['-o', BENCH_BINARY, BENCH_SOURCE] + sources, cwd=workDir, check=True)
+    report = subprocess.run([os.path.join('.', BENCH_BINARY)], cwd=workDir, check=True,
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True).stderr
+    latencies = [float(line.split()[1]) for line in report.splitlines()]
+
+    return build, {'lines': len(latencies), 'meanNs': statistics.mean(latencies),
+        'medianNs': statistics.median(latencies), 'maxNs': max(latencies)}
+
+def gitRevision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+            check=True, capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def runBenchmark(spec, options, workDir, cc='gcc', passes=200, build=True, shape=None, repeat=1):
+    # Benchmark generating (and unless build is False, compiling and running) the console of spec.
+    #   shape describes a synthetic spec, recorded with the results
+    templates = genConsole.TemplateCache(os.path.dirname(os.path.abspath(genConsole.__file__))).load()
+    templates.text(TEMPLATE_BENCH_FILE)
+    results = {'revision': gitRevision(), 'date': '{}'.format(datetime.now()), 'spec': shape or {'path': spec},
+        'options': options}
+    results['generator'], generator = benchGenerate(os.path.abspath(spec), options, workDir, templates,
+        repeat)
+    if build:
+        results['build'], results['dispatch'] = benchBuild(generator, workDir, templates, cc, passes)
+    return results
+
+def flattenResults(results, prefix=''):
+    # {'section.name': value} of every number under COMPARED_SECTIONS
+    values = {}
+    for key, value in results.items():
+        name = prefix + key
+        if isinstance(value, dict):
+            if prefix or key in COMPARED_SECTIONS:
+                values.update(flattenResults(value, name + '.'))
+        elif prefix and isinstance(value, (int, float)) and name not in UNCOMPARED_RESULTS:
+            values[name] = value
+    return values
+
+def compareResults(old, new, threshold):
+    # Print each result of new against old; returns the names of those worse by more than threshold percent
+    oldValues = flattenResults(old)
+    newValues = flattenResults(new)
+    regressions = []
+    print('Comparing {} against {}'.format(new.get('revision'), old.get('revision')))
+    for name in sorted(set(oldValues) | set(newValues)):
+        if name not in oldValues or name not in newValues:
+            print('  {:44} {}'.format(name, 'new' if name in newValues else 'gone'))
+            continue
+        before = oldValues[name]
+        after = newValues[name]
+        change = 100.0 * (after - before) / before if before else 0.0
+        worse = change > threshold
+        if worse:
+            regressions.append(name)
+        print('  {:44} {:>14.6g} -> {:<14.6g} {:+7.1f}%{}'.format(name, before, after, change,
+            '  REGRESSION' if worse else ''))
+    return regressions
+
+if (__name__ == '__main__' ):
+    parser = argparse.ArgumentParser(description='Console Builder benchmark')
+
+    parser.add_argument('--spec', action='store', dest='spec', default=None,
+        help='Benchmark this XML spec instead of a synthetic one')
+
+    parser.add_argument('--depth', action='store', type=int, dest='depth', default=3,
+        help='Levels of commands down to each method of the synthetic spec')
+
+    parser.add_argument('--fanout', action='store', type=int, dest='fanout', default=8,
+        help='Subcommands of every synthetic command')
+
+    parser.add_argument('--params', action='store', type=int, dest='params', default=2,
+        help='Parameters of every synthetic method')
+
+    parser.add_argument('--gateways', action='store', type=int, dest='gateways', default=1,
+        help='Synthetic Gateways (top level commands)')
+
+    parser.add_argument('--endpoints', action='store', type=int, dest='endpoints', default=2,
+        help='Endpoints of every synthetic Gateway')
+
+    parser.add_argument('--duplication', action='store', type=float, dest='duplication', default=0.5,
+        help='Share of synthetic descriptions that repeat an earlier one (0 to 1)')
+
+    parser.add_argument('--seed', action='store', type=int, dest='seed', default=1,
+        help='Seed of the synthetic spec')
+
+    parser.add_argument('-e', type=genConsole.str2bool, nargs='?', const=True, default=False, dest='externalize',
+        help='<Optional flag> Externalize Methods to a separate source file')
+
+    parser.add_argument('--dispatch', action='store', dest='dispatch', choices=genConsole.DISPATCH_STRATEGIES,
+        default=genConsole.DISPATCH_LINEAR, help='Child lookup used by the generated console')
+
+    parser.add_argument('--layout', action='store', dest='layout', choices=genConsole.LAYOUTS, default=genConsole.LAYOUT_POINTER,
+        help='Node table layout')
+
+    parser.add_argument('--help-blocks', type=genConsole.str2bool, nargs='?', const=True, default=False, dest='helpBlocks',
+        help='<Optional flag> Render every help block at generation time')
+
+    parser.add_argument('--compress-help', type=genConsole.str2bool, nargs='?', const=True, default=False,
+        dest='compressHelp', help='<Optional flag> Store the help blocks byte pair encoded')
+
+    parser.add_argument('--shards', action='store', type=int, dest='shards', default=1,
+        help='Split the generated tables across this many source files')
+
+    parser.add_argument('--profile', type=genConsole.str2bool, nargs='?', const=True, default=False, dest='profile',
+        help='<Optional flag> Generate the console with profiling (to measure what it costs)')
+
+    parser.add_argument('--no-build', type=genConsole.str2bool, nargs='?', const=True, default=False, dest='noBuild',
+        help='<Optional flag> Only benchmark the generator, without compiling the console')
+
+    parser.add_argument('--cc', action='store', dest='cc', default='gcc',
+        help='C compiler building the console')
+
+    parser.add_argument('--passes', action='store', type=int, dest='passes', default=200,
+        help='Runs of the command script timed by the dispatch benchmark')
+
+    parser.add_argument('--repeat', action='store', type=int, dest='repeat', default=3,
+        help='Generate this many times, keeping the fastest run')
+
+    parser.add_argument('--work', action='store', dest='work', default=None,
+        help='Generate and build here (kept) instead of in a temporary directory')
+
+    parser.add_argument('-o', action='store', dest='outputFile', default=None,
+        help='Save the results to this JSON file (printed otherwise)')
+
+    parser.add_argument('--compare', action='store', dest='compare', default=None,
+        help='Compare the results against an earlier results file; exits 1 on a regression')
+
+    parser.add_argument('--threshold', action='store', type=float, dest='threshold', default=10.0,
+        help='Percent a result may worsen by before --compare calls it a regression')
+
+    arguments = parser.parse_args()
+
+    options = {'externalize': arguments.externalize, 'dispatch': arguments.dispatch, 'layout': arguments.layout,
+        'helpBlocks': arguments.helpBlocks, 'compressHelp': arguments.compressHelp, 'shards': arguments.shards,
+        'profile': arguments.profile}
+    workDir = arguments.work or tempfile.mkdtemp(prefix='consoleBench')
+    os.makedirs(workDir, exist_ok=True)
+    try:
+        spec = arguments.spec
+        shape = None
+        if spec is None:
+            spec = os.path.join(workDir, 'bench.xml')
+            shape = {'depth': arguments.depth, 'fanout': arguments.fanout, 'params': arguments.params,
+                'gateways': arguments.gateways, 'endpoints': arguments.endpoints,
+                'duplication': arguments.duplication, 'seed': arguments.seed}
+            shape['nodes'] = makeSpec(spec, **shape)
+        results = runBenchmark(spec, options, workDir, arguments.cc, arguments.passes, not arguments.noBuild, shape,
+            arguments.repeat)
+    finally:
+        if arguments.work is None:
+            shutil.rmtree(workDir)
+
+    if arguments.outputFile is not None:
+        with open(arguments.outputFile, 'w') as fout:
+            json.dump(results, fout, indent=2)
+        print('Results saved to {}'.format(arguments.outputFile))
+    else:
+        print(json.dumps(results, indent=2))
+
+    if arguments.compare is not None:
+        with open(arguments.compare) as fin:
+            regressions = compareResults(json.load(fin), results, arguments.threshold)
+        sys.exit(1 if regressions else 0)
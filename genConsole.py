@@ -19,26 +19,50 @@
 '''
 
 import sys
+import os
+import re
+import json
+import hashlib
+import collections
+import struct
+import zlib
 import xml.etree.ElementTree as ET
 from enum import Enum
 from datetime import datetime
 import argparse
+import tracemalloc
+import io
+import time
+import contextlib
+import multiprocessing
+import weakref
+import gc
 
 class Node:
+    # Slotted, as specs can run to hundreds of thousands of nodes. Attributes that are usually
+    #   empty share an immutable default until they are set
+    __slots__ = ('name', 'command', 'parent', 'children', 'description', 'isMethod', 'isGateway', 'endPoints',
+        'methodName', 'hasParams', 'strVarParamDesc', 'strVarNodeName', 'strVarBranchArrayName')
+
     def __init__(self, name='~'):
         self.name = name
+        self.command = None
         self.parent = None
         self.children = []
         self.description = ''
         self.isMethod = False
         self.isGateway = False
-        self.endPoints = []
+        self.endPoints = ()
         self.methodName = ''
         self.hasParams = False
         self.strVarParamDesc = ''
         self.strVarNodeName = ''
         self.strVarBranchArrayName = None
-        self.arrStrVarNodeNames = []
+
+    @property
+    def arrStrVarNodeNames(self):
+        # the children's node variable names, in order
+        return [child.strVarNodeName for child in self.children]
 
     def addChild(self, child):
         self.children.append(child)
@@ -54,6 +78,53 @@ class StringType(Enum):
     STR_COMMAND = 1
     STR_DESCRIPTION = 2
 
+
+class CodeTemplate:
+    '''
+    A code prototype compiled once into literal segments and named slots.
+    Slots are matched longest-first in a single scan of the prototype, so
+    'DESC' never matches inside 'DESC_PLACEHOLDER', and values handed to
+    render() are never scanned again - user text containing a placeholder
+    word is emitted as is.
+    '''
+    def __init__(self, text, slots):
+        pattern = '|'.join(re.escape(slot) for slot in sorted(slots, key=len, reverse=True))
+        # re.split() with a capture group alternates literal, slot, literal, ...
+        self.segments = re.split('(' + pattern + ')', text)
+        self.slots = self.segments[1::2]
+
+    def render(self, values):
+        segments = self.segments[:]
+        segments[1::2] = [values[slot] for slot in self.slots]
+        return ''.join(segments)
+
+    def write(self, fout, values):
+        # render() straight into fout, a segment at a time (see writeValue())
+        for i, segment in enumerate(self.segments):
+            writeValue(fout, values[segment] if i % 2 else segment)
+
+def writeValue(fout, value):
+    # A value is text, or a list of sections written one after the other, a newline apart
+    #   (as '\n'.join() would), so big sections are never joined in memory
+    if isinstance(value, str):
+        fout.write(value)
+        return
+    for i, section in enumerate(value):
+        if i > 0:
+            fout.write('\n')
+        fout.write(section)
+
+class DigestWriter:
+    # Stands in for an output file, hashing what would be written to it
+    def __init__(self):
+        self.digest = hashlib.sha256()
+
+    def write(self, text):
+        self.digest.update(text.encode())
+
+    def hexdigest(self):
+        return self.digest.hexdigest()
+
 # helper function for getting boolean from argparse
 def str2bool(v):
     if isinstance(v, bool):
@@ -65,6 +136,13 @@ def str2bool(v):
     else:
         raise argparse.ArgumentTypeError('Boolean value expected')
 
+# helper function for getting a (name, bytes) size budget from argparse (--budget NAME=BYTES)
+def parseBudget(v):
+    name, _, size = v.partition('=')
+    if name not in FOOTPRINT_BUDGETS or not size.isdigit():
+        raise argparse.ArgumentTypeError('NAME=BYTES expected, NAME one of: {}'.format(', '.join(FOOTPRINT_BUDGETS)))
+    return name, int(size)
+
 #############################################################
 # Code Generation Templates                                 #
 
@@ -73,6 +151,10 @@ TEMPLATE_FILE               = 'CommandTreeTemplate.c'
 TEMPLATE_METHOD_HEADER_FILE = 'MethodTemplate.h'
 TEMPLATE_METHOD_SOURCE_FILE = 'MethodTemplate.c'
 TEMPLATE_PARSER_SOURCE_FILE = 'ParserTemplate.c'
+TEMPLATE_HARNESS_FILE       = 'HarnessTemplate.c'
+TEMPLATE_TYPES_FILE         = 'CommandTreeTemplate.h'
+TEMPLATE_SHARD_HEADER_FILE  = 'ShardTemplate.h'
+TEMPLATE_SHARD_SOURCE_FILE  = 'ShardTemplate.c'
 
 # Template strings correlate to the code template source,
 #   where we're going to replace these keywords with our
@@ -83,35 +165,296 @@ TEMPLATE_HEADER_EXT         = 'EXTERNAL_HEADER'
 TEMPLATE_NODES              = 'NODE_DECLARATIONS'
 TEMPLATE_METHOD_STUBS       = 'FUNCTION_STUBS'
 TEMPLATE_PARSING_ROUTINES   = 'EXAMPLE_PARSING_ROUTINES'
+TEMPLATE_CHILD_LOOKUP       = 'CHILD_LOOKUP_ROUTINE'
+TEMPLATE_NODE_FIELDS        = 'NODE_STRUCT_FIELDS'
+TEMPLATE_CONFIGURATION      = 'CONSOLE_CONFIGURATION'
+TEMPLATE_ARGUMENT_PARSERS   = 'METHOD_ARGUMENT_PARSERS'
+TEMPLATE_ENDPOINT_DECLARATIONS = 'ENDPOINT_DECLARATIONS'
+TEMPLATE_ENDPOINT_TABLES    = 'ENDPOINT_TABLES'
+TEMPLATE_TYPES              = 'CONSOLE_TYPES'
 
 INCLUDE_HEADER              = '#include "FILENAME"\n'
 EXTERN_METHOD_PROTO         = 'extern '
-METHOD_FORWARD              = 'bool FUNCTION(const char* userInput);'
+METHOD_FORWARD              = 'RETURN_TYPE FUNCTION(PARAMETERS);'
 METHOD_PROTO = ''                                       +\
     '// DESCRIPTION:\n'                                 +\
     '//   DESC_PLACEHOLDER\n'                           +\
     '// PARAMS:\n'                                      +\
     'PARAM_PLACEHOLDER\n'                               +\
-    'bool FUNCTION(const char* userInput)\n'            +\
+    'RETURN_TYPE FUNCTION(PARAMETERS)\n'                +\
     '{\n'                                               +\
     'INPUT_VERIFICATION_METHOD\n'                       +\
     '\n'                                                +\
     '    printf("You have called: FUNCTION\\n");\n'     +\
-    '    return true;\n'                                +\
+    '    return RESULT;\n'                              +\
     '}\n'
+METHOD_RETURN_TYPE          = 'bool'
+METHOD_RESULT               = 'true'
+
+VOID_CHECK = '    // TODO:'
 
-VOID_CHECK = ''                                         +\
-    '    if ( NULL != userInput )\n'                    +\
+# The command tree calls a generated parser for each method, which converts and range checks
+#   the typed arguments (with the routines in ParserTemplate.c) and calls the method with them
+ARGUMENT_PARSER_PREFIX      = 'parse'
+ARGUMENT_PARSER_PROTO = ''                              +\
+    'static bool PARSER(char* args)\n'                  +\
+    '{\n'                                               +\
+    'DECLARATIONS'                                      +\
+    '    if (CONDITIONS)\n'                             +\
     '    {\n'                                           +\
     '        return false;\n'                           +\
-    '    }'
+    '    }\n'                                           +\
+    '    return CALL;\n'                                +\
+    '}'
+ARGUMENTS_ABSENT            = 'NULL != args'
+ARGUMENTS_END               = '!argsEnd(args)'
+METHOD_CALL                 = 'FUNCTION(VALUES)'
+
+# A Gateway method returns the index of the endpoint to enter (its enum, sorted by name), which
+#   its parser hands to consoleEnterEndpoint() along with the Gateway's endpoint table
+GATEWAY_RETURN_TYPE         = 'int32_t'
+GATEWAY_RESULT              = 'consoleFindEndpoint(&VARNAME_TABLE, NAME_PARAM)'
+GATEWAY_DENIED              = 'CONSOLE_ENDPOINT_DENIED'
+GATEWAY_CALL                = 'consoleEnterEndpoint(&VARNAME_TABLE, FUNCTION(VALUES))'
+STR_ENDPOINT_TABLE_PREFIX   = 'endpoints'
+# Declared in the methods header when externalized, so Gateway methods can return the endpoint enum
+ENDPOINT_HEADER_PRELUDE = ''                                                        +\
+    '// Gateway endpoints (struct endpointTable_t is defined in the console source)\n' +\
+    'struct endpointTable_t;\n'                                                     +\
+    '#define CONSOLE_ENDPOINT_DENIED (-1)\n'                                        +\
+    'int32_t consoleFindEndpoint(const struct endpointTable_t* table, const char* name);\n'
+ENDPOINT_DECLARATION_PROTO = ''                                                     +\
+    '// FUNCTION() endpoints: return one (or CONSOLE_ENDPOINT_DENIED) to enter it\n' +\
+    'enum\n'                                                                        +\
+    '{\n'                                                                           +\
+    'ENUMERATORS\n'                                                                 +\
+    '};\n'                                                                          +\
+    'extern const struct endpointTable_t VARNAME_TABLE;\n'
+ENDPOINT_TABLE_PROTO = ''                                                           +\
+    'ROOTS_AND_NAMES'                                                               +\
+    'const endpointTable_t VARNAME_TABLE = { .count=COUNT, .roots=VARNAME_ROOTS, .names=VARNAME_NAMES };\n'
+ENDPOINT_ARRAYS_PROTO = ''                                                          +\
+    'static const consoleRoot_t VARNAME_ROOTS[] = {ROOTS};\n'                      +\
+    'static const char* const VARNAME_NAMES[] = {NAMES};\n'
+
+# Parameter types: C type -> (parsing routine, range arguments, type of the parsed value)
+PARAM_INTEGER_TYPES = {
+    'uint8_t':  ('parseUnsigned', 'UINT8_MAX', 'uint64_t'),
+    'uint16_t': ('parseUnsigned', 'UINT16_MAX', 'uint64_t'),
+    'uint32_t': ('parseUnsigned', 'UINT32_MAX', 'uint64_t'),
+    'uint64_t': ('parseUnsigned', 'UINT64_MAX', 'uint64_t'),
+    'int8_t':   ('parseSigned', 'INT8_MIN, INT8_MAX', 'int64_t'),
+    'int16_t':  ('parseSigned', 'INT16_MIN, INT16_MAX', 'int64_t'),
+    'int32_t':  ('parseSigned', 'INT32_MIN, INT32_MAX', 'int64_t'),
+    'int64_t':  ('parseSigned', 'INT64_MIN, INT64_MAX', 'int64_t')}
+# C type -> largest magnitude
+PARAM_REAL_TYPES    = {'float': 'FLT_MAX', 'double': 'DBL_MAX'}
+PARAM_BOOL_TYPES    = ('bool', '_Bool')
+PARAM_STRING_TYPES  = ('char*', 'char *')
+PARAM_FORMATS       = {None: 'false', 'decimal': 'false', 'hexadecimal': 'true'}
+# Any other type is handed to the method as its word of the line, for the method to convert
+PARAM_RAW_TYPE      = 'char*'
+
+# Child lookup strategies (how a command word is matched against a node's children)
+DISPATCH_LINEAR = 'linear'
+DISPATCH_BINARY = 'binary'
+DISPATCH_HASH   = 'hash'
+DISPATCH_STRATEGIES = (DISPATCH_LINEAR, DISPATCH_BINARY, DISPATCH_HASH)
+
+LOOKUP_LINEAR = ''                                                                      +\
+    '/************************************************************************************/\n' +\
+    '/* Find the child of node matching a command word (linear scan)                     */\n' +\
+    '/************************************************************************************/\n' +\
+    'static const commandTreeNode_t* findChild(const commandTreeNode_t* node, const char* word, uint32_t length)\n' +\
+    '{\n'                                                                                +\
+    '    for (uint32_t i = 0; i < NODE_CHILD_COUNT(node); i++)\n'                        +\
+    '    {\n'                                                                            +\
+    '        if (wordMatches(word, length, NODE_NAME(NODE_CHILD(node, i))))\n'           +\
+    '        {\n'                                                                        +\
+    '            return NODE_CHILD(node, i);\n'                                          +\
+    '        }\n'                                                                        +\
+    '    }\n'                                                                            +\
+    '    return NULL;\n'                                                                 +\
+    '}\n'
+
+# Requires every children array to be sorted by command string (see childOrder())
+LOOKUP_BINARY = ''                                                                      +\
+    '/************************************************************************************/\n' +\
+    '/* Find the child of node matching a command word (binary search, sorted children)  */\n' +\
+    '/************************************************************************************/\n' +\
+    '// Orders word (compared as upper case) against name like strcmp(word, name)\n'     +\
+    'static int wordCompare(const char* word, uint32_t length, const char* name)\n'      +\
+    '{\n'                                                                                +\
+    '    for (uint32_t i = 0; i < length; i++)\n'                                        +\
+    '    {\n'                                                                            +\
+    '        int diff = toupper((unsigned char)word[i]) - (unsigned char)name[i];\n'     +\
+    '        if (0 != diff)\n'                                                           +\
+    '        {\n'                                                                        +\
+    '            return diff;\n'                                                         +\
+    '        }\n'                                                                        +\
+    '    }\n'                                                                            +\
+    '    return -(int)(unsigned char)name[length];\n'                                    +\
+    '}\n'                                                                                +\
+    '\n'                                                                                 +\
+    'static const commandTreeNode_t* findChild(const commandTreeNode_t* node, const char* word, uint32_t length)\n' +\
+    '{\n'                                                                                +\
+    '    uint32_t lo = 0;\n'                                                             +\
+    '    uint32_t hi = NODE_CHILD_COUNT(node);\n'                                        +\
+    '\n'                                                                                 +\
+    '    // lower bound: first child that does not sort before word\n'                   +\
+    '    while (lo < hi)\n'                                                              +\
+    '    {\n'                                                                            +\
+    '        uint32_t mid = lo + ((hi - lo) / 2);\n'                                     +\
+    '        if (wordCompare(word, length, NODE_NAME(NODE_CHILD(node, mid))) > 0)\n'     +\
+    '        {\n'                                                                        +\
+    '            lo = mid + 1;\n'                                                        +\
+    '        }\n'                                                                        +\
+    '        else\n'                                                                     +\
+    '        {\n'                                                                        +\
+    '            hi = mid;\n'                                                            +\
+    '        }\n'                                                                        +\
+    '    }\n'                                                                            +\
+    '    if ((lo < NODE_CHILD_COUNT(node)) && wordMatches(word, length, NODE_NAME(NODE_CHILD(node, lo))))\n' +\
+    '    {\n'                                                                            +\
+    '        return NODE_CHILD(node, lo);\n'                                             +\
+    '    }\n'                                                                            +\
+    '    return NULL;\n'                                                                 +\
+    '}\n'
+
+# Perfect hash dispatch: the command word is hashed once (seeded FNV-1a), the upper bits pick a
+#   bucket whose displacement is mixed in (murmur3 finalizer) to select a slot holding the
+#   child index + 1. The table is searched at generation time, so no two children share a slot.
+#   The match is then verified with wordMatches() - no strcmp() in the lookup path
+HASH_FNV_OFFSET_BASIS   = 0x811C9DC5
+HASH_FNV_PRIME          = 0x01000193
+HASH_MAX_SEEDS          = 64
+HASH_MAX_DISPLACEMENT   = 0xFFFF
+
+HASH_NODE_FIELDS = '\n'                                                                +\
+    '    const uint32_t hashSeed;\n'                                                    +\
+    '    const uint32_t bucketMask;\n'                                                  +\
+    '    const uint32_t slotMask;\n'                                                    +\
+    '    const uint16_t* hashTable; // bucket displacements, then slots (child index + 1)'
+
+HASH_NODE_INITIALIZERS  = ', .hashSeed=SEED, .bucketMask=BUCKET_MASK, .slotMask=SLOT_MASK, .hashTable=VARNAME_HASH'
+HASH_TABLE_PROTO        = 'static const uint16_t VARNAME_HASH[] = {ENTRIES};'
+STR_NODE_HASH_PREFIX    = 'arrHash'
+
+LOOKUP_HASH = ''                                                                        +\
+    '/************************************************************************************/\n' +\
+    '/* Find the child of node matching a command word (generated perfect hash)          */\n' +\
+    '/************************************************************************************/\n' +\
+    'static const commandTreeNode_t* findChild(const commandTreeNode_t* node, const char* word, uint32_t length)\n' +\
+    '{\n'                                                                                +\
+    '    uint32_t hash = HASH_FNV_OFFSET_BASIS ^ node->hashSeed;\n'                      +\
+    '\n'                                                                                 +\
+    '    if (NULL == node->hashTable)\n'                                                 +\
+    '    {\n'                                                                            +\
+    '        return NULL;\n'                                                             +\
+    '    }\n'                                                                            +\
+    '    for (uint32_t i = 0; i < length; i++)\n'                                        +\
+    '    {\n'                                                                            +\
+    '        hash = (hash ^ (uint8_t)toupper((unsigned char)word[i])) * HASH_FNV_PRIME;\n' +\
+    '    }\n'                                                                            +\
+    '\n'                                                                                 +\
+    '    // displace by the bucket, then mix down to a slot\n'                           +\
+    '    uint32_t slot = hash ^ node->hashTable[(hash >> 16) & node->bucketMask];\n'     +\
+    '    slot ^= slot >> 16;\n'                                                          +\
+    '    slot *= 0x85EBCA6BUL;\n'                                                        +\
+    '    slot ^= slot >> 13;\n'                                                          +\
+    '    slot *= 0xC2B2AE35UL;\n'                                                        +\
+    '    slot ^= slot >> 16;\n'                                                          +\
+    '    uint16_t index = node->hashTable[node->bucketMask + 1 + (slot & node->slotMask)];\n' +\
+    '    if (0 == index)\n'                                                              +\
+    '    {\n'                                                                            +\
+    '        return NULL;\n'                                                             +\
+    '    }\n'                                                                            +\
+    '\n'                                                                                 +\
+    '    // a hash hit only names a candidate - the word itself must match\n'            +\
+    '    if (!wordMatches(word, length, NODE_NAME(NODE_CHILD(node, index - 1))))\n'      +\
+    '    {\n'                                                                            +\
+    '        return NULL;\n'                                                             +\
+    '    }\n'                                                                            +\
+    '    return NODE_CHILD(node, index - 1);\n'                                          +\
+    '}\n'
+
+HASH_DEFINES = ''                                                                       +\
+    '#define HASH_FNV_OFFSET_BASIS 0x{:08X}UL\n'.format(HASH_FNV_OFFSET_BASIS)           +\
+    '#define HASH_FNV_PRIME        0x{:08X}UL\n'.format(HASH_FNV_PRIME)                  +\
+    '\n'
+
+def hashWord(word, seed):
+    # FNV-1a over the bytes of word, matching findChild() in LOOKUP_HASH
+    value = HASH_FNV_OFFSET_BASIS ^ seed
+    for byte in word:
+        value = ((value ^ byte) * HASH_FNV_PRIME) & 0xFFFFFFFF
+    return value
+
+def hashSlot(value, displacement):
+    # murmur3 32-bit finalizer, matching findChild() in LOOKUP_HASH
+    value ^= displacement
+    value ^= value >> 16
+    value = (value * 0x85EBCA6B) & 0xFFFFFFFF
+    value ^= value >> 13
+    value = (value * 0xC2B2AE35) & 0xFFFFFFFF
+    value ^= value >> 16
+    return value
+
+def nextPowerOfTwo(value):
+    power = 1
+    while power < value:
+        power <<= 1
+    return power
+
+def perfectHash(words):
+    '''
+    Search a collision-free (seed, displacements, slots) table for words (unique byte strings).
+    Returns (seed, bucketMask, slotMask, displacements, slots) where slots[i] is the index into
+    words + 1, or 0 for an empty slot. Raises ValueError if no table can be found.
+    '''
+    slotCount = nextPowerOfTwo(len(words))
+    bucketCount = nextPowerOfTwo(max(1, len(words) // 2))
+    for seed in range(HASH_MAX_SEEDS):
+        hashes = [hashWord(word, seed) for word in words]
+        if len(set(hashes)) != len(hashes):
+            continue # two words share a full hash - no displacement can split them
+        buckets = [[] for _ in range(bucketCount)]
+        for index, value in enumerate(hashes):
+            buckets[(value >> 16) & (bucketCount - 1)].append(index)
+
+        displacements = [0] * bucketCount
+        slots = [0] * slotCount
+        placed = True
+        # place the largest buckets first, while the table is still mostly empty
+        for bucket in sorted(range(bucketCount), key=lambda b: -len(buckets[b])):
+            if 0 == len(buckets[bucket]):
+                break
+            for displacement in range(HASH_MAX_DISPLACEMENT + 1):
+                targets = [hashSlot(hashes[i], displacement) & (slotCount - 1) for i in buckets[bucket]]
+                if len(set(targets)) == len(targets) and all([0 == slots[t] for t in targets]):
+                    break
+            else:
+                placed = False
+                break
+            displacements[bucket] = displacement
+            for i, target in zip(buckets[bucket], targets):
+                slots[target] = i + 1
+        if placed:
+            return seed, bucketCount - 1, slotCount - 1, displacements, slots
+    raise ValueError('ERROR: No collision-free hash found for: {}'.format(words))
 
 # 'Address of' prefix we insert before variable names
 REF = '&'
 
 STR_COMMAND_PREFIX      = 'strCmd'
 STR_DESCRIPTION_PREFIX  = 'strDesc'
-STR_DECLARATION_PROTO   = 'static const char NAME[] = "STRING";'
+
+# Every string is interned once, by its text as emitted, into one pool (see poolStrings()): a string
+#   that is the tail of another is stored within it, and the command words of each children array sit
+#   side by side, in the order they are scanned. The pointer layout names each string's place in it
+STRING_POOL_PROTO       = 'static const char stringPool[] =\nENTRIES'
+POOL_STRING_PROTO       = '    "STRING"TERMINATOR // OFFSET'
+STR_REFERENCE_PROTO     = '#define NAME (stringPool + OFFSET)'
 
 # VARNAME_NODE prefix
 STR_NODE_PREFIX             = 'node'
@@ -125,36 +468,577 @@ NODE_CHILDREN_PROTO     = ''
     'static const commandTreeNode_t* VARNAME_CHILDREN[] = {CHILDREN};'
 
 # Declaration of a node - the children created above gets assigned in VARNAME_CHILDREN
+# NODE_INITIALIZERS carries the fields only some dispatch strategies add (e.g., HASH_NODE_INITIALIZERS)
 NODE_PROTO              = ''                                                    +\
     'static const commandTreeNode_t  VARNAME_NODE = { .name=STR_KEY, .desc=DESC, '  +\
-    '.method=METHOD, .argDesc=ARG_HELP, .childCount=COUNT_CHILDREN, .children=VARNAME_CHILDREN };'
+    '.method=METHOD, .argDesc=ARG_HELP, .childCount=COUNT_CHILDREN, .children=VARNAME_CHILDREN' +\
+    'NODE_INITIALIZERS };'
+
+# Node table layouts
+LAYOUT_POINTER = 'pointer'
+LAYOUT_COMPACT = 'compact'
+LAYOUT_IMAGE = 'image'
+LAYOUTS = (LAYOUT_POINTER, LAYOUT_COMPACT, LAYOUT_IMAGE)
+
+# Compact layout: one string pool, one method table and one node table, all addressed by uint16_t
+COMPACT_NONE            = 'COMPACT_NONE'
+COMPACT_LIMIT           = 0xFFFF # COMPACT_NONE itself
+COMPACT_METHOD_TABLE_PROTO  = 'static const Method_t methodTable[] = {METHODS};'
+COMPACT_NODE_TABLE_PROTO    = 'static const commandTreeNode_t nodeTable[] = {\nENTRIES\n};'
+COMPACT_NODE_PROTO          = ''                                                +\
+    '    { .name=STR_KEY, .desc=DESC, .argDesc=ARG_HELP, .method=METHOD, '          +\
+    '.firstChild=FIRST_CHILD, .childCount=COUNT_CHILDREN' + 'NODE_INITIALIZERS }, // VARNAME_NODE'
+# Root nodes keep their names, so '&node1' and gateway code such as 'rootNode = &nodeFooBar;' still work
+COMPACT_ROOT_PROTO          = '#define VARNAME_NODE (nodeTable[INDEX])'
+
+# Image layout: the compact layout's nodes and string pool serialised into a command table image
+#   (<output>.bin) that the console loads at run time, as described in CommandTreeTemplate.c. The
+#   console only carries the method table and its references to roots, by index. An image loads into
+#   any console with the same binding: the same methods, in the same order, and the same roots
+IMAGE_SUFFIX            = '.bin'
+IMAGE_MAGIC             = b'CTBL'
+IMAGE_VERSION           = 1
+# magic, version, header size, image size, checksum (CRC-32 of everything after it)
+IMAGE_PREFIX            = struct.Struct('<4sHHII')
+# binding, flags, node count, root count, method count, offset of the strings
+IMAGE_FIELDS            = struct.Struct('<IHHHHI')
+IMAGE_HEADER_SIZE       = IMAGE_PREFIX.size + IMAGE_FIELDS.size
+# name, desc, argDesc, method, firstChild, childCount
+IMAGE_NODE              = struct.Struct('<6H')
+IMAGE_NONE              = 0xFFFF
+IMAGE_FLAG_SORTED       = 0x0001
+IMAGE_ROOT_INDEX_SUFFIX = 'Index'
+IMAGE_BINDING_PROTO     = ''                                                    +\
+    '// This console\'s side of the command table image: the methods its nodes are bound to and the\n' +\
+    '//   roots it refers to, by index. Only images made for the same binding load\n' +\
+    '#define CONSOLE_IMAGE_BINDING BINDING_VALUE\n'                                +\
+    '#define CONSOLE_IMAGE_ROOTS ROOT_TOTAL\n'                                     +\
+    '#define CONSOLE_IMAGE_METHODS METHOD_TOTAL\n'                                 +\
+    '#define CONSOLE_IMAGE_SORTED SORTED_FLAG\n'                                   +\
+    '#ifndef CONSOLE_IMAGE_FILE\n'                                                 +\
+    '#define CONSOLE_IMAGE_FILE "IMAGE_PATH"\n'                                    +\
+    '#endif\n'                                                                     +\
+    'enum\n'                                                                       +\
+    '{\n'                                                                          +\
+    'ROOT_INDICES\n'                                                               +\
+    '};\n'                                                                         +\
+    'static const Method_t methodTable[] = {METHOD_ENTRIES};'
+IMAGE_ROOT_PROTO        = '#define VARNAME_NODE (*NODE_AT(INDEX))'
+
+# Sizes of the pointer layout on a 32-bit target: a commandTreeNode_t is five pointers and a
+#   uint32_t, a children array one pointer per child. A compact node is six uint16_t
+POINTER_SIZE            = 4
+POINTER_NODE_SIZE       = 6 * 4
+COMPACT_NODE_SIZE       = 6 * 2
+
+# Footprint report (<name>.footprint.json): the bytes each part of the console takes with pointers of
+#   a given width, in total and per top level command, estimated from the declarations as generated.
+#   Shared nodes, arrays, strings and methods are charged to the first command reaching them, so the
+#   commands add up to the total. Code can't be sized before it is compiled: stubs and argument
+#   parsers are charged a rough figure for a 32-bit MCU at -Os
+FOOTPRINT_SUFFIX        = '.footprint.json'
+FOOTPRINT_VERSION       = 1
+POINTER_SIZES           = (2, 4, 8)
+FOOTPRINT_CATEGORIES    = ('commandStrings', 'descriptions', 'nodes', 'children', 'hashTables', 'methodTable',
+    'help', 'stubs', 'parsers', 'profileCounters')
+# rodata and text are the console's const data and code, bss its counters, image what --layout image
+#   moves into <name>.bin. flash is rodata and text together
+FOOTPRINT_SECTIONS      = ('rodata', 'text', 'bss', 'image')
+FOOTPRINT_FLASH         = 'flash'
+# --budget takes any section, flash or category
+FOOTPRINT_BUDGETS       = FOOTPRINT_SECTIONS + (FOOTPRINT_FLASH,) + FOOTPRINT_CATEGORIES
+# what is not under any command: the roots, their children and the help blocks
+FOOTPRINT_CONSOLE       = '(console)'
+STUB_CODE_ESTIMATE      = 16
+PARSER_CODE_ESTIMATE    = 24
+PARSER_ARGUMENT_CODE_ESTIMATE   = 16
+STUB_MESSAGE            = 'You have called: {}\n'
+# uint32_t hits, calls, maxTicks; uint64_t ticks
+PROFILE_COUNTER_FIELDS  = (4, 4, 4, 8)
+
+# Precomputed help: every node's whole help output is rendered at generation time (as printHelp()
+#   would print it), identical blocks stored once in one pool, and printHelp() writes a block in one go
+HELP_NODE_FIELDS        = '\n    const uint16_t help; // help block (index into helpTable)'
+HELP_NODE_INITIALIZERS  = ', .help=INDEX'
+HELP_POOL_PROTO         = 'static const char helpPool[] =\nENTRIES'
+HELP_COMPRESSED_POOL_PROTO  = 'static const uint8_t helpPool[] =\nENTRIES'
+HELP_TABLE_PROTO        = 'static const consoleHelp_t helpTable[] = {\nENTRIES\n};'
+HELP_ENTRY_PROTO        = '    { .offset=OFFSET, .length=LENGTH },'
+# a consoleHelp_t: uint32_t offset, length
+HELP_ENTRY_FIELDS       = (4, 4)
+HELP_LIMIT              = 0xFFFF
+HELP_HEADER             = 'HELP:\n'
+HELP_TITLE              = '{} - {}\n'
+HELP_ARGS               = 'ARGS:\n  {}\n'
+HELP_NO_ARGS            = 'ARGS:\nNone\n'
+HELP_CHILD              = '  -> {} - {}\n'
+
+# Compressed help: the help blocks are byte pair encoded with one dictionary built at generation time.
+#   A code at or above HELP_PAIR_BASE (bytes the text never uses) stands for the two codes in helpPairs,
+#   which may themselves be pairs; printHelp() expands them into a small chunk buffer
+HELP_PAIRS_PROTO        = '#define HELP_PAIR_BASE CODE_BASE\n#define HELP_PAIR_STACK DEPTH\n' +\
+    'static const uint8_t helpPairs[][2] = {\nENTRIES\n};'
+HELP_PAIR_PROTO         = '    { FIRST, SECOND }, // CODE'
+# a pair must be used this often to save anything: it costs two bytes of dictionary
+HELP_PAIR_MIN_COUNT     = 3
+HELP_CODES              = 256
+# Descriptions then live only in the help blocks: nodes keep an empty argument description, as
+#   callMethod() only checks that a method has one
+HELP_COMPRESSED_ARG_HELP    = '""'
+
+# Profiling: every node gets counters (see NODE_PROFILE_INDEX()), and every root a built-in STATS
+#   command printing them. <name>.profile.json maps the counters back to command paths
+PROFILE_NODE_FIELDS     = '\n    const uint32_t profileIndex; // counters (index into consoleProfile)'
+PROFILE_NODE_INITIALIZERS   = ', .profileIndex=INDEX'
+PROFILE_COMMAND         = 'Stats'
+PROFILE_DESCRIPTION     = 'Print how often each command was used and how long its method took'
+PROFILE_METHOD          = 'ConsoleStats'
+PROFILE_SUFFIX          = '.profile.json'
+PROFILE_VERSION         = 1
+PROFILE_LINE_PREFIX     = 'STATS '
+
+def cString(text):
+    # Contents of a C string literal holding text
+    return text.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def cBytes(data):
+    # Contents of a C string literal holding arbitrary bytes (octal escapes can't run into the next character)
+    text = []
+    for byte in data:
+        char = chr(byte)
+        if '\n' == char:
+            text.append('\\n')
+        elif char in '\\"?':
+            # '?' too, so no trigraph is ever formed
+            text.append('\\' + char)
+        elif ' ' <= char <= '~':
+            text.append(char)
+        else:
+            text.append('\\{:03o}'.format(byte))
+    return ''.join(text)
+
+def pairEncode(blocks):
+    '''
+    Byte pair encode blocks (each a bytes object) with one shared dictionary: repeatedly replace the
+    most frequent adjacent pair of codes with a code no block uses, while that saves space. Blocks are
+    encoded separately, so each one decodes on its own. Returns (encoded, pairs, base, depth) where pairs[i]
+    is what code base + i stands for and depth is how deeply pairs nest.
+    '''
+    encoded = list(blocks)
+    base = max([max(block) for block in blocks if block] + [0]) + 1
+    pairs = []
+    depths = {}
+    while base + len(pairs) < HELP_CODES:
+        counts = collections.Counter()
+        for block in encoded:
+            counts.update(zip(block, block[1:]))
+        if not counts:
+            break
+        pair, count = counts.most_common(1)[0]
+        if count < HELP_PAIR_MIN_COUNT:
+            break
+        code = base + len(pairs)
+        pairs.append(pair)
+        depths[code] = 1 + max(depths.get(pair[0], 0), depths.get(pair[1], 0))
+        # bytes.replace() works left to right without overlaps, as a decoder reading the pair back expects
+        encoded = [block.replace(bytes(pair), bytes((code,))) for block in encoded]
+    return encoded, pairs, base, max(list(depths.values()) + [0])
+
+def buildStringPool(strings, limit=COMPACT_LIMIT):
+    '''
+    Pack strings into one NUL separated pool, storing a string that is the tail of another
+    (e.g., 'OPEN' in 'REOPEN') only once. Returns (pool, offsets) where pool lists the
+    (offset, string) entries in order and offsets maps every string to its byte offset.
+    The pool may not pass limit bytes (None for no limit).
+    '''
+    unique = list(dict.fromkeys(strings))
+    # sorting the reversed strings puts every string right before the strings it is a tail of
+    byTail = sorted(unique, key=lambda string: string[::-1])
+    owners = {}
+    for i in range(len(byTail) - 1, -1, -1):
+        string = byTail[i]
+        if i + 1 < len(byTail) and byTail[i + 1].endswith(string):
+            owners[string] = owners[byTail[i + 1]]
+        else:
+            owners[string] = string
+    # byte lengths: an ASCII string's is its length, without encoding it
+    sizes = {string: len(string) if string.isascii() else len(string.encode('utf-8')) for string in unique}
+
+    pool = []
+    offsets = {}
+    size = 0
+    for string in unique:
+        if owners[string] == string:
+            offsets[string] = size
+            pool.append((size, string))
+            size += sizes[string] + 1
+    for string in unique:
+        owner = owners[string]
+        offsets[string] = offsets[owner] + sizes[owner] - sizes[string]
+    if limit is not None and size > limit:
+        raise ValueError('ERROR: String pool of {} bytes exceeds the compact layout limit'.format(size))
+    return pool, offsets
+
+def checkImage(image, binding=None):
+    '''
+    Validate a command table image the way consoleLoadImage() does (and check sorted children are
+    sorted), without a compiler. binding, if given, is the binding of the console that will load it.
+    Raises ValueError on the first problem; returns the header fields as a dict.
+    '''
+    def fail(problem):
+        raise ValueError('ERROR: Invalid command table image: {}'.format(problem))
+
+    if len(image) < IMAGE_HEADER_SIZE:
+        fail('{} bytes is shorter than the header'.format(len(image)))
+    magic, version, headerSize, size, checksum = IMAGE_PREFIX.unpack_from(image)
+    if IMAGE_MAGIC != magic:
+        fail('bad magic {!r}'.format(magic))
+    if IMAGE_VERSION != version or IMAGE_HEADER_SIZE != headerSize:
+        fail('version {} with a {} byte header is not supported'.format(version, headerSize))
+    if size > len(image) or size <= IMAGE_HEADER_SIZE:
+        fail('image size {} does not fit the {} bytes given'.format(size, len(image)))
+    if zlib.crc32(image[IMAGE_PREFIX.size:size]) != checksum:
+        fail('checksum mismatch')
+    fields = dict(zip(('binding', 'flags', 'nodes', 'roots', 'methods', 'strings'),
+        IMAGE_FIELDS.unpack_from(image, IMAGE_PREFIX.size)))
+    if binding is not None and binding != fields['binding']:
+        fail('binding 0x{:08X} is not the console\'s 0x{:08X}'.format(fields['binding'], binding))
+    if fields['roots'] < 1 or fields['roots'] > fields['nodes']:
+        fail('{} roots for {} nodes'.format(fields['roots'], fields['nodes']))
+    if IMAGE_HEADER_SIZE + fields['nodes'] * IMAGE_NODE.size != fields['strings'] or fields['strings'] >= size:
+        fail('strings at {} do not follow {} nodes'.format(fields['strings'], fields['nodes']))
+    if 0 != image[size - 1]:
+        fail('the last string is not terminated')
+
+    strings = image[fields['strings']:size]
+    nodes = [IMAGE_NODE.unpack_from(image, IMAGE_HEADER_SIZE + i * IMAGE_NODE.size) for i in range(fields['nodes'])]
+    for i, (name, desc, argDesc, method, firstChild, childCount) in enumerate(nodes):
+        if name >= len(strings) or desc >= len(strings) or (IMAGE_NONE != argDesc and argDesc >= len(strings)):
+            fail('node {} has a string outside the pool'.format(i))
+        if IMAGE_NONE != method:
+            if method >= fields['methods'] or 0 != childCount:
+                fail('node {} has method {} of {} (and {} children)'.format(i, method, fields['methods'], childCount))
+        elif firstChild + childCount > fields['nodes']:
+            fail('node {} has children {}..{} of {} nodes'.format(i, firstChild, firstChild + childCount - 1,
+                fields['nodes']))
+        elif IMAGE_FLAG_SORTED & fields['flags']:
+            names = [strings[nodes[child][0]:strings.index(b'\0', nodes[child][0])]
+                for child in range(firstChild, firstChild + childCount)]
+            if names != sorted(names):
+                fail('node {} has unsorted children'.format(i))
+    fields['size'] = size
+    return fields
+
+# Placeholders filled in at write time
+TEMPLATE_DATE               = 'CODE_GENERATION_DATE'
+TEMPLATE_FILENAME           = 'FILENAME_PLACEHOLDER'
+
+# Placeholders of the shards and their shared header
+TEMPLATE_SHARED_HEADER      = 'SHARED_HEADER'
+TEMPLATE_SHARD_DECLARATIONS = 'SHARD_DECLARATIONS'
+TEMPLATE_SHARD_DEFINITIONS  = 'SHARD_DEFINITIONS'
+
+# Placeholders of the multi-session test harness
+TEMPLATE_CONSOLE_SOURCE     = 'CONSOLE_SOURCE'
+TEMPLATE_HARNESS_SOURCE     = 'HARNESS_SOURCE'
+TEMPLATE_HARNESS_SCRIPT     = 'HARNESS_SCRIPT'
+TEMPLATE_HARNESS_ROOTS      = 'HARNESS_ROOTS'
+
+# Every placeholder that may appear in one of the template files
+TEMPLATE_FILE_SLOTS = (TEMPLATE_METHOD_FORWARDS, TEMPLATE_STRINGS, TEMPLATE_HEADER_EXT, TEMPLATE_NODES,
+    TEMPLATE_METHOD_STUBS, TEMPLATE_PARSING_ROUTINES, TEMPLATE_CHILD_LOOKUP, TEMPLATE_NODE_FIELDS,
+    TEMPLATE_CONFIGURATION, TEMPLATE_ARGUMENT_PARSERS, TEMPLATE_ENDPOINT_DECLARATIONS, TEMPLATE_ENDPOINT_TABLES,
+    TEMPLATE_TYPES, TEMPLATE_DATE, TEMPLATE_FILENAME, TEMPLATE_SHARED_HEADER, TEMPLATE_SHARD_DECLARATIONS,
+    TEMPLATE_SHARD_DEFINITIONS, TEMPLATE_CONSOLE_SOURCE, TEMPLATE_HARNESS_SOURCE, TEMPLATE_HARNESS_SCRIPT,
+    TEMPLATE_HARNESS_ROOTS)
+
+# Prototypes compiled once, rendered per declaration
+INCLUDE_HEADER_TEMPLATE     = CodeTemplate(INCLUDE_HEADER, ('FILENAME',))
+METHOD_FORWARD_TEMPLATE     = CodeTemplate(METHOD_FORWARD, ('RETURN_TYPE', 'FUNCTION', 'PARAMETERS'))
+METHOD_PROTO_TEMPLATE       = CodeTemplate(METHOD_PROTO,
+    ('DESC_PLACEHOLDER', 'RETURN_TYPE', 'FUNCTION', 'PARAMETERS', 'PARAM_PLACEHOLDER', 'INPUT_VERIFICATION_METHOD',
+     'RESULT'))
+ARGUMENT_PARSER_TEMPLATE    = CodeTemplate(ARGUMENT_PARSER_PROTO, ('PARSER', 'DECLARATIONS', 'CONDITIONS', 'CALL'))
+METHOD_CALL_TEMPLATE        = CodeTemplate(METHOD_CALL, ('FUNCTION', 'VALUES'))
+GATEWAY_CALL_TEMPLATE       = CodeTemplate(GATEWAY_CALL, ('VARNAME_TABLE', 'FUNCTION', 'VALUES'))
+GATEWAY_RESULT_TEMPLATE     = CodeTemplate(GATEWAY_RESULT, ('VARNAME_TABLE', 'NAME_PARAM'))
+ENDPOINT_DECLARATION_TEMPLATE = CodeTemplate(ENDPOINT_DECLARATION_PROTO, ('FUNCTION', 'ENUMERATORS', 'VARNAME_TABLE'))
+ENDPOINT_TABLE_TEMPLATE     = CodeTemplate(ENDPOINT_TABLE_PROTO,
+    ('ROOTS_AND_NAMES', 'VARNAME_TABLE', 'COUNT', 'VARNAME_ROOTS', 'VARNAME_NAMES'))
+ENDPOINT_ARRAYS_TEMPLATE    = CodeTemplate(ENDPOINT_ARRAYS_PROTO, ('VARNAME_ROOTS', 'ROOTS', 'VARNAME_NAMES', 'NAMES'))
+STRING_POOL_TEMPLATE        = CodeTemplate(STRING_POOL_PROTO, ('ENTRIES',))
+POOL_STRING_TEMPLATE        = CodeTemplate(POOL_STRING_PROTO, ('STRING', 'TERMINATOR', 'OFFSET'))
+STR_REFERENCE_TEMPLATE      = CodeTemplate(STR_REFERENCE_PROTO, ('NAME', 'OFFSET'))
+NODE_CHILDREN_TEMPLATE      = CodeTemplate(NODE_CHILDREN_PROTO, ('VARNAME_CHILDREN', 'CHILDREN'))
+NODE_TEMPLATE               = CodeTemplate(NODE_PROTO,
+    ('VARNAME_NODE', 'STR_KEY', 'DESC', 'METHOD', 'ARG_HELP', 'COUNT_CHILDREN', 'VARNAME_CHILDREN',
+     'NODE_INITIALIZERS'))
+HASH_NODE_INITIALIZERS_TEMPLATE = CodeTemplate(HASH_NODE_INITIALIZERS,
+    ('SEED', 'BUCKET_MASK', 'SLOT_MASK', 'VARNAME_HASH'))
+HASH_TABLE_TEMPLATE         = CodeTemplate(HASH_TABLE_PROTO, ('VARNAME_HASH', 'ENTRIES'))
+COMPACT_METHOD_TABLE_TEMPLATE   = CodeTemplate(COMPACT_METHOD_TABLE_PROTO, ('METHODS',))
+COMPACT_NODE_TABLE_TEMPLATE     = CodeTemplate(COMPACT_NODE_TABLE_PROTO, ('ENTRIES',))
+COMPACT_NODE_TEMPLATE           = CodeTemplate(COMPACT_NODE_PROTO,
+    ('STR_KEY', 'DESC', 'ARG_HELP', 'METHOD', 'FIRST_CHILD', 'COUNT_CHILDREN', 'NODE_INITIALIZERS', 'VARNAME_NODE'))
+COMPACT_ROOT_TEMPLATE           = CodeTemplate(COMPACT_ROOT_PROTO, ('VARNAME_NODE', 'INDEX'))
+IMAGE_BINDING_TEMPLATE          = CodeTemplate(IMAGE_BINDING_PROTO, ('BINDING_VALUE', 'ROOT_TOTAL', 'METHOD_TOTAL',
+    'SORTED_FLAG', 'IMAGE_PATH', 'ROOT_INDICES', 'METHOD_ENTRIES'))
+IMAGE_ROOT_TEMPLATE             = CodeTemplate(IMAGE_ROOT_PROTO, ('VARNAME_NODE', 'INDEX'))
+HELP_NODE_INITIALIZERS_TEMPLATE = CodeTemplate(HELP_NODE_INITIALIZERS, ('INDEX',))
+PROFILE_NODE_INITIALIZERS_TEMPLATE = CodeTemplate(PROFILE_NODE_INITIALIZERS, ('INDEX',))
+HELP_POOL_TEMPLATE              = CodeTemplate(HELP_POOL_PROTO, ('ENTRIES',))
+HELP_COMPRESSED_POOL_TEMPLATE   = CodeTemplate(HELP_COMPRESSED_POOL_PROTO, ('ENTRIES',))
+HELP_TABLE_TEMPLATE             = CodeTemplate(HELP_TABLE_PROTO, ('ENTRIES',))
+HELP_ENTRY_TEMPLATE             = CodeTemplate(HELP_ENTRY_PROTO, ('OFFSET', 'LENGTH'))
+HELP_PAIRS_TEMPLATE             = CodeTemplate(HELP_PAIRS_PROTO, ('CODE_BASE', 'DEPTH', 'ENTRIES'))
+HELP_PAIR_TEMPLATE              = CodeTemplate(HELP_PAIR_PROTO, ('FIRST', 'SECOND', 'CODE'))
+
+# Incremental generation manifest, kept next to the console source
+MANIFEST_SUFFIX             = '.manifest.json'
+MANIFEST_VERSION            = 1
+
+# The test harness is written next to the console source as <name>Harness.c
+HARNESS_SUFFIX              = 'Harness.c'
+HARNESS_ARGUMENT            = '1'
+HARNESS_HEX_ARGUMENT        = '0x1'
+HARNESS_MAX_PATHS           = 256
+# Lines every harness script ends with: an unknown command, an empty line, and a QUIT
+HARNESS_TRAILER             = ('NOSUCHCOMMAND', '', 'quit')
+
+# Sharded output: <output>Shared.h and <output>Shard<n>.c. Everything moved to a shard loses its 'static'
+#   and is declared in the shared header instead
+SHARD_HEADER_SUFFIX         = 'Shared.h'
+SHARD_SOURCE_SUFFIX         = 'Shard{}.c'
+SHARD_STATIC                = 'static '
+
+def structSize(fields):
+    # sizeof() a struct of the given scalar field sizes, each aligned to its own size
+    size = 0
+    for field in fields:
+        size += -size % field + field
+    return size + -size % max(fields)
+
+def paramType(param):
+    # The C type a method takes a parameter as: its own, or the raw word (PARAM_RAW_TYPE) when no
+    #   parsing routine converts to it
+    declared = param['type'].strip()
+    if declared in PARAM_INTEGER_TYPES or declared in PARAM_REAL_TYPES or declared in PARAM_BOOL_TYPES or \
+            declared in PARAM_STRING_TYPES:
+        return declared
+    return PARAM_RAW_TYPE
+
+def methodSignature(params):
+    # What a binding of a method fixes, descriptions aside: the name, type and format of each parameter
+    return [(param['name'], param['type'].strip(), param.get('format')) for param in params]
+
+def endpointSignature(endpoints):
+    # The endpoints a Gateway method enters, as its table lists them (None if not a Gateway)
+    return None if endpoints is None else sorted([endpoint.upper() for endpoint in endpoints])
+
+def methodKey(method, description, params, endpoints=None):
+    # What the code of a method (see genConsole.createMethodCode()) is kept under in a GeneratorCache
+    return ('method', method, description, repr(params), None if endpoints is None else tuple(endpoints))
+
+def externDeclaration(definition):
+    # The declaration of a definition moved to a shard: 'static const T name[] = {...};' (or
+    #   'static const T name[] =\n...;') is declared 'extern const T name[];' and
+    #   'static bool f(char* args)\n{...}' is declared 'bool f(char* args);'
+    head = definition.split('\n', 1)[0]
+    if not head.startswith(SHARD_STATIC):
+        raise ValueError('ERROR: Only static definitions can be moved to a shard: {}'.format(head))
+    head = head[len(SHARD_STATIC):]
+    if ' =' in head:
+        return EXTERN_METHOD_PROTO + head[:head.index(' =')] + ';'
+    return head + ';'
+
+# Every template file, as read by TemplateCache.load()
+TEMPLATE_FILES = (TEMPLATE_FILE, TEMPLATE_METHOD_HEADER_FILE, TEMPLATE_METHOD_SOURCE_FILE, TEMPLATE_PARSER_SOURCE_FILE,
+    TEMPLATE_HARNESS_FILE, TEMPLATE_TYPES_FILE, TEMPLATE_SHARD_HEADER_FILE, TEMPLATE_SHARD_SOURCE_FILE)
+
+class TemplateCache:
+    '''
+    The template files of a directory, each read and compiled into a
+    CodeTemplate the first time it is asked for. Generators handed the
+    same cache (e.g., every job of a batch) share the compiled templates
+    instead of reading them again.
+    '''
+    def __init__(self, directory='.'):
+        self.directory = directory
+        self.texts = {}
+        self.templates = {}
+        # modification time of each template file when it was read
+        self.mtimes = {}
+
+    def load(self):
+        # Read and compile every template up front (e.g., before handing the cache to worker processes)
+        for name in TEMPLATE_FILES:
+            self.template(name)
+        return self
+
+    def text(self, name):
+        if name not in self.texts:
+            self.mtimes[name] = self.mtime(name)
+            with open(os.path.join(self.directory, name)) as fin:
+                self.texts[name] = fin.read()
+        return self.texts[name]
+
+    def mtime(self, name):
+        try:
+            return os.stat(os.path.join(self.directory, name)).st_mtime_ns
+        except OSError:
+            return None
+
+    def refresh(self):
+        # Forget every template whose file changed since it was read, so it is read again when next
+        #   asked for. Returns the names of those templates
+        changed = [name for name, mtime in self.mtimes.items() if self.mtime(name) != mtime]
+        for name in changed:
+            del self.mtimes[name]
+            self.texts.pop(name, None)
+            self.templates.pop(name, None)
+        return changed
+
+    def template(self, name):
+        if name not in self.templates:
+            self.templates[name] = CodeTemplate(self.text(name), TEMPLATE_FILE_SLOTS)
+        return self.templates[name]
+
+class GeneratorCache:
+    '''
+    What generating takes from parts of a spec that depends on nothing
+    else: what is read from each <command> element (for as long as the
+    element lives), and the code of every method and the hash table of
+    every set of command words. Generators with the same options handed
+    the same cache (e.g., every run of a ConsoleWatcher) take these from
+    it instead of working them out again.
+    '''
+    def __init__(self):
+        self.commands = weakref.WeakKeyDictionary()
+        self.code = {}
+        # The nodes built for each top level <command> element, kept for as long as it lives as the
+        #   steps that built them (see genConsole.replayFragment()), and the console's root node
+        self.fragments = weakref.WeakKeyDictionary()
+        self.root = None
 
 #############################################################
 
 class genConsole:
 
-    def __init__(self, inputPath, outputPath, externalize):
+    def __init__(self, inputPath, outputPath, externalize, stream=False, reportMemory=False, incremental=False,
+                 dispatch=DISPATCH_LINEAR, layout=LAYOUT_POINTER, harness=False, byteInput=False, helpBlocks=False,
+                 compressHelp=False, shards=1, profile=False, script=False, footprint=False, pointerSize=POINTER_SIZE, budgets=None,
+                 templates=None, cache=None):
+        if dispatch not in DISPATCH_STRATEGIES:
+            raise ValueError('UNKNOWN DISPATCH STRATEGY: {}'.format(dispatch))
+        if layout not in LAYOUTS:
+            raise ValueError('UNKNOWN LAYOUT: {}'.format(layout))
+        if LAYOUT_IMAGE == layout and (DISPATCH_HASH == dispatch or helpBlocks or compressHelp):
+            # hash tables and help blocks are generated code, which an image can't replace
+            raise ValueError('ERROR: The image layout supports linear and binary dispatch, without help blocks')
+        if shards < 1 or (shards > 1 and LAYOUT_POINTER != layout):
+            # the compact layout's tables are single arrays
+            raise ValueError('ERROR: {} shards requested; only the pointer layout can be split'.format(shards))
+        if pointerSize not in POINTER_SIZES:
+            raise ValueError('ERROR: {} byte pointers; the footprint is estimated for {}'.format(pointerSize, POINTER_SIZES))
+        budgets = dict(budgets or {})
+        unknown = set(budgets) - set(FOOTPRINT_BUDGETS)
+        if unknown:
+            raise ValueError('ERROR: Unknown budgets {}; budgets are set for {}'.format(sorted(unknown), FOOTPRINT_BUDGETS))
         self.inputPath = inputPath
         self.outputPath = outputPath
         self.externalize = externalize
+        self.dispatch = dispatch
+        self.layout = layout
+        self.stream = stream
+        self.reportMemory = reportMemory
+        self.incremental = incremental
+        self.harness = harness
+        self.byteInput = byteInput
+        # compressed help is made of the help blocks
+        self.helpBlocks = helpBlocks or compressHelp
+        self.compressHelp = compressHelp
+        self.shards = shards
+        self.profile = profile
+        self.script = script
+        self.footprint = footprint
+        self.pointerSize = pointerSize
+        self.budgets = budgets
+        self.templates = templates if templates is not None else TemplateCache()
+        self.cache = cache
         if self.externalize:
             if -1 == self.outputPath.find('.c'):
                 self.methodHeaderPath = self.outputPath + 'Methods.h'
                 self.outputPath += '.c'
             else:
                 self.methodHeaderPath = self.outputPath[:self.outputPath.find('.')] + 'Methods.h'
+            self.methodSourcePath = self.methodHeaderPath.replace('.h', '.c')
+        self.manifestPath = self.outputPath + MANIFEST_SUFFIX
+        self.harnessPath = os.path.splitext(self.outputPath)[0] + HARNESS_SUFFIX
+        self.imagePath = os.path.splitext(self.outputPath)[0] + IMAGE_SUFFIX
+        self.profilePath = os.path.splitext(self.outputPath)[0] + PROFILE_SUFFIX
+        self.footprintPath = os.path.splitext(self.outputPath)[0] + FOOTPRINT_SUFFIX
+        self.sharedHeaderPath = os.path.splitext(self.outputPath)[0] + SHARD_HEADER_SUFFIX
+        self.shardPaths = [os.path.splitext(self.outputPath)[0] + SHARD_SOURCE_SUFFIX.format(i + 1)
+            for i in range(shards)] if shards > 1 else []
 
         self.codeMethodImplementations = []
         self.codeMethodForwardDeclarations = []
-        self.codeCmdStringDeclarations = []
-        self.codeDescStringDeclarations = []
+        self.codeArgumentParsers = []
+        self.codeEndpointDeclarations = []
+        self.codeEndpointTables = []
+        self.gatewayEndpoints = {}
+        self.helpBlockIndex = {}
         self.codeNodeDeclarations = []
-        self.cmdStringMap = {}
-        self.descriptionStringMap = {}
+        # The steps of the top level command being processed, when kept in the cache (see record())
+        self.fragment = None
+        # {text: strVarName} of every string, and how many of each StringType were named
+        self.stringVarNames = {}
+        self.stringCounts = collections.Counter()
+        # (offset, string) entries of the string pool (see poolStrings())
+        self.stringPool = []
         self.flattenedTree = []
         self.rootNodes = []
+        self.methodParams = {}
+        # {method: the command that first bound it} (see createFunctionPrototype())
+        self.methodCommands = {}
+        # {method: the endpoints it enters, None if not a Gateway}
+        self.methodEndpoints = {}
+        self.hashTables = {}
+        self.hashTableSizes = {}
+        self.helpSize = 0
+        self.profileIndices = {}
+        # Seconds spent in each phase of generation (see phase())
+        self.phaseTimes = {}
+        self.phaseStack = []
+        self.phaseStarted = 0.0
+
+    @contextlib.contextmanager
+    def phase(self, name):
+        # Time the enclosed code as phase name. A phase entered within another pauses it, so every
+        #   phase is charged its own time only
+        now = time.perf_counter()
+        if self.phaseStack:
+            outer = self.phaseStack[-1]
+            self.phaseTimes[outer] = self.phaseTimes.get(outer, 0.0) + now - self.phaseStarted
+        self.phaseStack.append(name)
+        self.phaseStarted = now
+        try:
+            yield
+        finally:
+            now = time.perf_counter()
+            name = self.phaseStack.pop()
+            self.phaseTimes[name] = self.phaseTimes.get(name, 0.0) + now - self.phaseStarted
+            self.phaseStarted = now
 
     def debugPrintNode(self, node):
+        # Pre-order, walked with an explicit stack so deep trees don't hit the recursion limit
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            self.debugPrintNodeFields(node)
+            stack.extend(reversed(node.children))
+
+    def debugPrintNodeFields(self, node):
         print('NAME: {}'.format(node.name))
         if node.parent is None:
             print('  PARENT: None')
@@ -176,13 +1060,15 @@ class genConsole:
         else:
             print('  STRVARBRANCHARRAYNAME: NONE')
         print('  ARRSTRVARNODENAMES[]: {}'.format(node.arrStrVarNodeNames))
-        print('  {} CHILDREN - CALLING NOW'.format(len(node.children)))
-        for child in node.children:
-            self.debugPrintNode(child)
+        print('  {} CHILDREN'.format(len(node.children)))
 
-    def createBranchNode(self, parent, varCmd, varDesc, name=None):
-        # python N-ary tree maintenance
-        node = Node(varCmd)
+    def createBranchNode(self, parent, varCmd, varDesc, name=None, node=None):
+        # python N-ary tree maintenance. node, built by an earlier run (see replayFragment()), is reset
+        #   and reused
+        if node is None:
+            node = Node(varCmd)
+        else:
+            node.__init__(varCmd)
         node.setParent(parent)
         node.setDescription(varDesc)
         # create variable name for the commandTreeNode_t declaration
@@ -195,13 +1081,30 @@ class genConsole:
         # Create a variable name for the array object if it does not exist
         if ( parent.strVarBranchArrayName is None ):
             parent.strVarBranchArrayName = STR_NODE_CHILDREN_PREFIX + str(len(self.flattenedTree) + 1)
-        # Add this new node to the parent's array object
-        parent.arrStrVarNodeNames.append(node.strVarNodeName)
         # Add the new node to the flattened Node Tree array
         self.flattenedTree.append(node)
 
         return node
 
+    def addRoot(self, name=None, root=None):
+        # A new N-ary tree (the console's, or an endpoint's named name): returns its root node.
+        #   root, built by an earlier run, is reset and reused
+        if root is None:
+            tree = Node()
+        else:
+            tree = root.parent
+            tree.__init__()
+        self.rootNodes.append(tree)
+        return self.createBranchNode(tree, None, None, name, root)
+
+    def addCommand(self, parent, cmdName, description, node=None):
+        # The node of a command under parent (see createBranchNode() for node)
+        strVarCmdName = self.getStringVarName(StringType.STR_COMMAND, cmdName)
+        strVarDescName = self.getStringVarName(StringType.STR_DESCRIPTION, description)
+        node = self.createBranchNode(parent, strVarCmdName, strVarDescName, node=node)
+        node.command = cmdName.upper()
+        return node
+
     def convertMethodNode(self, node, methodName, hasParams=False, paramsDesc=''):
         node.isMethod = True
         node.methodName = methodName
@@ -217,358 +1120,1583 @@ class genConsole:
         node.strVarParamDesc = self.getStringVarName(StringType.STR_DESCRIPTION, paramsDesc)
         node.endPoints = endpoints
 
-    def createFunctionPrototype(self, method, description, params, endpointNames=None):
+    def createArgumentParser(self, method, params, gateway=False):
+        # The parser the command tree calls for a method: converts each argument to its parameter's
+        #   type (range checked) and calls the method with the values. No arguments means NULL.
+        #   A Gateway's result is the endpoint to enter
+        declarations = ''
+        conditions = []
+        values = []
+        for param in params:
+            paramType = param['type'].strip()
+            paramFormat = param.get('format')
+            if paramFormat not in PARAM_FORMATS:
+                raise ValueError('ERROR: Unknown format {} for parameter {} of {}'.format(paramFormat, param['name'], method))
+            if paramType in PARAM_INTEGER_TYPES:
+                routine, limits, valueType = PARAM_INTEGER_TYPES[paramType]
+                declarations += '    {} {};\n'.format(valueType, param['name'])
+                conditions.append('!{}(&args, {}, {}, &{})'.format(routine, PARAM_FORMATS[paramFormat], limits, param['name']))
+                values.append('({}){}'.format(paramType, param['name']))
+            elif paramType in PARAM_REAL_TYPES:
+                declarations += '    double {};\n'.format(param['name'])
+                conditions.append('!parseReal(&args, {}, &{})'.format(PARAM_REAL_TYPES[paramType], param['name']))
+                values.append('({}){}'.format(paramType, param['name']))
+            elif paramType in PARAM_BOOL_TYPES:
+                declarations += '    bool {};\n'.format(param['name'])
+                conditions.append('!parseBool(&args, &{})'.format(param['name']))
+                values.append(param['name'])
+            else:
+                # strings, and the raw word for any other type (see paramType())
+                declarations += '    char* {};\n'.format(param['name'])
+                conditions.append('!parseString(&args, &{})'.format(param['name']))
+                values.append(param['name'])
+
+        if len(params) > 0:
+            declarations += '\n'
+            conditions.append(ARGUMENTS_END)
+        else:
+            conditions.append(ARGUMENTS_ABSENT)
+
+        callValues = {'FUNCTION': method, 'VALUES': ', '.join(values), 'VARNAME_TABLE': STR_ENDPOINT_TABLE_PREFIX + method}
+        return ARGUMENT_PARSER_TEMPLATE.render({
+            'PARSER': ARGUMENT_PARSER_PREFIX + method,
+            'DECLARATIONS': declarations,
+            'CONDITIONS': ' ||\n        '.join(conditions),
+            'CALL': GATEWAY_CALL_TEMPLATE.render(callValues) if gateway else METHOD_CALL_TEMPLATE.render(callValues)})
+
+    def rootReference(self, strVarNode):
+        # A root as a consoleRoot_t: its address, or its index once in an image
+        if LAYOUT_IMAGE == self.layout:
+            return strVarNode + IMAGE_ROOT_INDEX_SUFFIX
+        return REF + strVarNode
+
+    def createEndpointTable(self, method, endpoints):
+        # Endpoint enum (sorted by name, so the names can be binary searched) and the table mapping
+        #   each to its root node. Returns (names, enum declaration, table)
+        names = sorted([endpoint.upper() for endpoint in endpoints])
+        if len(set(names)) != len(names):
+            raise ValueError('ERROR: Duplicate endpoint names (ignoring case) under Gateway {}'.format(method))
+        rootNames = {endpoint.upper(): STR_NODE_PREFIX + endpoint for endpoint in endpoints}
+        varTable = STR_ENDPOINT_TABLE_PREFIX + method
+        enumerators = ['    {}_{} = {}'.format(method.upper(), name, i) for i, name in enumerate(names)]
+        declaration = ENDPOINT_DECLARATION_TEMPLATE.render({
+            'FUNCTION': method, 'ENUMERATORS': ',\n'.join(enumerators), 'VARNAME_TABLE': varTable})
+
+        values = {'VARNAME_TABLE': varTable, 'COUNT': str(len(names)), 'ROOTS_AND_NAMES': '',
+            'VARNAME_ROOTS': 'NULL', 'VARNAME_NAMES': 'NULL'}
+        if len(names) > 0:
+            values['VARNAME_ROOTS'] = varTable + 'Roots'
+            values['VARNAME_NAMES'] = varTable + 'Names'
+            values['ROOTS_AND_NAMES'] = ENDPOINT_ARRAYS_TEMPLATE.render({
+                'VARNAME_ROOTS': values['VARNAME_ROOTS'],
+                'ROOTS': ', '.join([self.rootReference(rootNames[name]) for name in names]),
+                'VARNAME_NAMES': values['VARNAME_NAMES'],
+                'NAMES': ', '.join(['"{}"'.format(name) for name in names])})
+        return names, declaration, ENDPOINT_TABLE_TEMPLATE.render(values)
+
+    def createFunctionPrototype(self, method, description, params, endpoints=None, command=None, key=None):
+        # A method bound under several (e.g. repeated) commands is declared and implemented once, so
+        #   every binding must take the same parameters and, a Gateway's, enter the same endpoints (its
+        #   table is the method's). command is the one binding it here.
+        #   key is its code's in the cache, if already known (see methodKey())
+        if method in self.methodParams:
+            if methodSignature(params) != methodSignature(self.methodParams[method]):
+                raise ValueError('ERROR: {} is bound with different parameters by commands {} and {}'.format(
+                    method, self.methodCommands[method], command))
+            if endpointSignature(endpoints) != endpointSignature(self.methodEndpoints[method]):
+                raise ValueError('ERROR: {} is bound with different endpoints by commands {} and {}'.format(
+                    method, self.methodCommands[method], command))
+            return
+        self.methodParams[method] = params
+        self.methodCommands[method] = command
+        self.methodEndpoints[method] = endpoints
+
+        code = None
+        if self.cache is not None:
+            if key is None:
+                key = methodKey(method, description, params, endpoints)
+            code = self.cache.code.get(key)
+        if code is None:
+            code = self.createMethodCode(method, description, params, endpoints)
+            if self.cache is not None:
+                self.cache.code[key] = code
+        implementation, forwardDeclaration, parser, endpointTable = code
+        if endpointTable is not None:
+            self.gatewayEndpoints[method], declaration, table = endpointTable
+            self.codeEndpointDeclarations.append(declaration)
+            self.codeEndpointTables.append(table)
+        self.codeMethodImplementations.append(implementation)
+        self.codeMethodForwardDeclarations.append(forwardDeclaration)
+        self.codeArgumentParsers.append(parser)
+
+    def createMethodCode(self, method, description, params, endpoints=None):
+        # The stub, forward declaration and argument parser of a method, and for a Gateway its endpoint
+        #   table (see createEndpointTable()), else None
+        endpointTable = None
         paramLine = ''
         formatNotes = ''
         formatVerification = '    // TODO:\n'
 
         if len(params) > 0:
+            raw = []
             for param in params:
-                paramLine += '{} {},'.format(param['type'], param['name'])
+                paramLine += '{} {},'.format(paramType(param), param['name'])
                 if 'format' in param:
                     formatNotes +=        '//    {} Type: {}, Format: {}\n'.format(param['name'], param['type'], param['format'])
-                    formatVerification += '    //   Validate user input and convert to name: {}, type: {}, format: {}\n'.format(param['name'], param['type'], param['format'])
                 else:
                     formatNotes +=        '//    {} Type: {}\n'.format(param['name'], param['type'])
-                    formatVerification += '    //   Validate user input and convert to name: {}, type: {}\n'.format(param['name'], param['type'])
                 if 'description' in param:
                     formatNotes +=        '//        Description: {}\n'.format(param['description'])
-                    formatVerification += '    //        Description: {}\n'.format(param['description'])
+                if paramType(param) != param['type'].strip():
+                    raw.append(param)
+            # arguments arrive converted and range checked by the method's argument parser, but for
+            #   those of a type it has no routine for
+            converted = [param['name'] for param in params if param not in raw]
+            if converted:
+                formatVerification += '    //   Use the converted arguments: {}\n'.format(', '.join(converted))
+            for param in raw:
+                formatVerification += '    //   Validate user input and convert to name: {}, type: {}\n'.format(
+                    param['name'], param['type'])
 
             # For Gateway Methods
-            if endpointNames is not None:
+            if endpoints is not None:
                 description += ' (GATEWAY METHOD)'
-                for endpoint in endpointNames:
-                    formatVerification += '    //          Target EndPoint: &{}\n'.format(endpoint)
                 formatVerification += '    //\n'
-                formatVerification += '    //          Create a switch or multiple if/else statements based on userInput\n'
-                formatVerification += '    //          that sets rootNode to one of each of the Target EndPoints listed\n'
-                formatVerification += '    //          above. Example (using &nodeFooBar):\n'
-                formatVerification += '    //            if ( 0 == strncmp(userInput, "FOO", USER_INPUT_BUF_SIZE))\n'
-                formatVerification += '    //            {\n'
-                formatVerification += '    //                 rootNode = &nodeFooBar;\n'
-                formatVerification += '    //            }\n'
+                formatVerification += '    //          Authenticate, then return the Target EndPoint to enter:\n'
+                endpointTable = self.createEndpointTable(method, endpoints)
+                for name in endpointTable[0]:
+                    formatVerification += '    //            {}_{}\n'.format(method.upper(), name)
+                formatVerification += '    //          or {} to stay put. consoleFindEndpoint() looks an\n'.format(GATEWAY_DENIED)
+                formatVerification += '    //          EndPoint up by name (as the example below does)\n'
+                if paramType(params[0]) in PARAM_STRING_TYPES:
+                    result = GATEWAY_RESULT_TEMPLATE.render({'VARNAME_TABLE': STR_ENDPOINT_TABLE_PREFIX + method,
+                        'NAME_PARAM': params[0]['name']})
+                else:
+                    result = GATEWAY_DENIED
 
             paramLine = paramLine[:-1] # trim that last comma character
             formatNotes = formatNotes[:-1] # trim last newline
             formatVerification = formatVerification[:-1] # trim last newline
         else:
+            paramLine = 'void'
             formatNotes += '//    VOID'
             formatVerification = VOID_CHECK
 
-        functionDeclaration = METHOD_PROTO
-        functionDeclaration = functionDeclaration.replace('DESC_PLACEHOLDER', description)
-        functionDeclaration = functionDeclaration.replace('FUNCTION', method)
-        functionDeclaration = functionDeclaration.replace('ARGLIST', paramLine)
-        functionDeclaration = functionDeclaration.replace('PARAM_PLACEHOLDER', formatNotes)
-        functionDeclaration = functionDeclaration.replace('INPUT_VERIFICATION_METHOD', formatVerification)
-        if ( self.externalize ):
-            forwardDeclaration  = EXTERN_METHOD_PROTO + METHOD_FORWARD
+        returnType = METHOD_RETURN_TYPE
+        if endpoints is not None:
+            returnType = GATEWAY_RETURN_TYPE
         else:
-            forwardDeclaration  = METHOD_FORWARD
+            result = METHOD_RESULT
+
+        functionDeclaration = METHOD_PROTO_TEMPLATE.render({
+            'DESC_PLACEHOLDER': description,
+            'RETURN_TYPE': returnType,
+            'FUNCTION': method,
+            'PARAMETERS': paramLine,
+            'PARAM_PLACEHOLDER': formatNotes,
+            'INPUT_VERIFICATION_METHOD': formatVerification,
+            'RESULT': result})
+        # 'extern ' is prefixed when the console source is rendered, the methods header uses these as is
+        forwardDeclaration = METHOD_FORWARD_TEMPLATE.render({'RETURN_TYPE': returnType, 'FUNCTION': method,
+            'PARAMETERS': paramLine})
+
+        return (functionDeclaration, forwardDeclaration, self.createArgumentParser(method, params, endpoints is not None),
+            endpointTable)
+
+    def shareSubtrees(self):
+        # Hash-cons the trees: structurally identical subtrees (same strings, methods and children)
+        #   collapse onto one node, and identical children arrays onto one array.
+        #   Children are keyed before their parents by walking the pre-order flattenedTree backwards
+        keyIds = {}
+        nodeKeys = {}
+        for node in reversed(self.flattenedTree):
+            key = (node.name, node.description, node.isMethod, node.isGateway, node.methodName,
+                node.strVarParamDesc, tuple(node.endPoints), tuple([nodeKeys[child] for child in node.children]))
+            if node.name is None:
+                # roots are referenced by name (&node1, gateway endpoints), so never merged
+                key += (node.strVarNodeName,)
+            nodeKeys[node] = keyIds.setdefault(key, len(keyIds))
+
+        # Keep the last copy in pre-order: declarations are emitted in reverse, so it is declared
+        #   ahead of every parent that refers to it
+        representatives = {}
+        for node in self.flattenedTree:
+            representatives[nodeKeys[node]] = node
+        shared = [node for node in self.flattenedTree if representatives[nodeKeys[node]] is node]
 
-        forwardDeclaration  = forwardDeclaration.replace('FUNCTION', method)
-        forwardDeclaration  = forwardDeclaration.replace('ARGLIST', paramLine)
+        arrays = {}
+        for node in shared:
+            node.children = [representatives[nodeKeys[child]] for child in node.children]
+            if node.children:
+                node.strVarBranchArrayName = arrays.setdefault(tuple(node.children), node.strVarBranchArrayName)
 
-        self.codeMethodImplementations.append(functionDeclaration)
-        self.codeMethodForwardDeclarations.append(forwardDeclaration)
+        if len(shared) < len(self.flattenedTree):
+            print('Shared subtrees: {} nodes collapsed onto {}'.format(len(self.flattenedTree), len(shared)))
+        self.flattenedTree = shared
 
     def createBranchPrototypes(self):
-
+        # A shared children array is declared with its last user, ahead of all of them once reversed
+        lastUsers = {}
         for node in self.flattenedTree:
+            if not node.isMethod:
+                lastUsers[node.strVarBranchArrayName] = node
+
+        strings = self.stringTexts()
+        for index, node in enumerate(self.flattenedTree):
             # common strings
             name = node.name
             description = node.description
             strVarNode = node.strVarNodeName
 
             # Format the object declaration and insert into list
-            nodeDeclaration = NODE_PROTO
-            nodeDeclaration = nodeDeclaration.replace('VARNAME_NODE', strVarNode)
             if name is None:
                 name = 'NULL'
-            nodeDeclaration = nodeDeclaration.replace('STR_KEY', name)
-
-            if description is None:
+            if description is None or self.compressHelp:
                 description = 'NULL'
-            nodeDeclaration = nodeDeclaration.replace('DESC', description)
+            values = {'VARNAME_NODE': strVarNode, 'STR_KEY': name, 'DESC': description, 'NODE_INITIALIZERS': ''}
 
             if node.isMethod:
-                methodName = node.methodName
-                strVarParamDesc = node.strVarParamDesc
-
-                nodeDeclaration = nodeDeclaration.replace('METHOD', methodName)
+                values['METHOD'] = ARGUMENT_PARSER_PREFIX + node.methodName
                 if node.hasParams:
-                    nodeDeclaration = nodeDeclaration.replace('ARG_HELP', strVarParamDesc)
+                    values['ARG_HELP'] = HELP_COMPRESSED_ARG_HELP if self.compressHelp else node.strVarParamDesc
                 else:
-                    nodeDeclaration = nodeDeclaration.replace('ARG_HELP', 'NULL')
-                nodeDeclaration = nodeDeclaration.replace('COUNT_CHILDREN', '0')
-                nodeDeclaration = nodeDeclaration.replace('VARNAME_CHILDREN', 'NULL')
-                self.codeNodeDeclarations.append(nodeDeclaration)
+                    values['ARG_HELP'] = 'NULL'
+                values['COUNT_CHILDREN'] = '0'
+                values['VARNAME_CHILDREN'] = 'NULL'
+                if self.helpBlocks:
+                    values['NODE_INITIALIZERS'] += self.helpInitializer(node, strings)
+                if self.profile:
+                    values['NODE_INITIALIZERS'] += PROFILE_NODE_INITIALIZERS_TEMPLATE.render({'INDEX': str(index)})
+                self.codeNodeDeclarations.append(NODE_TEMPLATE.render(values))
 
             else:
                 strVarBranches = node.strVarBranchArrayName
-                nodeDeclaration = nodeDeclaration.replace('METHOD', 'NULL')
-                nodeDeclaration = nodeDeclaration.replace('ARG_HELP', 'NULL')
-                nodeDeclaration = nodeDeclaration.replace('COUNT_CHILDREN', str(len(node.children)))
-                nodeDeclaration = nodeDeclaration.replace('VARNAME_CHILDREN', strVarBranches)
-                self.codeNodeDeclarations.append(nodeDeclaration)
-
-                arrBranches = node.arrStrVarNodeNames
-
-                strBranches = ''
-                for branch in arrBranches:
-                    strBranches = strBranches + REF + branch + ', '
-                # trim trailing comma
-                strBranches = strBranches[:-2]
+                values['METHOD'] = 'NULL'
+                values['ARG_HELP'] = 'NULL'
+                values['COUNT_CHILDREN'] = str(len(node.children))
+                values['VARNAME_CHILDREN'] = strVarBranches
+                if DISPATCH_HASH == self.dispatch:
+                    hashDeclaration = self.createHashTable(node, values)
+                if self.helpBlocks:
+                    values['NODE_INITIALIZERS'] += self.helpInitializer(node, strings)
+                if self.profile:
+                    values['NODE_INITIALIZERS'] += PROFILE_NODE_INITIALIZERS_TEMPLATE.render({'INDEX': str(index)})
+                self.codeNodeDeclarations.append(NODE_TEMPLATE.render(values))
+                if lastUsers[strVarBranches] is not node:
+                    continue
+
+                strBranches = ', '.join([REF + child.strVarNodeName for child in self.childOrder(node)])
 
                 # Format the object declaration and insert into list
-                branchDeclaration = NODE_CHILDREN_PROTO
-                branchDeclaration = branchDeclaration.replace('VARNAME_CHILDREN', strVarBranches)
-                branchDeclaration = branchDeclaration.replace('CHILDREN', strBranches)
-                self.codeNodeDeclarations.append(branchDeclaration)
+                self.codeNodeDeclarations.append(NODE_CHILDREN_TEMPLATE.render({
+                    'VARNAME_CHILDREN': strVarBranches, 'CHILDREN': strBranches}))
+                if DISPATCH_HASH == self.dispatch:
+                    # declarations are emitted in reverse, so the table lands ahead of the node
+                    self.codeNodeDeclarations.append(hashDeclaration)
+
+    def childOrder(self, node):
+        # Children in the order they are emitted
+        if DISPATCH_BINARY == self.dispatch:
+            # Sort by the emitted (upper case) command string - the order strcmp() sees.
+            #   The sort is stable, so equal names keep their XML order
+            return sorted(node.children, key=lambda child: child.command)
+        return node.children
+
+    def stringTexts(self):
+        # The text of every string variable, as declared
+        return {strVarName: text for text, strVarName in self.stringVarNames.items()}
+
+    def poolStrings(self, limit=None):
+        # Pack the strings the nodes refer to into one pool (see buildStringPool()). Command words come
+        #   first, those of each children array side by side in the order the dispatch scans them (arrays
+        #   breadth first from the roots), then descriptions and argument help, which only help reads.
+        #   With compressed help, descriptions are left to the help blocks. The compact and image layouts
+        #   give roots the empty string. Returns ({strVarName: text} pooled, pool, offsets)
+        strings = self.stringTexts()
+        names = []
+        descriptions = []
+        order = [root.children[0] for root in self.rootNodes]
+        arrays = set()
+        i = 0
+        while i < len(order):
+            node = order[i]
+            i += 1
+            descriptions.extend([strVarName for strVarName in (node.description,
+                node.strVarParamDesc if node.isMethod and node.hasParams else None) if strVarName in strings])
+            if node.isMethod or node.strVarBranchArrayName in arrays:
+                continue
+            arrays.add(node.strVarBranchArrayName)
+            names.extend([child.name for child in self.childOrder(node)])
+            order.extend(node.children)
+        if not self.compressHelp:
+            names.extend(descriptions)
+        pooled = {strVarName: strings[strVarName] for strVarName in names}
+        pool, offsets = buildStringPool(list(pooled.values()) + ([] if LAYOUT_POINTER == self.layout else ['']), limit)
+        self.stringPool = pool
+        return pooled, pool, offsets
+
+    def createStringPool(self):
+        # The string pool of the pointer layout, and a name for each string's place in it.
+        #   Returns (pool, names) code
+        pooled, pool, offsets = self.poolStrings()
+        # adjacent literals are joined after escapes are read, so '\0' can't run into a following digit.
+        #   The last string is terminated by the literal itself
+        last = len(pool) - 1
+        codePool = STRING_POOL_TEMPLATE.render({'ENTRIES': '\n'.join(
+            [POOL_STRING_TEMPLATE.render({'STRING': cString(string) + ('' if i == last else '\\0'),
+                'TERMINATOR': ';' if i == last else '', 'OFFSET': str(offset)})
+                for i, (offset, string) in enumerate(pool)])})
+        codeNames = '\n'.join([STR_REFERENCE_TEMPLATE.render({'NAME': strVarName, 'OFFSET': str(offsets[text])})
+            for strVarName, text in sorted(pooled.items(), key=lambda item: offsets[item[1]])])
+        return codePool, codeNames
+
+    def helpInitializer(self, node, strings):
+        # Render the node's help output and return its initializer; identical blocks share an index
+        lines = [HELP_HEADER]
+        if node.name is not None:
+            # roots are the only nodes printHelp() is called on as the session root, which has no title
+            lines.append(HELP_TITLE.format(strings[node.name], strings[node.description]))
+        if node.isMethod:
+            lines.append(HELP_ARGS.format(strings[node.strVarParamDesc]) if node.hasParams else HELP_NO_ARGS)
+        else:
+            lines.extend([HELP_CHILD.format(strings[child.name], strings[child.description])
+                for child in self.childOrder(node)])
+        index = self.helpBlockIndex.setdefault(''.join(lines), len(self.helpBlockIndex))
+        if index >= HELP_LIMIT:
+            raise ValueError('ERROR: {} distinct help blocks exceed the limit'.format(index + 1))
+        return HELP_NODE_INITIALIZERS_TEMPLATE.render({'INDEX': str(index)})
+
+    def addProfileCommands(self):
+        # The built-in STATS command, under every root (after the spec's own commands, so one of
+        #   theirs of the same name wins)
+        for root in self.rootNodes:
+            node = self.createBranchNode(root.children[0], self.getStringVarName(StringType.STR_COMMAND, PROFILE_COMMAND),
+                self.getStringVarName(StringType.STR_DESCRIPTION, PROFILE_DESCRIPTION))
+            node.command = PROFILE_COMMAND.upper()
+            self.convertMethodNode(node, PROFILE_METHOD)
+        self.methodParams[PROFILE_METHOD] = []
+
+    def createProfileMap(self):
+        # What each profile counter belongs to: its node's method and the command paths leading to it,
+        #   each prefixed by its root (the endpoint it's under, or nothing for the console's root).
+        #   Counters are indexed by node in the pointer layout and by table entry otherwise (see
+        #   compactOrder()). Returns the map as JSON
+        if LAYOUT_POINTER == self.layout:
+            entries = self.flattenedTree
+            indices = {node: i for i, node in enumerate(entries)}
+            roots = [indices[root.children[0]] for root in self.rootNodes]
+            children = lambda i: [indices[child] for child in self.childOrder(entries[i])]
+        else:
+            entries, firstChild = self.compactOrder()
+            roots = list(range(len(self.rootNodes)))
+            children = lambda i: [] if entries[i].isMethod else \
+                range(firstChild[entries[i].strVarBranchArrayName],
+                    firstChild[entries[i].strVarBranchArrayName] + len(entries[i].children))
+
+        paths = [[] for _ in entries]
+        stack = []
+        for i, root in enumerate(self.rootNodes):
+            label = '' if 0 == i else '[{}]'.format(root.children[0].strVarNodeName[len(STR_NODE_PREFIX):])
+            stack.append((roots[i], label))
+        while stack:
+            index, path = stack.pop()
+            paths[index].append(path)
+            stack.extend([(child, (path + ' ' + entries[child].command).strip()) for child in children(index)])
+
+        return json.dumps({'version': PROFILE_VERSION, 'nodes': [{'index': i,
+            'method': entries[i].methodName if entries[i].isMethod else None, 'paths': sorted(paths[i])}
+            for i in range(len(entries))]}, indent=2).encode()
+
+    def nodeFields(self):
+        # The field sizes of a commandTreeNode_t, as CommandTreeTemplate.h declares it plus NODE_STRUCT_FIELDS
+        if LAYOUT_POINTER == self.layout:
+            # name, desc, method, argDesc, childCount, children
+            fields = [self.pointerSize] * 4 + [4, self.pointerSize]
+        else:
+            fields = [2] * 6
+        if DISPATCH_HASH == self.dispatch:
+            fields += [4, 4, 4, self.pointerSize]
+        if self.helpBlocks:
+            fields.append(2)
+        if self.profile and LAYOUT_POINTER == self.layout:
+            fields.append(4)
+        return fields
+
+    def createFootprint(self, profileNodes=0):
+        # Estimate the bytes of every FOOTPRINT_CATEGORIES the console takes, per top level command (see
+        #   FOOTPRINT_SUFFIX) and in total, and of every section. Returns the report
+        strings = self.stringTexts()
+        nodeSize = structSize(self.nodeFields())
+        dataSection = 'rodata'
+        # one pool, where a string that is the tail of another (or only in the help blocks) costs nothing
+        pooled = set([string for _, string in self.stringPool])
+        stringSize = lambda text: len(text.encode('utf-8')) + 1 if text in pooled else 0
+        if LAYOUT_IMAGE == self.layout:
+            dataSection = 'image'
+            nodeSize = IMAGE_NODE.size
+
+        subtrees = {}
+        sections = dict.fromkeys(FOOTPRINT_SECTIONS, 0)
+        charged = set()
+
+        def charge(subtree, category, size, section, key=None):
+            # charge size bytes once per key (always, without one)
+            if key is not None:
+                if key in charged:
+                    return
+                charged.add(key)
+            subtrees.setdefault(subtree, dict.fromkeys(FOOTPRINT_CATEGORIES, 0))[category] += size
+            sections[section] += size
+
+        if LAYOUT_POINTER != self.layout:
+            # roots lead the node table, and have the empty string for their name and description
+            charge(FOOTPRINT_CONSOLE, 'commandStrings', stringSize(''), dataSection, ('string', ''))
+            charge(FOOTPRINT_CONSOLE, 'nodes', nodeSize * len(self.rootNodes), dataSection)
+        if LAYOUT_IMAGE == self.layout:
+            charge(FOOTPRINT_CONSOLE, 'nodes', IMAGE_HEADER_SIZE, dataSection)
+        if self.helpBlocks:
+            charge(FOOTPRINT_CONSOLE, 'help', self.helpSize, 'rodata')
+        if self.profile:
+            charge(FOOTPRINT_CONSOLE, 'profileCounters', profileNodes * structSize(PROFILE_COUNTER_FIELDS), 'bss')
+
+        for i, root in enumerate(self.rootNodes):
+            label = '' if 0 == i else '[{}]'.format(root.children[0].strVarNodeName[len(STR_NODE_PREFIX):])
+            stack = [(root.children[0], FOOTPRINT_CONSOLE)]
+            while stack:
+                node, subtree = stack.pop()
+                if LAYOUT_POINTER == self.layout:
+                    charge(subtree, 'nodes', nodeSize, dataSection, node)
+                texts = [('commandStrings', node.name), ('descriptions', node.description)]
+                if node.isMethod and node.hasParams:
+                    texts.append(('descriptions', node.strVarParamDesc))
+                for category, strVarName in texts:
+                    if strVarName in strings:
+                        charge(subtree, category, stringSize(strings[strVarName]), dataSection,
+                            ('string', strings[strVarName]))
+
+                if node.isMethod:
+                    method = node.methodName
+                    if ('method', method) in charged:
+                        continue
+                    if LAYOUT_POINTER != self.layout:
+                        charge(subtree, 'methodTable', self.pointerSize, 'rodata')
+                    if PROFILE_METHOD != method:
+                        # the STATS method is part of the template
+                        charge(subtree, 'parsers', PARSER_CODE_ESTIMATE +
+                            PARSER_ARGUMENT_CODE_ESTIMATE * len(self.methodParams[method]), 'text')
+                        if not self.externalize:
+                            charge(subtree, 'stubs', len(STUB_MESSAGE.format(method).encode('utf-8')) + 1, 'rodata')
+                            charge(subtree, 'stubs', STUB_CODE_ESTIMATE, 'text')
+                    charged.add(('method', method))
+                    continue
+
+                # a children array seen before was walked (with everything under it) when it was
+                array = node.strVarBranchArrayName
+                if ('array', array) in charged:
+                    continue
+                charged.add(('array', array))
+                if LAYOUT_POINTER == self.layout:
+                    charge(subtree, 'children', self.pointerSize * len(node.children), 'rodata')
+                if DISPATCH_HASH == self.dispatch:
+                    charge(subtree, 'hashTables', self.hashTableSizes[array], 'rodata')
+                for child in reversed(self.childOrder(node)):
+                    childSubtree = subtree
+                    if FOOTPRINT_CONSOLE == subtree:
+                        childSubtree = (label + ' ' + child.command).strip()
+                    if LAYOUT_POINTER != self.layout:
+                        # the array is the children's range of the node table
+                        charge(childSubtree, 'nodes', nodeSize, dataSection)
+                    stack.append((child, childSubtree))
+
+        totals = dict.fromkeys(FOOTPRINT_CATEGORIES, 0)
+        for entry in subtrees.values():
+            for category, size in entry.items():
+                totals[category] += size
+        sections[FOOTPRINT_FLASH] = sections['rodata'] + sections['text']
+        return {'version': FOOTPRINT_VERSION, 'layout': self.layout, 'dispatch': self.dispatch,
+            'pointerSize': self.pointerSize, 'sections': sections, 'total': totals, 'subtrees': subtrees}
+
+    def checkBudgets(self, footprint):
+        # Fail, before anything is written, if the footprint exceeds any budget
+        over = []
+        for name, budget in sorted(self.budgets.items()):
+            size = footprint['sections'][name] if name in footprint['sections'] else footprint['total'][name]
+            if size > budget:
+                over.append('{} {} bytes > {}'.format(name, size, budget))
+        if over:
+            raise ValueError('ERROR: Over budget ({}-bit pointers): {}'.format(8 * self.pointerSize, ', '.join(over)))
+
+    def createHelpDeclarations(self):
+        # The pool of help blocks (suffixes shared) and the table locating each block in it
+        blocks = list(self.helpBlockIndex.keys())
+        if self.compressHelp:
+            return self.createCompressedHelpDeclarations(blocks)
+        pool, offsets = buildStringPool(blocks, None)
+        last = len(pool) - 1
+        code = HELP_POOL_TEMPLATE.render({'ENTRIES': '\n'.join(
+            [POOL_STRING_TEMPLATE.render({'STRING': cString(block) + ('' if i == last else '\\0'),
+                'TERMINATOR': ';' if i == last else '', 'OFFSET': str(offset)})
+                for i, (offset, block) in enumerate(pool)])})
+        code += '\n' + HELP_TABLE_TEMPLATE.render({'ENTRIES': '\n'.join(
+            [HELP_ENTRY_TEMPLATE.render({'OFFSET': str(offsets[block]), 'LENGTH': str(len(block.encode('utf-8')))})
+                for block in blocks])})
+
+        poolSize = sum([len(block.encode('utf-8')) + 1 for _, block in pool])
+        self.helpSize = poolSize + len(blocks) * structSize(HELP_ENTRY_FIELDS)
+        print('Help blocks: {} distinct, {} bytes pooled'.format(len(blocks), poolSize))
+        return code
+
+    def createCompressedHelpDeclarations(self, blocks):
+        # The pair dictionary, the pool of encoded blocks and the table locating each block in it
+        text = [block.encode('utf-8') for block in blocks]
+        encoded, pairs, base, depth = pairEncode(text)
+        code = HELP_PAIRS_TEMPLATE.render({'CODE_BASE': str(base), 'DEPTH': str(depth + 1), 'ENTRIES': '\n'.join(
+            [HELP_PAIR_TEMPLATE.render({'FIRST': str(first), 'SECOND': str(second), 'CODE': str(base + i)})
+                for i, (first, second) in enumerate(pairs)] or
+            # an array can't be empty; nothing refers to this entry
+            [HELP_PAIR_TEMPLATE.render({'FIRST': '0', 'SECOND': '0', 'CODE': 'unused'})])})
+        # blocks are told apart by their lengths, so no terminators are stored
+        offsets = []
+        size = 0
+        for block in encoded:
+            offsets.append(size)
+            size += len(block)
+        code += '\n' + HELP_COMPRESSED_POOL_TEMPLATE.render({'ENTRIES': '\n'.join(
+            [POOL_STRING_TEMPLATE.render({'STRING': cBytes(block), 'TERMINATOR': ';' if i == len(encoded) - 1 else '',
+                'OFFSET': str(offset)}) for i, (offset, block) in enumerate(zip(offsets, encoded))])})
+        code += '\n' + HELP_TABLE_TEMPLATE.render({'ENTRIES': '\n'.join(
+            [HELP_ENTRY_TEMPLATE.render({'OFFSET': str(offset), 'LENGTH': str(len(block))})
+                for offset, block in zip(offsets, encoded)])})
+
+        plainSize = sum([len(block) for block in text])
+        compressedSize = size + 2 * len(pairs)
+        self.helpSize = compressedSize + len(blocks) * structSize(HELP_ENTRY_FIELDS)
+        print('Compressed help: {} distinct blocks, {} bytes of text in {} bytes ({} of them the {} pair dictionary), '
+            '{:.0f}%'.format(len(blocks), plainSize, compressedSize, 2 * len(pairs), len(pairs),
+            100.0 * compressedSize / max(plainSize, 1)))
+        return code
+
+    def compactOrder(self):
+        # Lay out every tree in one node table: roots first, then breadth first, so the children of
+        #   each node occupy a contiguous range. Returns (order, firstChild) where firstChild maps
+        #   each children array to the index its range starts at.
+        #   A shared node may sit in several children ranges (one entry each), but every distinct
+        #   children array is laid out once and its range shared
+        order = [root.children[0] for root in self.rootNodes]
+        firstChild = {}
+        i = 0
+        while i < len(order):
+            node = order[i]
+            if not node.isMethod and node.strVarBranchArrayName not in firstChild:
+                firstChild[node.strVarBranchArrayName] = len(order)
+                order.extend(self.childOrder(node))
+            i += 1
+        if len(order) > COMPACT_LIMIT:
+            raise ValueError('ERROR: {} nodes exceed the compact layout limit'.format(len(order)))
+        return order, firstChild
+
+    def createImage(self):
+        # The command table image: the compact layout's node table and string pool, serialised.
+        #   Returns (image, nodes code), the code binding the console to the image
+        strings = self.stringTexts()
+        _, pool, offsets = self.poolStrings(COMPACT_LIMIT)
+
+        def offset(strVarName, absent=IMAGE_NONE):
+            if strVarName is None:
+                return absent
+            return offsets[strings[strVarName]]
+
+        order, firstChild = self.compactOrder()
+        methods = list(dict.fromkeys([ARGUMENT_PARSER_PREFIX + node.methodName for node in order if node.isMethod]))
+        methodIndex = {method: i for i, method in enumerate(methods)}
+
+        records = []
+        for node in order:
+            if node.isMethod:
+                method = methodIndex[ARGUMENT_PARSER_PREFIX + node.methodName]
+                argDesc = offset(node.strVarParamDesc) if node.hasParams else IMAGE_NONE
+                children = (0, 0)
+            else:
+                method = argDesc = IMAGE_NONE
+                children = (firstChild[node.strVarBranchArrayName], len(node.children))
+            records.append(IMAGE_NODE.pack(offset(node.name, offsets['']), offset(node.description, offsets['']),
+                argDesc, method, *children))
+
+        roots = [root.children[0].strVarNodeName for root in self.rootNodes]
+        binding = zlib.crc32('\0'.join(methods + roots).encode())
+        flags = IMAGE_FLAG_SORTED if DISPATCH_BINARY == self.dispatch else 0
+        stringBytes = b''.join([string.encode('utf-8') + b'\0' for _, string in pool])
+        body = IMAGE_FIELDS.pack(binding, flags, len(order), len(roots), len(methods),
+            IMAGE_HEADER_SIZE + IMAGE_NODE.size * len(order)) + b''.join(records) + stringBytes
+        image = IMAGE_PREFIX.pack(IMAGE_MAGIC, IMAGE_VERSION, IMAGE_HEADER_SIZE, IMAGE_PREFIX.size + len(body),
+            zlib.crc32(body)) + body
+        checkImage(image, binding)
+
+        codeNodes = [IMAGE_BINDING_TEMPLATE.render({'BINDING_VALUE': '0x{:08X}u'.format(binding),
+            'ROOT_TOTAL': str(len(roots)), 'METHOD_TOTAL': str(len(methods)), 'SORTED_FLAG': '1' if flags else '0',
+            'IMAGE_PATH': os.path.basename(self.imagePath),
+            'ROOT_INDICES': ',\n'.join(['    {}{} = {}'.format(root, IMAGE_ROOT_INDEX_SUFFIX, i)
+                for i, root in enumerate(roots)]),
+            'METHOD_ENTRIES': ', '.join(methods)})]
+        codeNodes.extend([IMAGE_ROOT_TEMPLATE.render({'VARNAME_NODE': root, 'INDEX': root + IMAGE_ROOT_INDEX_SUFFIX})
+            for root in roots])
+        print('Command table image: {} bytes ({} nodes, {} bytes of strings), binding 0x{:08X}'.format(
+            len(image), len(order), len(stringBytes), binding))
+
+        return image, '\n'.join(codeNodes)
+
+    def createCompactPrototypes(self):
+        # One string pool, one method table and one node table (see compactOrder()).
+        #   Returns (strings, nodes) code
+        strings = self.stringTexts()
+        # roots have no name or description - they get the empty string, which shares a terminator.
+        #   With compressed help, so do descriptions
+        pooled, pool, offsets = self.poolStrings(COMPACT_LIMIT)
+
+        def offset(strVarName, absent=COMPACT_NONE):
+            if strVarName is None:
+                return absent
+            return str(offsets[pooled.get(strVarName, '')])
+
+        order, firstChild = self.compactOrder()
+        methods = list(dict.fromkeys([ARGUMENT_PARSER_PREFIX + node.methodName for node in order if node.isMethod]))
+        methodIndex = {method: i for i, method in enumerate(methods)}
+
+        hashDeclarations = []
+        hashArrays = set()
+        entries = []
+        for node in order:
+            values = {'VARNAME_NODE': node.strVarNodeName, 'STR_KEY': offset(node.name, str(offsets[''])),
+                'DESC': offset(node.description, str(offsets[''])), 'NODE_INITIALIZERS': '', 'ARG_HELP': COMPACT_NONE}
+            if node.isMethod:
+                values['METHOD'] = str(methodIndex[ARGUMENT_PARSER_PREFIX + node.methodName])
+                if node.hasParams:
+                    values['ARG_HELP'] = offset(node.strVarParamDesc)
+                values['FIRST_CHILD'] = '0'
+                values['COUNT_CHILDREN'] = '0'
+            else:
+                values['METHOD'] = COMPACT_NONE
+                values['FIRST_CHILD'] = str(firstChild[node.strVarBranchArrayName])
+                values['COUNT_CHILDREN'] = str(len(node.children))
+                if DISPATCH_HASH == self.dispatch:
+                    hashDeclaration = self.createHashTable(node, values)
+                    if node.strVarBranchArrayName not in hashArrays:
+                        hashArrays.add(node.strVarBranchArrayName)
+                        hashDeclarations.append(hashDeclaration)
+            if self.helpBlocks:
+                values['NODE_INITIALIZERS'] += self.helpInitializer(node, strings)
+            entries.append(COMPACT_NODE_TEMPLATE.render(values))
+
+        # adjacent literals are joined after escapes are read, so '\0' can't run into a following digit.
+        #   The last string is terminated by the literal itself
+        last = len(pool) - 1
+        codeStrings = STRING_POOL_TEMPLATE.render({'ENTRIES': '\n'.join(
+            [POOL_STRING_TEMPLATE.render({'STRING': cString(string) + ('' if i == last else '\\0'),
+                'TERMINATOR': ';' if i == last else '', 'OFFSET': str(offset)})
+                for i, (offset, string) in enumerate(pool)])})
+        codeNodes = hashDeclarations + [
+            COMPACT_METHOD_TABLE_TEMPLATE.render({'METHODS': ', '.join(methods)}),
+            COMPACT_NODE_TABLE_TEMPLATE.render({'ENTRIES': '\n'.join(entries)})]
+        for i, root in enumerate(self.rootNodes):
+            codeNodes.append(COMPACT_ROOT_TEMPLATE.render({'VARNAME_NODE': root.children[0].strVarNodeName,
+                'INDEX': str(i)}))
+
+        # Report what the compact layout saves over the pointer layout
+        poolSize = sum([len(string.encode('utf-8')) + 1 for _, string in pool])
+        compactSize = len(order) * COMPACT_NODE_SIZE + len(methods) * POINTER_SIZE + poolSize
+        arrays = {node.strVarBranchArrayName: len(node.children) for node in self.flattenedTree if not node.isMethod}
+        pointerSize = len(self.flattenedTree) * POINTER_NODE_SIZE + sum(arrays.values()) * POINTER_SIZE + poolSize
+        print('Compact layout: {} bytes, pointer layout: {} bytes (32-bit), saving {} bytes'.format(
+            compactSize, pointerSize, pointerSize - compactSize))
+
+        return codeStrings, '\n'.join(codeNodes)
+
+    def createHashTable(self, node, values):
+        # Build the perfect hash for a branch node's children, fill in the node's hash
+        #   initializers and return the table declaration. Nodes sharing a children array share the table
+        if node.strVarBranchArrayName in self.hashTables:
+            values['NODE_INITIALIZERS'], declaration = self.hashTables[node.strVarBranchArrayName]
+            return declaration
+
+        words = []
+        indices = []
+        for index, child in enumerate(self.childOrder(node)):
+            word = child.command.encode('utf-8')
+            # a repeated name can never be reached past its first occurrence (as with a linear scan)
+            if word not in words:
+                words.append(word)
+                indices.append(index)
+
+        key = ('hash', tuple(words))
+        found = None if self.cache is None else self.cache.code.get(key)
+        if found is None:
+            found = perfectHash(words)
+            if self.cache is not None:
+                self.cache.code[key] = found
+        seed, bucketMask, slotMask, displacements, slots = found
+
+        # check the table before trusting it: each word must land on its own slot
+        for i, word in enumerate(words):
+            value = hashWord(word, seed)
+            slot = hashSlot(value, displacements[(value >> 16) & bucketMask]) & slotMask
+            if slots[slot] != i + 1:
+                raise ValueError('ERROR: Hash collision in {} for {}'.format(node.strVarBranchArrayName, word))
+
+        slots = [0 if 0 == slot else indices[slot - 1] + 1 for slot in slots]
+        strVarHash = STR_NODE_HASH_PREFIX + node.strVarBranchArrayName[len(STR_NODE_CHILDREN_PREFIX):]
+        values['NODE_INITIALIZERS'] = HASH_NODE_INITIALIZERS_TEMPLATE.render({
+            'SEED': str(seed), 'BUCKET_MASK': str(bucketMask), 'SLOT_MASK': str(slotMask),
+            'VARNAME_HASH': strVarHash})
+        declaration = HASH_TABLE_TEMPLATE.render({
+            'VARNAME_HASH': strVarHash,
+            'ENTRIES': ', '.join([str(entry) for entry in displacements + slots])})
+        self.hashTables[node.strVarBranchArrayName] = (values['NODE_INITIALIZERS'], declaration)
+        self.hashTableSizes[node.strVarBranchArrayName] = 2 * (len(displacements) + len(slots))
+        return declaration
 
     def getStringVarName(self, type, inputStr):
+        # Strings are interned by their text as emitted (command words in upper case), whatever they are
+        #   used as, so differently cased command words, or a description reading like one, share a
+        #   string. They are declared once every node is known (see poolStrings())
         if type == StringType.STR_COMMAND:
-            if inputStr in self.cmdStringMap:
-                strVarName = self.cmdStringMap[inputStr]
-            else:
-                strVarName = STR_COMMAND_PREFIX + str(len(self.cmdStringMap) + 1)
-                self.cmdStringMap[inputStr] = strVarName
-                strTemp = STR_DECLARATION_PROTO
-                strTemp = strTemp.replace('NAME', strVarName)
-                strTemp = strTemp.replace('STRING', inputStr.upper())
-                self.codeCmdStringDeclarations.append(strTemp)
+            text = inputStr.upper()
+            prefix = STR_COMMAND_PREFIX
         elif type == StringType.STR_DESCRIPTION:
-            if inputStr in self.descriptionStringMap:
-                strVarName = self.descriptionStringMap[inputStr]
-            else:
-                strVarName = STR_DESCRIPTION_PREFIX + str(len(self.descriptionStringMap) + 1)
-                self.descriptionStringMap[inputStr] = strVarName
-                strTemp = STR_DECLARATION_PROTO
-                strTemp = strTemp.replace('NAME', strVarName)
-                strTemp = strTemp.replace('STRING', inputStr)
-                self.codeDescStringDeclarations.append(strTemp)
+            text = inputStr
+            prefix = STR_DESCRIPTION_PREFIX
         else:
             raise ValueError('UNKNOWN STRING TYPE FOUND: {} -> {}'.format(type, inputStr))
+        strVarName = self.stringVarNames.get(text)
+        if strVarName is None:
+            self.stringCounts[prefix] += 1
+            strVarName = prefix + str(self.stringCounts[prefix])
+            self.stringVarNames[text] = strVarName
         return strVarName
 
     def processCommands(self, commands, parent=None):
 
         if parent == None:
-            parent = Node() # new N-ary tree
-            self.rootNodes.append(parent)
-            parent = self.createBranchNode(parent, None, None)
+            parent = self.addRoot(root=None if self.cache is None else self.cache.root)
+            if self.cache is not None:
+                self.cache.root = parent
+
+        with self.phase('processCommands'):
+            if self.cache is None:
+                self.walkTree(commands, parent)
+                return
+            # With a cache, the steps processing each top level command takes are kept with it, and
+            #   replayed (on the same nodes) for as long as it is unchanged
+            walked = set()
+            for command in commands:
+                if command in walked:
+                    # the same element twice (e.g., a command repeated word for word) needs nodes of its own
+                    self.walkTree([command], parent)
+                    continue
+                walked.add(command)
+                fragment = self.cache.fragments.get(command)
+                if fragment is not None:
+                    self.replayFragment(fragment)
+                    continue
+                self.fragment = []
+                self.walkTree([command], parent)
+                self.cache.fragments[command] = self.fragment
+                self.fragment = None
+
+    def walkTree(self, commands, parent):
+        # Walk the commands depth first with an explicit stack of walkCommands() generators, one per
+        #   level being processed, so nesting depth is bounded by memory instead of the recursion limit.
+        #   A level yields (commands, parent) to have them processed before it carries on
+        stack = [self.walkCommands(commands, parent)]
+        while stack:
+            descend = next(stack[-1], None)
+            if descend is None:
+                stack.pop()
+            else:
+                stack.append(self.walkCommands(*descend))
 
-        for command in commands:
-            # Get (sub)Command text
-            cmdName = command.attrib['text']
-            # get a variable name for the command string
-            strVarCmdName = self.getStringVarName(StringType.STR_COMMAND, cmdName)
+    def record(self, function, *args):
+        # Note a step the top level command being processed took, as function(self, *args)
+        if self.fragment is not None:
+            self.fragment.append((function, args))
 
-            # Get Description
-            description = command.find('description').text.strip()
-            # get a variable name for the description string
-            strVarDescName = self.getStringVarName(StringType.STR_DESCRIPTION, description)
+    def replayFragment(self, fragment):
+        # Take the steps a top level command took again: it is renumbered, and its strings and methods
+        #   registered, as if it was walked, but nothing is read from the XML or built anew
+        for function, args in fragment:
+            function(self, *args)
 
-            # Create cmd tree object
-            node = self.createBranchNode(parent, strVarCmdName, strVarDescName)
+    def walkCommands(self, commands, parent):
+        for command in commands:
+            cmdName, description, isGateway, methods, subCommands, call = self.readCommand(command)
+            # Create cmd tree object (and variable names for the command string and its description)
+            node = self.addCommand(parent, cmdName, description)
+            self.record(genConsole.addCommand, parent, cmdName, description, node)
 
             # subcommands can be present, or callMethod (with optional arguments), but not both
 
-            # Gateway check
-            isGateway = 'type' in command.attrib and 'Gateway' == command.attrib['type']
-            if isGateway:
-                methods = command.findall('dispatch')
-                # Subcommands are masked for a gateway
-                subCommands = []
-            else:
-                methods = command.findall('callMethod')
-                subCommands = command.findall('command')
-
             # callMethod
-            if 1 == len(methods) and 0 == len(subCommands):
-                methodName = methods[0].attrib['function']
-                paramList = methods[0].findall('param')
-                params = []
-                hasParams = False
-                paramHelp = ''
-                iParam = 0 # used to track which param from paramList we are currently processing
-                for param in paramList:
-                    hasParams = True
-                    paramType = param.find('type').text
-                    paramName = param.find('name').text
-                    paramDescription = param.find('description').text
-                    # Format the argument description (paramHelp) that will be displayed in help context
-                    # Also, create the function prototype notes for parameters (params[{}])
-                    paramFormat = param.find('format') # optional
-                    if paramFormat is not None:
-                        paramFormat = paramFormat.text
-                        if len(paramList) > 1 and iParam < (len(paramList) - 1):
-                            paramHelp = paramHelp + '[Name: ' + paramName +\
-                                                    ', Type: ' + paramType + ', Format: ' + paramFormat +\
-                                                    ', Desc: ' + paramDescription + '], '
-                        else:
-                            paramHelp = paramHelp + '[Name: ' + paramName +\
-                                                    ', Type: ' + paramType + ', Format: ' + paramFormat +\
-                                                    ', Desc: ' + paramDescription + ']\n'
-                        params.append({'type': paramType, 'name': paramName, 'description': paramDescription, 'format': paramFormat})
-                    else:
-                        if len(paramList) > 1 and iParam < (len(paramList) - 1):
-                            paramHelp = paramHelp + '[Name: ' + paramName + ', Type: ' + paramType +\
-                                                    ', Desc: ' + paramDescription + '], '
-                        else:
-                            paramHelp = paramHelp + '[Name: ' + paramName + ', Type: ' + paramType +\
-                                                    ', Desc: ' + paramDescription + ']\n'
-                        params.append({'type': paramType, 'name': paramName, 'description': paramDescription})
-                    iParam += 1 # increment our tracker
-
-                # A Gateway must have parameters
-                if isGateway and not hasParams:
-                    raise ValueError('ERROR: A Gateway must have parameters')
-                elif isGateway:
+            if call is not None:
+                methodName, params, paramHelp, endpoints = call
+                endpointNames = None
+                if isGateway:
                     # Process the gateway method
-                    paramHelp = paramHelp[:-1] # remove last newline
-                    endpoints = methods[0].findall('endpoint')
-                    endpointNames = []
-                    for endpoint in endpoints:
-                        endpointNames.append(str(STR_NODE_PREFIX+endpoint.attrib['name']))
-
-                    self.convertGatewayNode(node, methodName, paramHelp, endpointNames)
+                    endpointNames = [name for name, _ in endpoints]
+                    rootNames = [str(STR_NODE_PREFIX + name) for name in endpointNames]
+                    self.convertGatewayNode(node, methodName, paramHelp, rootNames)
+                    self.record(genConsole.convertGatewayNode, node, methodName, paramHelp, rootNames)
 
                     # Then process all commands under this new endpoint (unlink parent)
-                    for endpoint in endpoints:
+                    for name, endpointcommands in endpoints:
                         # Create root node for each end point
-                        root = Node() # new N-ary tree
-                        self.rootNodes.append(root)
-                        root = self.createBranchNode(root, None, None, endpoint.attrib['name'])
+                        root = self.addRoot(name)
+                        self.record(genConsole.addRoot, name, root)
                         # Tie all commands under the endpoint to it
-                        endpointcommands = endpoint.findall('command')
-                        self.processCommands(endpointcommands, root)
+                        yield (endpointcommands, root)
 
                 # Regular method (optional parameters)
-                elif hasParams:
-                    paramHelp = paramHelp[:-1] # remove last newline
-                    self.convertMethodNode(node, methodName, hasParams, paramHelp)
+                elif params:
+                    self.convertMethodNode(node, methodName, True, paramHelp)
+                    self.record(genConsole.convertMethodNode, node, methodName, True, paramHelp)
                 else:
                     self.convertMethodNode(node, methodName)
-                if isGateway:
-                    self.createFunctionPrototype(methodName, description, params, endpointNames)
-                else:
-                    self.createFunctionPrototype(methodName, description, params)
+                    self.record(genConsole.convertMethodNode, node, methodName)
+                key = None if self.fragment is None else methodKey(methodName, description, params, endpointNames)
+                self.createFunctionPrototype(methodName, description, params, endpointNames, cmdName, key)
+                self.record(genConsole.createFunctionPrototype, methodName, description, params, endpointNames,
+                    cmdName, key)
 
             # subcommands
             elif 0 == len(methods) and 0 < len(subCommands):
-                self.processCommands(subCommands, node)
+                yield (subCommands, node)
             else:
-                print("DEBUG: cmdName = {}, strVarCmdName = {}, description = {}, strVarDescName = {}".format(cmdName, strVarCmdName, description, strVarDescName))
+                print("DEBUG: cmdName = {}, strVarCmdName = {}, description = {}, strVarDescName = {}".format(cmdName, node.name, description, node.description))
                 print("DEBUG: methods = [{}]".format(methods))
                 print("DEBUG: subCommands = [{}]".format(subCommands))
                 raise ValueError('ERROR: Command must be followed by either sub-commands or one call to a method (and optional arguments), but not both')
 
-
-    def start(self):
-        tree = ET.parse(self.inputPath)
+    def readCommand(self, command):
+        # What walkCommands() takes from a <command> element: (text, description, isGateway, methods,
+        #   subcommands, call), call being (method, params, argument help, endpoints) when it calls a method
+        #   and has no subcommands, else None. endpoints are a Gateway's (name, commands). Kept in the
+        #   cache, if any, for as long as the element lives
+        if self.cache is not None and command in self.cache.commands:
+            return self.cache.commands[command]
+
+        # Get (sub)Command text
+        cmdName = command.attrib['text']
+        # Get Description
+        description = command.find('description').text.strip()
+
+        # Gateway check
+        isGateway = 'type' in command.attrib and 'Gateway' == command.attrib['type']
+        if isGateway:
+            methods = command.findall('dispatch')
+            # Subcommands are masked for a gateway
+            subCommands = []
+        else:
+            methods = command.findall('callMethod')
+            subCommands = command.findall('command')
+
+        call = None
+        if 1 == len(methods) and 0 == len(subCommands):
+            methodName = methods[0].attrib['function']
+            paramList = methods[0].findall('param')
+            params = []
+            hasParams = False
+            paramHelp = ''
+            iParam = 0 # used to track which param from paramList we are currently processing
+            for param in paramList:
+                hasParams = True
+                paramType = param.find('type').text
+                paramName = param.find('name').text
+                paramDescription = param.find('description').text
+                # Format the argument description (paramHelp) that will be displayed in help context
+                # Also, create the function prototype notes for parameters (params[{}])
+                paramFormat = param.find('format') # optional
+                if paramFormat is not None:
+                    paramFormat = paramFormat.text
+                    if len(paramList) > 1 and iParam < (len(paramList) - 1):
+                        paramHelp = paramHelp + '[Name: ' + paramName +\
+                                                ', Type: ' + paramType + ', Format: ' + paramFormat +\
+                                                ', Desc: ' + paramDescription + '], '
+                    else:
+                        paramHelp = paramHelp + '[Name: ' + paramName +\
+                                                ', Type: ' + paramType + ', Format: ' + paramFormat +\
+                                                ', Desc: ' + paramDescription + ']\n'
+                    params.append({'type': paramType, 'name': paramName, 'description': paramDescription, 'format': paramFormat})
+                else:
+                    if len(paramList) > 1 and iParam < (len(paramList) - 1):
+                        paramHelp = paramHelp + '[Name: ' + paramName + ', Type: ' + paramType +\
+                                                ', Desc: ' + paramDescription + '], '
+                    else:
+                        paramHelp = paramHelp + '[Name: ' + paramName + ', Type: ' + paramType +\
+                                                ', Desc: ' + paramDescription + ']\n'
+                    params.append({'type': paramType, 'name': paramName, 'description': paramDescription})
+                iParam += 1 # increment our tracker
+
+            # A Gateway must have parameters
+            if isGateway and not hasParams:
+                raise ValueError('ERROR: A Gateway must have parameters')
+            paramHelp = paramHelp[:-1] # remove last newline
+            endpoints = []
+            if isGateway:
+                endpoints = [(endpoint.attrib['name'], endpoint.findall('command'))
+                    for endpoint in methods[0].findall('endpoint')]
+            call = (methodName, params, paramHelp, endpoints)
+
+        record = (cmdName, description, isGateway, methods, subCommands, call)
+        if self.cache is not None:
+            self.cache.commands[command] = record
+        return record
+
+    def loadCommands(self):
+        # Parse the whole document, then walk it
+        with self.phase('parse'):
+            tree = ET.parse(self.inputPath)
         self.xmlRoot = tree.getroot()
 
         # Process commands
         commands = self.xmlRoot.findall('command')
         self.processCommands(commands)
 
-        #for node in self.rootNodes:
-        #    self.debugPrintNode(node)
-        #quit()
+    def streamCommands(self):
+        # Parse incrementally - every top level <command> is handed to processCommands() as soon as
+        #   it closes and is then dropped from the document, so only one top level subtree is ever
+        #   held in memory. Top level commands are processed in document order, sharing one root,
+        #   which keeps variable numbering (and thus the output) identical to loadCommands()
+        parent = self.addRoot()
+
+        depth = 0
+        self.xmlRoot = None
+        for event, elem in ET.iterparse(self.inputPath, events=('start', 'end')):
+            if 'start' == event:
+                if self.xmlRoot is None:
+                    self.xmlRoot = elem
+                depth += 1
+                continue
+            depth -= 1
+            # only direct children of the document root are top level commands
+            if 1 == depth and 'command' == elem.tag:
+                self.processCommands([elem], parent)
+            if 1 == depth:
+                self.xmlRoot.remove(elem)
+
+    def generatorOptions(self):
+        # Every option that changes the generated sources
+        return {'externalize': self.externalize, 'outputPath': self.outputPath, 'dispatch': self.dispatch,
+                'layout': self.layout, 'harness': self.harness, 'byteInput': self.byteInput,
+                'helpBlocks': self.helpBlocks, 'compressHelp': self.compressHelp, 'shards': self.shards,
+                'profile': self.profile, 'script': self.script, 'footprint': self.footprint, 'pointerSize': self.pointerSize,
+                'budgets': self.budgets}
+
+    def createConfiguration(self, profileNodes=0):
+        # The #define block configuring the console template
+        configuration = '#define CONSOLE_COMPACT_LAYOUT {}\n#define CONSOLE_IMAGE_LAYOUT {}\n#define CONSOLE_BYTE_INPUT {}\n' \
+            '#define CONSOLE_PRECOMPUTED_HELP {}\n#define CONSOLE_COMPRESSED_HELP {}\n#define CONSOLE_PROFILE_GENERATED {}\n' \
+            '#define CONSOLE_SCRIPT {}'.format(
+            1 if LAYOUT_COMPACT == self.layout else 0, 1 if LAYOUT_IMAGE == self.layout else 0,
+            1 if self.byteInput else 0, 1 if self.helpBlocks else 0, 1 if self.compressHelp else 0,
+            1 if self.profile else 0, 1 if self.script else 0)
+        if self.profile:
+            # an image loaded later may have more nodes, which go uncounted unless this is raised
+            configuration += '\n#ifndef CONSOLE_PROFILE_NODES\n#define CONSOLE_PROFILE_NODES {}\n#endif'.format(profileNodes)
+        return configuration
+
+    def createHarnessScript(self):
+        # Command lines walking the tree: every method path (with a valid value for each argument),
+        #   the same path in lower case, and the branch leading to it left incomplete
+        lines = []
+        paths = 0
+        stack = [(child, ()) for root in reversed(self.rootNodes) for child in reversed(root.children[0].children)]
+        while stack and paths < HARNESS_MAX_PATHS:
+            node, words = stack.pop()
+            words = words + (node.command,)
+            if node.isMethod:
+                params = self.methodParams[node.methodName]
+                arguments = tuple([HARNESS_HEX_ARGUMENT if 'hexadecimal' == param.get('format')
+                    else HARNESS_ARGUMENT for param in params])
+                line = ' '.join(words + arguments)
+                lines.extend([line, line.lower()] + ([' '.join(words[:-1])] if len(words) > 1 else []))
+                if node.isGateway and self.gatewayEndpoints[node.methodName] and \
+                        paramType(params[0]) in PARAM_STRING_TYPES:
+                    # the example Gateway method enters the endpoint its argument names: go in and back out
+                    lines.extend([' '.join(words + (self.gatewayEndpoints[node.methodName][0],) + arguments[1:]),
+                        HARNESS_TRAILER[-1]])
+                paths += 1
+            else:
+                stack.extend([(child, words) for child in reversed(node.children)])
+        lines.extend(HARNESS_TRAILER)
+        return ',\n'.join(['    "{}"'.format(line) for line in lines])
+
+    def createShards(self, consoleValues, codeStrings, codeStringNames, codeNodes, stubs):
+        # Move the strings, nodes, argument parsers and method stubs out of the console source into
+        #   the shards, each definition to the smallest shard so far, all declared in the shared header
+        #   (as are the names of the strings).
+        #   consoleValues is left to include the header. Returns the (path, template, values, trailer)
+        #   of the header and of every shard
+        shards = [[] for _ in self.shardPaths]
+        sizes = [0 for _ in self.shardPaths]
+        hasParsers = [False for _ in self.shardPaths]
+        declarations = list(codeStringNames)
+        for definitions, isParser in ((codeStrings, False), (codeNodes, False), (self.codeArgumentParsers, True)):
+            for definition in definitions:
+                declarations.append(externDeclaration(definition))
+                shard = sizes.index(min(sizes))
+                shards[shard].append(definition[len(SHARD_STATIC):] + ('\n' if isParser else ''))
+                sizes[shard] += len(definition)
+                hasParsers[shard] = hasParsers[shard] or isParser
+        for stub in stubs:
+            # already declared with the other methods
+            shard = sizes.index(min(sizes))
+            shards[shard].append(stub)
+            sizes[shard] += len(stub)
+
+        outputs = [(self.sharedHeaderPath, self.templates.template(TEMPLATE_SHARD_HEADER_FILE), {
+            TEMPLATE_FILENAME: os.path.splitext(os.path.basename(self.sharedHeaderPath))[0].upper(),
+            TEMPLATE_HEADER_EXT: consoleValues[TEMPLATE_HEADER_EXT],
+            TEMPLATE_CONFIGURATION: consoleValues[TEMPLATE_CONFIGURATION],
+            TEMPLATE_TYPES: consoleValues[TEMPLATE_TYPES],
+            TEMPLATE_ENDPOINT_DECLARATIONS: consoleValues[TEMPLATE_ENDPOINT_DECLARATIONS],
+            TEMPLATE_METHOD_FORWARDS: consoleValues[TEMPLATE_METHOD_FORWARDS],
+            TEMPLATE_SHARD_DECLARATIONS: declarations}, '')]
+        for path, definitions, parsers in zip(self.shardPaths, shards, hasParsers):
+            outputs.append((path, self.templates.template(TEMPLATE_SHARD_SOURCE_FILE), {
+                TEMPLATE_SHARED_HEADER: os.path.basename(self.sharedHeaderPath),
+                TEMPLATE_PARSING_ROUTINES: consoleValues[TEMPLATE_PARSING_ROUTINES] if parsers else '',
+                TEMPLATE_SHARD_DEFINITIONS: definitions}, ''))
+        print('Shards: {} of {} bytes each'.format(len(shards), '/'.join([str(size) for size in sizes])))
+
+        # The console source keeps the rest, and includes the header in place of what moved into it
+        consoleValues.update({
+            TEMPLATE_HEADER_EXT: INCLUDE_HEADER_TEMPLATE.render({'FILENAME': os.path.basename(self.sharedHeaderPath)}),
+            TEMPLATE_CONFIGURATION: '', TEMPLATE_TYPES: '', TEMPLATE_ENDPOINT_DECLARATIONS: '',
+            TEMPLATE_METHOD_FORWARDS: '', TEMPLATE_PARSING_ROUTINES: '', TEMPLATE_ARGUMENT_PARSERS: '',
+            TEMPLATE_NODES: []})
+        return outputs
+
+    def createHarness(self):
+        # (path, template, values, trailer) of the multi-session test harness
+        sources = [os.path.basename(self.harnessPath)] + [os.path.basename(path) for path in self.shardPaths]
+        if self.externalize:
+            sources.append(os.path.basename(self.methodSourcePath))
+        return (self.harnessPath, self.templates.template(TEMPLATE_HARNESS_FILE), {
+            TEMPLATE_CONSOLE_SOURCE: os.path.basename(self.outputPath),
+            TEMPLATE_HARNESS_SOURCE: ' '.join(sources),
+            TEMPLATE_HARNESS_SCRIPT: self.createHarnessScript(),
+            TEMPLATE_HARNESS_ROOTS: ', '.join([self.rootReference(root.children[0].strVarNodeName)
+                for root in self.rootNodes])},
+            '')
+
+    def inputDigest(self):
+        # Hash of everything the generated sources are derived from
+        digest = hashlib.sha256()
+        for path in (self.inputPath, __file__):
+            with open(path, 'rb') as fin:
+                for chunk in iter(lambda: fin.read(1 << 16), b''):
+                    digest.update(chunk)
+            digest.update(b'\0')
+        for name in TEMPLATE_FILES:
+            digest.update(self.templates.text(name).encode())
+            digest.update(b'\0')
+        digest.update(json.dumps(self.generatorOptions(), sort_keys=True).encode())
+        return digest.hexdigest()
+
+    def loadManifest(self):
+        try:
+            with open(self.manifestPath) as fin:
+                manifest = json.load(fin)
+        except (OSError, ValueError):
+            return None
+        if MANIFEST_VERSION != manifest.get('version'):
+            return None
+        return manifest
+
+    @staticmethod
+    def outputUnchanged(manifest, path):
+        # True if the file on disk is still the one recorded in the manifest
+        entry = manifest['outputs'].get(path)
+        if entry is None:
+            return False
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        return entry['size'] == stat.st_size and entry['mtime'] == stat.st_mtime_ns
+
+    def upToDate(self, manifest, inputDigest):
+        if manifest is None or inputDigest != manifest['inputs']:
+            return False
+        return all([self.outputUnchanged(manifest, path) for path in manifest['outputs']])
+
+    def writeOutputs(self, outputs, manifest=None, inputDigest=None):
+        # outputs is a list of (path, template, values, trailer), streamed out as template + trailer
+        #   (see writeValue()). A binary output has no template: values is its content
+        now = '{}'.format(datetime.now())
+        entries = {}
+        for path, template, values, trailer in outputs:
+            if self.incremental:
+                # Hash the content without its timestamp, so only real changes are written
+                if template is None:
+                    digest = hashlib.sha256(values).hexdigest()
+                else:
+                    values[TEMPLATE_DATE] = ''
+                    digester = DigestWriter()
+                    template.write(digester, values)
+                    writeValue(digester, trailer)
+                    digest = digester.hexdigest()
+                if manifest is not None and self.outputUnchanged(manifest, path) and \
+                        digest == manifest['outputs'][path]['digest']:
+                    print('Unchanged: {}'.format(path))
+                    entries[path] = manifest['outputs'][path]
+                    continue
+
+            print('Writing to file: {}'.format(path))
+            if template is None:
+                with open(path, 'wb') as fout:
+                    fout.write(values)
+            else:
+                values[TEMPLATE_DATE] = now
+                with open(path, 'w') as fout:
+                    template.write(fout, values)
+                    writeValue(fout, trailer)
 
-        with open(TEMPLATE_FILE) as fin:
-            consoleFileData = fin.read()
+            if self.incremental:
+                stat = os.stat(path)
+                entries[path] = {'digest': digest, 'size': stat.st_size, 'mtime': stat.st_mtime_ns}
 
-            # Process collected command string declarations
-            codeStrings = ''
-            for string in self.codeCmdStringDeclarations:
-                codeStrings += string + '\n'
+        if self.incremental:
+            with open(self.manifestPath, 'w') as fout:
+                json.dump({'version': MANIFEST_VERSION, 'inputs': inputDigest, 'outputs': entries}, fout, indent=2)
 
-            # Process collected description string declarations
-            for string in self.codeDescStringDeclarations:
-                codeStrings += string + '\n'
-            # remove final newline
-            codeStrings = codeStrings[:-1]
+    def start(self):
+        manifest = None
+        inputDigest = None
+        if self.incremental:
+            # Nothing to do when neither the inputs nor the outputs changed since the last run
+            inputDigest = self.inputDigest()
+            manifest = self.loadManifest()
+            if self.upToDate(manifest, inputDigest):
+                print('Up to date: {}'.format(self.outputPath))
+                return
+
+        outputs = self.createOutputs()
+        with self.phase('write'):
+            self.writeOutputs(outputs, manifest, inputDigest)
+
+    def render(self):
+        # Generate in memory instead of writing any file: returns {path: source} of every output (bytes
+        #   for a binary one). Like start(), a genConsole generates once
+        return self.renderOutputs(self.createOutputs())
+
+    def renderOutputs(self, outputs):
+        # {path: source} of outputs, as made by createOutputs()
+        now = '{}'.format(datetime.now())
+        sources = {}
+        with self.phase('render'):
+            for path, template, values, trailer in outputs:
+                if template is None:
+                    sources[path] = values
+                    continue
+                values[TEMPLATE_DATE] = now
+                buffer = io.StringIO()
+                template.write(buffer, values)
+                writeValue(buffer, trailer)
+                sources[path] = buffer.getvalue()
+        return sources
+
+    def createOutputs(self, commands=None):
+        # Ingest the spec and build every output as (path, template, values, trailer) (see writeOutputs()).
+        #   commands are the spec's top level <command> elements, when already parsed
+        if self.reportMemory:
+            tracemalloc.start()
+
+        if commands is not None:
+            self.processCommands(commands)
+        elif self.stream:
+            # parsing is interleaved with processCommands()
+            with self.phase('parse'):
+                self.streamCommands()
+        else:
+            self.loadCommands()
+        if not self.flattenedTree[0].children:
+            raise ValueError('ERROR: No top level <command> in {}'.format(self.inputPath))
+
+        if self.reportMemory:
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print('Peak memory ({} ingestion): {:.1f} KiB'.format('streaming' if self.stream else 'tree', peak / 1024))
+
+        if self.profile:
+            # every command path keeps its own node, so its own counters: shared, "BANK1 OPEN" and
+            #   "BANK2 OPEN" would count as one
+            self.addProfileCommands()
+        else:
+            with self.phase('shareSubtrees'):
+                self.shareSubtrees()
 
-            # Process collected function declarations
-            codeForwardDeclarations = ''
-            for declaration in self.codeMethodForwardDeclarations:
-                codeForwardDeclarations += declaration + '\n'
-            # remove final newline
-            codeForwardDeclarations = codeForwardDeclarations[:-1]
+        #for node in self.rootNodes:
+        #    self.debugPrintNode(node)
+        #quit()
 
+        # Big sections are kept as lists of declarations and streamed out (see writeValue()), and every
+        #   template is rendered in one pass, so generated code is never scanned again for placeholders
+        image = None
+        codeHelp = []
+        codeStringNames = []
+        if LAYOUT_COMPACT == self.layout:
+            with self.phase('createCompactPrototypes'):
+                codeStrings, codeNodes = [[code] for code in self.createCompactPrototypes()]
+        elif LAYOUT_IMAGE == self.layout:
+            # every string is in the image
+            codeStrings = []
+            with self.phase('createImage'):
+                image, codeNodes = self.createImage()
+            codeNodes = [codeNodes]
+        else:
             # Create all of the commandTreeNode_t declarations
-            self.createBranchPrototypes()
-            codeNodes = ''
-            for declaration in reversed(self.codeNodeDeclarations):
-                codeNodes += declaration + '\n'
-            # Remove final newline
-            codeNodes = codeNodes[:-1]
-
-            consoleFileData = consoleFileData.replace(TEMPLATE_METHOD_FORWARDS, codeForwardDeclarations)
-            consoleFileData = consoleFileData.replace(TEMPLATE_STRINGS, codeStrings)
-            consoleFileData = consoleFileData.replace(TEMPLATE_NODES, codeNodes)
-
-            # create separate source and header file for methods if self.externalize == true
-            if self.externalize:
-                includeString = INCLUDE_HEADER.replace('FILENAME', self.methodHeaderPath)
-                consoleFileData = consoleFileData.replace(TEMPLATE_HEADER_EXT, includeString)
-                # remove parameter parsing placeholder
-                consoleFileData = consoleFileData.replace(TEMPLATE_PARSING_ROUTINES, '')
-
-                # Generate Method Source File
-                with open(TEMPLATE_METHOD_SOURCE_FILE) as fms:
-                    methodSourceFileData = fms.read()
-                    methodSourceFileData = methodSourceFileData.replace(TEMPLATE_HEADER_EXT, includeString)
-                    # insert parameter parsing placeholder
-                    with open(TEMPLATE_PARSER_SOURCE_FILE) as ptf:
-                        parserCode = ptf.read()
-                        methodSourceFileData = methodSourceFileData.replace(TEMPLATE_PARSING_ROUTINES, parserCode)
-
-                    stubs = ''
-                    # Process collected function declarations in new separate method source file
-                    for declaration in self.codeMethodImplementations:
-                        stubs += declaration + '\n'
-                    methodSourceFileData = methodSourceFileData.replace(TEMPLATE_METHOD_STUBS, stubs)
-                    methodSourceFileName = self.methodHeaderPath.replace('.h', '.c')
-                    print('Writing to file: {}'.format(methodSourceFileName))
-                    with open(methodSourceFileName, 'w') as fms_out:
-                        now = datetime.now()
-                        methodSourceFileData = methodSourceFileData.replace('CODE_GENERATION_DATE', '{}'.format(now))
-                        fms_out.write(methodSourceFileData)
-                # Generate Method Header File
-                with open(TEMPLATE_METHOD_HEADER_FILE) as fmh:
-                    methodHeaderFileData = fmh.read()
-                    # Remove 'extern ' from the list we created above, as these are local to this file
-                    methodHeaderFileData = methodHeaderFileData.replace(TEMPLATE_METHOD_FORWARDS,
-                        codeForwardDeclarations.replace(EXTERN_METHOD_PROTO, ''))
-                    methodHeaderFileData = methodHeaderFileData.replace('FILENAME_PLACEHOLDER',
-                        self.methodHeaderPath.replace('.h', '').upper())
-                    print('Writing to file: {}'.format(self.methodHeaderPath))
-                    with open(self.methodHeaderPath, 'w') as fmh_out:
-                        now = datetime.now()
-                        methodHeaderFileData = methodHeaderFileData.replace('CODE_GENERATION_DATE', '{}'.format(now))
-                        fmh_out.write(methodHeaderFileData)
+            with self.phase('createBranchPrototypes'):
+                self.createBranchPrototypes()
+            with self.phase('createStringPool'):
+                codeStrings, codeStringNames = [[code] for code in self.createStringPool()]
+            codeNodes = self.codeNodeDeclarations[::-1]
+        if self.helpBlocks:
+            with self.phase('createHelpDeclarations'):
+                codeHelp = [self.createHelpDeclarations()]
+        codeForwardDeclarations = '\n'.join(self.codeMethodForwardDeclarations)
+        # every stub is followed by a blank line
+        stubs = self.codeMethodImplementations + [''] if self.codeMethodImplementations else ''
+
+        parserCode = self.templates.text(TEMPLATE_PARSER_SOURCE_FILE)
+        profileMap = None
+        profileNodes = 0
+        if self.profile:
+            profileMap = self.createProfileMap()
+            profileNodes = len(json.loads(profileMap)['nodes'])
+
+        footprint = None
+        if self.footprint or self.budgets:
+            footprint = self.createFootprint(profileNodes)
+            sections = footprint['sections']
+            print('Footprint ({}-bit pointers): {} bytes rodata, ~{} bytes text, {} bytes bss{}'.format(
+                8 * self.pointerSize, sections['rodata'], sections['text'], sections['bss'],
+                ', {} bytes image'.format(sections['image']) if LAYOUT_IMAGE == self.layout else ''))
+            self.checkBudgets(footprint)
+
+        consoleValues = {
+            TEMPLATE_METHOD_FORWARDS: codeForwardDeclarations,
+            TEMPLATE_STRINGS: codeStrings + codeStringNames + codeHelp,
+            TEMPLATE_NODES: codeNodes,
+            TEMPLATE_CHILD_LOOKUP: LOOKUP_LINEAR,
+            TEMPLATE_CONFIGURATION: self.createConfiguration(profileNodes),
+            TEMPLATE_PARSING_ROUTINES: parserCode,
+            TEMPLATE_ARGUMENT_PARSERS: '\n\n'.join(self.codeArgumentParsers),
+            TEMPLATE_ENDPOINT_DECLARATIONS: '\n'.join(self.codeEndpointDeclarations),
+            TEMPLATE_ENDPOINT_TABLES: '\n'.join(self.codeEndpointTables)}
+        nodeFields = ''
+        if DISPATCH_BINARY == self.dispatch:
+            consoleValues[TEMPLATE_CHILD_LOOKUP] = LOOKUP_BINARY
+        elif DISPATCH_HASH == self.dispatch:
+            consoleValues[TEMPLATE_CHILD_LOOKUP] = HASH_DEFINES + LOOKUP_HASH
+            nodeFields = HASH_NODE_FIELDS
+        if self.helpBlocks:
+            nodeFields += HELP_NODE_FIELDS
+        if self.profile and LAYOUT_POINTER == self.layout:
+            # the other layouts count by table entry
+            nodeFields += PROFILE_NODE_FIELDS
+        consoleValues[TEMPLATE_TYPES] = self.templates.template(TEMPLATE_TYPES_FILE).render({TEMPLATE_NODE_FIELDS: nodeFields})
+        outputs = []
+        trailer = stubs
+
+        # create separate source and header file for methods if self.externalize == true
+        if self.externalize:
+            includeString = INCLUDE_HEADER_TEMPLATE.render({'FILENAME': self.methodHeaderPath})
+            consoleValues[TEMPLATE_METHOD_FORWARDS] = '\n'.join(
+                [EXTERN_METHOD_PROTO + declaration for declaration in self.codeMethodForwardDeclarations])
+            consoleValues[TEMPLATE_HEADER_EXT] = includeString
+            # the methods header declares the endpoints
+            consoleValues[TEMPLATE_ENDPOINT_DECLARATIONS] = ''
+            endpointDeclarations = ''
+            if len(self.codeEndpointDeclarations) > 0:
+                endpointDeclarations = '\n'.join([ENDPOINT_HEADER_PRELUDE] + self.codeEndpointDeclarations)
+
+            # Generate Method Source File
+            outputs.append((self.methodSourcePath, self.templates.template(TEMPLATE_METHOD_SOURCE_FILE), {
+                TEMPLATE_HEADER_EXT: includeString,
+                TEMPLATE_METHOD_STUBS: stubs}, ''))
+
+            # Generate Method Header File
+            outputs.append((self.methodHeaderPath, self.templates.template(TEMPLATE_METHOD_HEADER_FILE), {
+                TEMPLATE_METHOD_FORWARDS: codeForwardDeclarations,
+                TEMPLATE_ENDPOINT_DECLARATIONS: endpointDeclarations,
+                TEMPLATE_FILENAME: self.methodHeaderPath.replace('.h', '').upper()}, ''))
+            trailer = ''
+        else:
+            # remove header placeholder
+            consoleValues[TEMPLATE_HEADER_EXT] = ''
+
+        if self.shardPaths:
+            outputs.extend(self.createShards(consoleValues, codeStrings, codeStringNames, codeNodes,
+                [] if self.externalize else self.codeMethodImplementations))
+            consoleValues[TEMPLATE_STRINGS] = codeHelp
+            trailer = ''
+        outputs.append((self.outputPath, self.templates.template(TEMPLATE_FILE), consoleValues, trailer))
+
+        if self.harness:
+            outputs.append(self.createHarness())
+        if image is not None:
+            outputs.append((self.imagePath, None, image, None))
+        if self.profile:
+            outputs.append((self.profilePath, None, profileMap, None))
+        if self.footprint:
+            outputs.append((self.footprintPath, None, json.dumps(footprint, indent=2).encode(), None))
+        return outputs
+
+def decodeStats(profileMap, text):
+    # The counters printed by the STATS command (lines 'STATS index hits calls ticks maxTicks', found
+    #   anywhere in text, e.g., a captured console log) with the command paths and method of each, as
+    #   mapped by profileMap (a loaded <output>.profile.json). Hottest first
+    if PROFILE_VERSION != profileMap.get('version'):
+        raise ValueError('ERROR: Unsupported profile map version {}'.format(profileMap.get('version')))
+    nodes = profileMap['nodes']
+    rows = []
+    for line in text.splitlines():
+        fields = line[line.find(PROFILE_LINE_PREFIX) + len(PROFILE_LINE_PREFIX):].split() \
+            if PROFILE_LINE_PREFIX in line else []
+        if 5 != len(fields) or not fields[0].isdigit():
+            # the header, or not a counter line
+            continue
+        index, hits, calls, ticks, maxTicks = [int(field) for field in fields]
+        if index >= len(nodes):
+            raise ValueError('ERROR: Counter {} is not in the profile map (is it from another console?)'.format(index))
+        rows.append({'index': index, 'hits': hits, 'calls': calls, 'ticks': ticks, 'maxTicks': maxTicks,
+            'method': nodes[index]['method'], 'paths': nodes[index]['paths']})
+    return sorted(rows, key=lambda row: (-row['hits'], row['index']))
+
+#############################################################
+# Batch generation                                          #
+
+# genConsole() options a batch job may set (see the arguments below)
+BATCH_OPTIONS = ('externalize', 'stream', 'reportMemory', 'incremental', 'dispatch', 'layout', 'harness',
+    'byteInput', 'helpBlocks', 'compressHelp', 'shards', 'profile', 'script', 'footprint', 'pointerSize', 'budgets')
+
+# The templates of the batch being run, handed to every worker process once
+batchTemplates = None
+
+def setBatchTemplates(templates):
+    global batchTemplates
+    batchTemplates = templates
+
+def loadBatch(path):
+    # A batch manifest is a JSON list of jobs: {"input": <XML spec>, "output": <C source>, "options": {...}}
+    #   with options named as in BATCH_OPTIONS. Paths are taken as they are, relative to where the batch runs
+    with open(path) as fin:
+        jobs = json.load(fin)
+    if not isinstance(jobs, list):
+        raise ValueError('ERROR: A batch manifest is a list of jobs: {}'.format(path))
+    for job in jobs:
+        if 'input' not in job or 'output' not in job:
+            raise ValueError('ERROR: Every batch job needs an input and an output: {}'.format(job))
+        unknown = set(job.get('options', {})) - set(BATCH_OPTIONS)
+        if unknown:
+            raise ValueError('ERROR: Unknown batch job options {} in {}'.format(sorted(unknown), job))
+    return jobs
+
+def runJob(job, write=True):
+    # Run one batch job with the worker's templates. Returns its output, time taken, console log and error
+    #   (None when it succeeded), and with write=False the sources it rendered
+    result = {'output': job['output'], 'error': None, 'sources': None}
+    log = io.StringIO()
+    started = time.perf_counter()
+    try:
+        with contextlib.redirect_stdout(log):
+            options = dict(job.get('options', {}))
+            generator = genConsole(job['input'], job['output'], options.pop('externalize', False),
+                templates=batchTemplates, **options)
+            if write:
+                generator.start()
             else:
-                # remove header placeholder
-                consoleFileData = consoleFileData.replace(TEMPLATE_HEADER_EXT, '')
+                result['sources'] = generator.render()
+    except Exception as error:
+        result['error'] = '{}: {}'.format(type(error).__name__, error)
+    result['seconds'] = time.perf_counter() - started
+    result['log'] = log.getvalue()
+    return result
+
+def renderJob(job):
+    return runJob(job, write=False)
+
+def runBatch(jobs, workers=None, templates=None, write=True):
+    # Run jobs (as read by loadBatch()) in a pool of workers (one per CPU by default), every one of them
+    #   sharing templates, read and compiled here once. Returns the result of every job (see runJob()),
+    #   in order
+    if templates is None:
+        templates = TemplateCache()
+    templates.load()
+    with multiprocessing.Pool(workers, initializer=setBatchTemplates, initargs=(templates,)) as pool:
+        return pool.map(runJob if write else renderJob, jobs, chunksize=1)
 
-                # insert parameter parsing placeholder
-                with open(TEMPLATE_PARSER_SOURCE_FILE) as ptf:
-                    parserCode = ptf.read()
-                    consoleFileData = consoleFileData.replace(TEMPLATE_PARSING_ROUTINES, parserCode)
+#############################################################
+# Watch mode                                                #
+
+# Seconds between looks at the spec and templates
+WATCH_INTERVAL = 0.2
+# The spec is split into its top level commands without parsing it: command tags are matched and
+#   counted, skipping comments and CDATA sections
+WATCH_TOKEN = re.compile(rb'<!--.*?-->|<!\[CDATA\[.*?\]\]>|<(/?)command(?=[\s/>])[^>]*?(/?)>', re.DOTALL)
+# Encoding declared by the XML declaration; the commands are only split out of UTF-8 specs
+WATCH_ENCODING = re.compile(rb'(?:\xef\xbb\xbf)?<\?xml[^>]*?\bencoding\s*=\s*["\']([^"\']*)')
+WATCH_ENCODINGS = ('utf-8', 'utf8', 'us-ascii', 'ascii')
+
+class ConsoleWatcher:
+    '''
+    Regenerates a console every time its XML description or a template
+    changes. The templates, every top level <command> (parsed), the
+    nodes built for it and the code of every method are kept from one
+    run to the next, so an edit costs parsing and walking the commands
+    whose text changed; the nodes of the others are renumbered in place
+    and the tables are rendered again. Outputs whose content didn't
+    change are not rewritten (as with --incremental).
+    '''
+    def __init__(self, inputPath, outputPath, externalize, interval=WATCH_INTERVAL, templates=None, **options):
+        self.inputPath = inputPath
+        self.outputPath = outputPath
+        self.externalize = externalize
+        self.interval = interval
+        self.templates = templates if templates is not None else TemplateCache()
+        self.options = dict(options, incremental=True)
+        self.options.pop('stream', None)
+        # {raw text: parsed element} of the top level commands in the spec
+        self.commands = {}
+        # The spec with every top level command collapsed to <command/>, when last found well formed
+        self.envelope = None
+        self.cache = GeneratorCache()
+        # (modification time, size) of the spec when it was last generated
+        self.specStamp = None
+
+    def splitCommands(self, data):
+        # The (start, end) of every top level <command>, in order, or None if the spec can't be split
+        #   that way: it isn't UTF-8, has a DOCTYPE (whose entities the commands may use), has no
+        #   commands or its command tags don't pair up
+        encoding = WATCH_ENCODING.match(data)
+        if encoding is not None and encoding.group(1).decode('latin-1').lower() not in WATCH_ENCODINGS:
+            return None
+        spans = []
+        depth = 0
+        start = 0
+        for match in WATCH_TOKEN.finditer(data):
+            close = match.group(1)
+            if close is None:
+                continue
+            if close:
+                depth -= 1
+                if 0 == depth:
+                    spans.append((start, match.end()))
+                elif depth < 0:
+                    return None
+            elif match.group(2):
+                if 0 == depth:
+                    spans.append(match.span())
+            else:
+                if 0 == depth:
+                    start = match.start()
+                depth += 1
+        if 0 != depth or not spans or b'<!DOCTYPE' in data[:spans[0][0]]:
+            return None
+        return spans
+
+    def checkEnvelope(self, data, spans):
+        # True if the spec is well formed around its commands, and they are all children of its root
+        ends = [0] + [end for _, end in spans]
+        starts = [start for start, _ in spans] + [len(data)]
+        envelope = b'<command/>'.join([data[end:start] for end, start in zip(ends, starts)])
+        if envelope != self.envelope:
+            try:
+                root = ET.fromstring(envelope)
+            except ET.ParseError:
+                return False
+            if len(root.findall('command')) != len(spans) or len(list(root.iter('command'))) != len(spans):
+                return False
+            self.envelope = envelope
+        return True
 
-                # Process collected function declarations locally
-                for declaration in self.codeMethodImplementations:
-                    consoleFileData += declaration + '\n'
+    def parseCommands(self, data):
+        # The top level commands of the spec, only those whose text changed parsed again.
+        #   Returns (commands, how many were parsed)
+        spans = self.splitCommands(data)
+        if spans is not None and self.checkEnvelope(data, spans):
+            chunks = [data[start:end] for start, end in spans]
+            commands = {}
+            parsed = 0
+            try:
+                for chunk in chunks:
+                    if chunk not in commands:
+                        command = self.commands.get(chunk)
+                        if command is None:
+                            command = ET.fromstring(chunk)
+                            parsed += 1
+                        commands[chunk] = command
+            except ET.ParseError:
+                chunks = None
+            if chunks is not None:
+                self.commands = commands
+                return [commands[chunk] for chunk in chunks], parsed
+        # e.g., another encoding, or entities the commands can't be parsed without - parse it all
+        self.commands = {}
+        self.envelope = None
+        elements = ET.fromstring(data).findall('command')
+        return elements, len(elements)
+
+    def generate(self):
+        # Regenerate the console now. Returns its generator
+        started = time.perf_counter()
+        # The cache keeps a large heap alive: garbage is collected between runs (see poll()) instead of
+        #   by full collections scanning it all in the middle of one
+        gc.disable()
+        try:
+            with open(self.inputPath, 'rb') as fin:
+                data = fin.read()
+            generator = genConsole(self.inputPath, self.outputPath, self.externalize, templates=self.templates,
+                cache=self.cache, **self.options)
+            with generator.phase('parse'):
+                commands, parsed = self.parseCommands(data)
+            outputs = generator.createOutputs(commands)
+            with generator.phase('write'):
+                generator.writeOutputs(outputs, generator.loadManifest(), generator.inputDigest())
+        finally:
+            gc.enable()
+        print('Regenerated {} in {:.1f} ms ({} of {} top level commands parsed)'.format(self.outputPath,
+            1000 * (time.perf_counter() - started), parsed, len(commands)))
+        return generator
+
+    def poll(self):
+        # Regenerate if the spec or a template changed since the last look. Returns True if it did
+        try:
+            stat = os.stat(self.inputPath)
+        except OSError:
+            return False
+        specStamp = (stat.st_mtime_ns, stat.st_size)
+        if not self.templates.refresh() and specStamp == self.specStamp:
+            return False
+        self.specStamp = specStamp
+        try:
+            self.generate()
+        finally:
+            gc.collect()
+        return True
 
-            print('Writing to file: {}'.format(self.outputPath))
-            with open(self.outputPath, 'w') as fout:
-                now = datetime.now()
-                consoleFileData = consoleFileData.replace('CODE_GENERATION_DATE', '{}'.format(now))
-                fout.write(consoleFileData)
+    def run(self):
+        # Poll until interrupted. A failed run is reported, and retried once something changes again
+        print('Watching {} (Ctrl-C to stop)'.format(self.inputPath))
+        try:
+            while True:
+                try:
+                    self.poll()
+                except Exception as error:
+                    # e.g., a bad edit: reported, and the last output kept until the next one
+                    print('{}: {}'.format(type(error).__name__, error))
+                time.sleep(self.interval)
+        except KeyboardInterrupt:
+            pass
 
 if (__name__ == '__main__' ):
     parser = argparse.ArgumentParser(description='Console Builder')
@@ -583,10 +2711,141 @@ if (__name__ == '__main__' ):
         const=True, default=False, dest='externalize',
         help='<Optional flag> Externalize Methods to a separate source file')
 
+    parser.add_argument('--stream', type=str2bool, nargs='?',
+        const=True, default=False, dest='stream',
+        help='<Optional flag> Stream the XML file (iterparse) instead of loading it whole')
+
+    parser.add_argument('--mem', type=str2bool, nargs='?',
+        const=True, default=False, dest='reportMemory',
+        help='<Optional flag> Report peak memory used while ingesting the XML file')
+
+    parser.add_argument('--incremental', type=str2bool, nargs='?',
+        const=True, default=False, dest='incremental',
+        help='<Optional flag> Only rewrite outputs whose content changed (tracked in a manifest file)')
+
+    parser.add_argument('--dispatch', action='store', dest='dispatch',
+        choices=DISPATCH_STRATEGIES, default=DISPATCH_LINEAR,
+        help='Child lookup used by the generated console (binary sorts every children array, '
+             'hash emits a collision-free hash table per node)')
+
+    parser.add_argument('--layout', action='store', dest='layout',
+        choices=LAYOUTS, default=LAYOUT_POINTER,
+        help='Node table layout (compact pools strings and nodes behind uint16_t offsets, '
+             'image moves them into <output>.bin, loaded at run time)')
+
+    parser.add_argument('--harness', type=str2bool, nargs='?',
+        const=True, default=False, dest='harness',
+        help='<Optional flag> Also write <output>Harness.c, a test driving many interleaved console sessions')
+
+    parser.add_argument('--feed', type=str2bool, nargs='?',
+        const=True, default=False, dest='byteInput',
+        help='<Optional flag> Add non-blocking, byte-at-a-time input (consoleFeedByte()/consoleService())')
+
+    parser.add_argument('--help-blocks', type=str2bool, nargs='?',
+        const=True, default=False, dest='helpBlocks',
+        help='<Optional flag> Render every help block at generation time, printed with a single write')
+
+    parser.add_argument('--compress-help', type=str2bool, nargs='?',
+        const=True, default=False, dest='compressHelp',
+        help='<Optional flag> Store the help blocks (and with them all descriptions) byte pair encoded')
+
+    parser.add_argument('--check-image', action='store', dest='checkImage', default=None,
+        help='Validate a command table image (as written with --layout image) instead of generating')
+
+    parser.add_argument('--shards', action='store', type=int, dest='shards', default=1,
+        help='Split the command tables, argument parsers and method stubs across this many source files, '
+             'declared in a shared header, so they compile in parallel (pointer layout only)')
+
+    parser.add_argument('--profile', type=str2bool, nargs='?',
+        const=True, default=False, dest='profile',
+        help='<Optional flag> Count command use and time methods, printed by a built-in STATS command '
+             '(mapped back to commands by <output>.profile.json)')
+
+    parser.add_argument('--script', type=str2bool, nargs='?',
+        const=True, default=False, dest='script',
+        help='<Optional flag> Add consoleRunScript()/consoleRunScriptFile(), running many commands per line '
+             'without prompt or help, each answered by a status line (the example main() runs a script)')
+
+    parser.add_argument('--footprint', type=str2bool, nargs='?',
+        const=True, default=False, dest='footprint',
+        help='<Optional flag> Write <output>.footprint.json, the bytes the console takes per section, '
+             'kind of data and top level command')
+
+    parser.add_argument('--pointer-size', action='store', type=int, dest='pointerSize',
+        choices=POINTER_SIZES, default=POINTER_SIZE,
+        help='Pointer width of the target in bytes, for the footprint (default: 4)')
+
+    parser.add_argument('--budget', action='append', type=parseBudget, dest='budgets', default=[],
+        help='NAME=BYTES: fail, before writing anything, if the footprint of NAME (a section such as rodata, '
+             'flash, or a kind of data such as nodes) exceeds BYTES. Repeat for several budgets')
+
+    parser.add_argument('--decode-stats', action='store', dest='decodeStats', default=None,
+        help='Map the STATS output read from stdin back to commands, with this <output>.profile.json')
+
+    parser.add_argument('--batch', action='store', dest='batch', default=None,
+        help='Run every job of a JSON batch manifest (a list of {"input", "output", "options"}) '
+             'in a process pool instead of generating one console')
+
+    parser.add_argument('--jobs', action='store', type=int, dest='jobs', default=None,
+        help='Worker processes of a --batch run (default: one per CPU)')
+
+    parser.add_argument('--watch', type=str2bool, nargs='?',
+        const=True, default=False, dest='watch',
+        help='<Optional flag> Keep running, regenerating the console whenever the XML file or a template changes')
+
+    parser.add_argument('--interval', action='store', type=float, dest='interval', default=WATCH_INTERVAL,
+        help='Seconds between looks for changes with --watch (default: {})'.format(WATCH_INTERVAL))
+
     arguments = parser.parse_args()
 
+    if arguments.checkImage is not None:
+        with open(arguments.checkImage, 'rb') as fin:
+            fields = checkImage(fin.read())
+        print('Image OK: {} bytes, {} nodes ({} roots), {} methods, binding 0x{:08X}'.format(fields['size'],
+            fields['nodes'], fields['roots'], fields['methods'], fields['binding']))
+        sys.exit(0)
+
+    if arguments.decodeStats is not None:
+        with open(arguments.decodeStats) as fin:
+            rows = decodeStats(json.load(fin), sys.stdin.read())
+        print('{:>10} {:>10} {:>14} {:>10}  {}'.format('hits', 'calls', 'ticks', 'max', 'command (method)'))
+        for row in rows:
+            print('{:>10} {:>10} {:>14} {:>10}  {}{}'.format(row['hits'], row['calls'], row['ticks'], row['maxTicks'],
+                ', '.join(row['paths']), '' if row['method'] is None else ' ({})'.format(row['method'])))
+        sys.exit(0)
+
+    if arguments.batch is not None:
+        jobs = loadBatch(arguments.batch)
+        started = time.perf_counter()
+        results = runBatch(jobs, arguments.jobs)
+        elapsed = time.perf_counter() - started
+        for result in results:
+            sys.stdout.write(result['log'])
+        print('Batch: {} jobs in {:.2f}s ({:.2f}s of generation)'.format(len(results), elapsed,
+            sum([result['seconds'] for result in results])))
+        for result in results:
+            print('  {:8.3f}s  {}{}'.format(result['seconds'], result['output'],
+                '' if result['error'] is None else '  FAILED: ' + result['error']))
+        sys.exit(1 if any([result['error'] is not None for result in results]) else 0)
+
+    if arguments.watch:
+        ConsoleWatcher(arguments.inputConfig, arguments.outputFile, arguments.externalize, arguments.interval,
+            reportMemory=arguments.reportMemory, dispatch=arguments.dispatch, layout=arguments.layout,
+            harness=arguments.harness, byteInput=arguments.byteInput, helpBlocks=arguments.helpBlocks,
+            compressHelp=arguments.compressHelp, shards=arguments.shards, profile=arguments.profile,
+            script=arguments.script, footprint=arguments.footprint, pointerSize=arguments.pointerSize,
+            budgets=dict(arguments.budgets)).run()
+        sys.exit(0)
+
     print('Starting...')
-    foo = genConsole(arguments.inputConfig, arguments.outputFile, arguments.externalize)
-    foo.start()
+    foo = genConsole(arguments.inputConfig, arguments.outputFile, arguments.externalize,
+        arguments.stream, arguments.reportMemory, arguments.incremental, arguments.dispatch, arguments.layout,
+        arguments.harness, arguments.byteInput, arguments.helpBlocks, arguments.compressHelp, arguments.shards,
+        arguments.profile, arguments.script, arguments.footprint, arguments.pointerSize, dict(arguments.budgets))
+    try:
+        foo.start()
+    except ValueError as error:
+        # a spec (or option) the generator rejects: report it, not a traceback
+        sys.exit(str(error))
     print('Done')
 